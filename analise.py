@@ -0,0 +1,179 @@
+"""
+Análise das contas pagas.
+
+O histórico de pagamentos é resumido em um cubo: uma célula por (mês do
+pagamento, categoria, origem) com a quantidade, o total pago e o atraso
+(dias entre vencimento e pagamento). A categoria é a descrição sem o sufixo
+de frequência das contas geradas ("Aluguel (mensal)" vira "Aluguel") e a
+origem é "Recorrente" ou "Manual".
+
+As medidas são todas somas, então o cubo é atualizado a cada nova versão do
+histórico só com as linhas inseridas, alteradas ou excluídas (achadas pelo
+hash de cada linha): as novas são somadas às células e as antigas,
+subtraídas. As consultas da tela leem o cubo, sem varrer o histórico. Os
+anos arquivados têm o seu próprio cubo, somado ao do histórico por combinar().
+"""
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+import instrumentacao
+from recorrencia import MESES_POR_FREQUENCIA
+
+# Colunas do histórico que entram no cubo (uma mudança nelas muda a linha)
+COLUNAS = ["Descrição", "Valor", "Data de Pagamento", "Data de Vencimento", "Origem", "Recorrente"]
+
+DIMENSOES = ["Mês", "Categoria", "Origem"]
+MEDIDAS = ["Quantidade", "Total", "Com datas", "Dias de atraso", "Atrasadas"]
+
+# Sufixo das descrições geradas pelos modelos recorrentes: ' (mensal)'
+_SUFIXO = re.compile(r"\s*\((?:%s)\)\s*$" % "|".join(f.lower() for f in MESES_POR_FREQUENCIA), re.I)
+
+_cubos = {}
+_cubos_lock = threading.Lock()
+
+
+def categorias(descricoes):
+    """Descrições sem o sufixo de frequência (calculado uma vez por descrição distinta)."""
+    codigos, distintas = pd.factorize(descricoes)
+    limpas = np.array([_SUFIXO.sub("", str(d)).strip() for d in distintas] + [""], dtype=object)
+    return pd.Series(limpas[codigos], index=descricoes.index)
+
+
+def fatos(historico):
+    """
+    Uma linha por conta paga com as dimensões e as medidas do cubo.
+
+    Returns:
+        DataFrame indexado pelo id da conta, com DIMENSOES e MEDIDAS
+    """
+    pagamento = pd.to_datetime(historico["Data de Pagamento"], errors="coerce")
+    vencimento = pd.to_datetime(historico["Data de Vencimento"], errors="coerce")
+    atraso = (pagamento.dt.normalize() - vencimento.dt.normalize()).dt.days
+    recorrente = historico["Origem"].eq("Recorrente") | historico["Recorrente"].notna()
+
+    return pd.DataFrame({
+        "Mês": pagamento.to_numpy().astype("datetime64[M]").astype("datetime64[ns]"),
+        "Categoria": categorias(historico["Descrição"]),
+        "Origem": np.where(recorrente, "Recorrente", "Manual"),
+        "Quantidade": 1,
+        "Total": pd.to_numeric(historico["Valor"], errors="coerce").fillna(0.0),
+        "Com datas": atraso.notna().astype(int),
+        "Dias de atraso": atraso.fillna(0),
+        "Atrasadas": atraso.gt(0).astype(int),
+    }, index=historico.index)
+
+
+def _hashes(historico):
+    return pd.util.hash_pandas_object(historico[COLUNAS], index=False)
+
+
+def _agregar(linhas):
+    return linhas.groupby(DIMENSOES, dropna=False)[MEDIDAS].sum()
+
+
+class CuboPagamentos:
+    """Cubo do histórico de pagamentos, atualizado por diferença entre versões."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versao = object()
+        self._fatos = fatos(pd.DataFrame(columns=COLUNAS))
+        self._hashes = pd.Series(dtype="uint64")
+        self.celulas = _agregar(self._fatos)
+
+    def sincronizar(self, versao, historico):
+        """Atualiza o cubo se a versão do histórico mudou."""
+        with self._lock:
+            if versao == self._versao:
+                return
+            if callable(historico):
+                historico = historico()
+            with instrumentacao.medir("agregar", "Cubo de pagamentos"):
+                self._atualizar(historico)
+            self._versao = versao
+
+    def _atualizar(self, historico):
+        hashes = _hashes(historico)
+        comuns = self._hashes.index.intersection(hashes.index)
+        alteradas = comuns[self._hashes.loc[comuns].to_numpy() != hashes.loc[comuns].to_numpy()]
+        ids_saem = self._hashes.index.difference(hashes.index).append(alteradas)
+        ids_entram = hashes.index.difference(self._hashes.index).append(alteradas)
+        instrumentacao.contar("linhas agregadas no cubo", len(ids_saem) + len(ids_entram))
+
+        if len(ids_saem) or len(ids_entram):
+            saem = self._fatos.loc[ids_saem]
+            entram = fatos(historico.loc[ids_entram])
+            celulas = self.celulas.add(_agregar(entram), fill_value=0).sub(_agregar(saem), fill_value=0)
+            # Células sem nenhuma conta (todas excluídas) saem do cubo
+            self.celulas = celulas[celulas["Quantidade"] > 0].sort_index()
+            self._fatos = pd.concat([self._fatos.drop(ids_saem), entram])
+        self._hashes = hashes
+
+    def consultar(self, por, inicio=None, fim=None, origem=None):
+        """
+        Medidas do cubo agrupadas por uma ou mais dimensões.
+
+        Args:
+            por: dimensão ou lista de dimensões ('Mês', 'Categoria', 'Origem')
+            inicio, fim: primeiro e último mês (inclusive) a considerar
+            origem: 'Recorrente' ou 'Manual' (padrão: as duas)
+
+        Returns:
+            DataFrame com as medidas e 'Atraso médio' (dias; negativo quando
+            as contas foram pagas antes do vencimento)
+        """
+        with self._lock:
+            celulas = self.celulas.reset_index()
+
+        filtro = pd.Series(True, index=celulas.index)
+        if inicio is not None:
+            filtro &= celulas["Mês"] >= pd.Timestamp(inicio).to_period("M").to_timestamp()
+        if fim is not None:
+            filtro &= celulas["Mês"] <= pd.Timestamp(fim).to_period("M").to_timestamp()
+        if origem is not None:
+            filtro &= celulas["Origem"] == origem
+
+        resultado = celulas[filtro].groupby(por)[MEDIDAS].sum()
+        resultado["Atraso médio"] = resultado["Dias de atraso"] / resultado["Com datas"].replace(0, np.nan)
+        return resultado
+
+    def meses(self):
+        """Meses com pagamentos, em ordem."""
+        with self._lock:
+            meses = self.celulas.index.get_level_values("Mês")
+        return sorted(meses.dropna().unique())
+
+
+def cubo_pagamentos(chave, versao, historico):
+    """
+    Cubo do histórico do repositório, atualizado com a versão informada.
+
+    Args:
+        chave: identificação do repositório
+        versao: versão da tabela de histórico
+        historico: DataFrame do histórico de pagamentos, ou função que o
+            devolve (chamada só se a versão mudou)
+    """
+    with _cubos_lock:
+        cubo = _cubos.setdefault(chave, CuboPagamentos())
+    cubo.sincronizar(versao, historico)
+    return cubo
+
+
+def descartar(chave):
+    """Esquece os cubos do repositório (os de chave igual ou de tupla começando por ela)."""
+    with _cubos_lock:
+        for item in [item for item in _cubos if item == chave or (isinstance(item, tuple) and item[0] == chave)]:
+            del _cubos[item]
+
+
+def combinar(cubos):
+    """Cubo só para consulta com a soma das células de vários cubos (ex.: o histórico e os anos arquivados)."""
+    combinado = CuboPagamentos()
+    celulas = [cubo.celulas for cubo in cubos]
+    if celulas:
+        combinado.celulas = pd.concat(celulas).groupby(level=DIMENSOES, dropna=False).sum().sort_index()
+    return combinado
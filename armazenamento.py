@@ -0,0 +1,1341 @@
+"""
+Camada de armazenamento do dashboard de contas.
+
+Todas as abas leem e gravam as tabelas (contas, histórico, recorrentes e
+serviços Cofap) através de um repositório. Existem dois backends:
+
+- RepositorioSQLite: banco SQLite em modo WAL, com índices por vencimento,
+  status e descrição. Pagar, editar ou excluir uma conta grava só a linha
+  afetada. É o backend padrão.
+- RepositorioCSV: os arquivos CSV originais, mantidos como formato de
+  intercâmbio editável à mão (CONTAS_ARMAZENAMENTO=csv). Cada CSV lido
+  ganha um snapshot Arrow já tipado ao lado, usado nas próximas leituras
+  enquanto o CSV não mudar.
+
+As tabelas lidas ficam em cache no processo e só são lidas de novo quando a
+sua versão muda, seja por uma escrita do próprio app ou por alteração externa.
+
+O histórico de pagamentos pode ser arquivado por ano de pagamento: os anos
+selados saem da tabela (que é lida a cada versão) e vão para um CSV por ano
+na pasta 'arquivo', lido só quando a tela pede anos antigos. As contas
+pendentes não são arquivadas, já que todas entram nos totais da dívida.
+
+Uso como script para importar os CSVs existentes para o banco e para
+arquivar os anos anteriores ao atual:
+
+    python armazenamento.py importar
+    python armazenamento.py arquivar [--ate-ano 2024]
+"""
+import argparse
+import contextlib
+import datetime
+import functools
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import instrumentacao
+from cofap import LivroCofap
+
+try:
+    import fcntl
+except ImportError:  # Windows: só a trava entre threads do processo
+    fcntl = None
+
+# Caminhos dos arquivos
+CSV_FILE = "contas_a_pagar.csv"
+HISTORICO_FILE = "historico_pagamentos.csv"
+RECORRENTES_FILE = "contas_recorrentes.csv"
+SERVICOS_FILE = "servicos_cofap.csv"
+BANCO_FILE = "contas.db"
+JOURNAL_FILE = ".contas_journal.json"
+TRAVA_FILE = ".contas.lock"
+HISTORICO_LOG_FILE = "historico_pagamentos.jsonl"
+
+# Tabelas com log de eventos só de acréscimo (backend CSV): novas linhas são
+# anexadas ao log e o CSV é reescrito apenas na compactação
+LOGS = {
+    "historico": HISTORICO_LOG_FILE,
+}
+
+# Tamanho do log a partir do qual ele é compactado no CSV
+COMPACTAR_LOG_BYTES = 256 * 1024
+
+# Snapshot de cada CSV (arquivo Arrow IPC oculto ao lado do CSV) e a chave,
+# nos metadados do snapshot, da assinatura do CSV de onde ele foi gerado
+SNAPSHOT_PREFIXO = "."
+SNAPSHOT_SUFIXO = ".arrow"
+SNAPSHOT_METADADO = b"contas.assinatura_csv"
+
+# Pasta dos anos arquivados, ao lado dos dados, e a coluna de data que define
+# o ano de cada linha das tabelas que podem ser arquivadas
+ARQUIVO_DIR = "arquivo"
+PARTICOES = {
+    "historico": "Data de Pagamento",
+}
+
+# Idade mínima para um arquivo temporário ser considerado órfão
+TEMPORARIO_ORFAO_SEGUNDOS = 3600
+
+ARQUIVOS = {
+    "contas": CSV_FILE,
+    "historico": HISTORICO_FILE,
+    "recorrentes": RECORRENTES_FILE,
+    "servicos": SERVICOS_FILE,
+}
+
+# Colunas de cada tabela: (nome no DataFrame, nome no banco, tipo lógico)
+# Tipos lógicos: TEXTO, REAL, INTEIRO, DATA e BOOL
+ESQUEMAS = {
+    "contas": [
+        ("Descrição", "descricao", "TEXTO"),
+        ("Valor", "valor", "REAL"),
+        ("Data de Vencimento", "data_vencimento", "DATA"),
+        ("Status", "status", "TEXTO"),
+        ("Data de Pagamento", "data_pagamento", "DATA"),
+        ("Origem", "origem", "TEXTO"),
+        ("Recorrente", "recorrente", "INTEIRO"),
+    ],
+    "historico": [
+        ("Descrição", "descricao", "TEXTO"),
+        ("Valor", "valor", "REAL"),
+        ("Data de Pagamento", "data_pagamento", "DATA"),
+        ("Data de Vencimento", "data_vencimento", "DATA"),
+        ("Status", "status", "TEXTO"),
+        ("Origem", "origem", "TEXTO"),
+        ("Recorrente", "recorrente", "INTEIRO"),
+    ],
+    "recorrentes": [
+        ("Descrição", "descricao", "TEXTO"),
+        ("Valor", "valor", "REAL"),
+        ("Próximo Vencimento", "proximo_vencimento", "DATA"),
+        ("Frequência", "frequencia", "TEXTO"),
+        ("Dia Vencimento", "dia_vencimento", "INTEIRO"),
+        ("Última Geração", "ultima_geracao", "DATA"),
+        ("Ativa", "ativa", "BOOL"),
+    ],
+    "servicos": [
+        ("Funcionario", "funcionario", "TEXTO"),
+        ("Equipamento", "equipamento", "TEXTO"),
+        ("Dia", "dia", "DATA"),
+        ("Valor diaria", "valor_diaria", "REAL"),
+        ("Pedidos de compra", "pedidos_compra", "TEXTO"),
+        ("Situação", "situacao", "REAL"),
+    ],
+}
+
+# Colunas indexadas no banco
+INDICES = {
+    "contas": ["data_vencimento", "status", "descricao"],
+    "historico": ["data_vencimento", "status", "descricao"],
+    "recorrentes": ["proximo_vencimento"],
+    "servicos": ["dia"],
+}
+
+# Valores padrão para colunas ausentes em arquivos antigos
+PADROES = {
+    ("contas", "Status"): "Pendente",
+}
+
+TIPOS_SQL = {"TEXTO": "TEXT", "REAL": "REAL", "INTEIRO": "INTEGER", "DATA": "TEXT", "BOOL": "INTEGER"}
+
+
+def colunas(tabela):
+    """Retorna a lista de colunas (nomes do DataFrame) de uma tabela."""
+    return [coluna for coluna, _, _ in ESQUEMAS[tabela]]
+
+
+def tipar(tabela, df):
+    """
+    Converte um DataFrame lido do disco para os tipos esperados pelo app.
+
+    Colunas ausentes são criadas com o valor padrão (ou vazias), datas viram
+    datetime64 e 'Ativa' vira booleano. Colunas extras são mantidas no final.
+    """
+    df = df.copy()
+    for coluna, _, tipo in ESQUEMAS[tabela]:
+        if coluna not in df.columns:
+            df[coluna] = PADROES.get((tabela, coluna), None)
+
+        if tipo == "DATA":
+            df[coluna] = pd.to_datetime(df[coluna], errors="coerce")
+        elif tipo in ("REAL", "INTEIRO"):
+            df[coluna] = pd.to_numeric(df[coluna], errors="coerce")
+        elif tipo == "BOOL":
+            df[coluna] = df[coluna].astype(str).str.strip().str.lower().isin(["true", "1", "1.0"])
+
+    extras = [c for c in df.columns if c not in colunas(tabela)]
+    return df[colunas(tabela) + extras]
+
+
+def marcar_pagas(contas, data_pagamento):
+    """Retorna uma cópia das contas informadas com status 'Paga' e a data de pagamento."""
+    pagas = contas.copy()
+    pagas["Status"] = "Paga"
+    pagas["Data de Pagamento"] = pd.Timestamp(data_pagamento)
+    return pagas
+
+
+def sem_duplicatas(novas, existentes):
+    """
+    Remove das contas geradas as que já existem (pendentes ou pagas).
+
+    Uma ocorrência já existe quando há uma conta do mesmo modelo recorrente
+    com o mesmo vencimento. Contas geradas antes da coluna 'Recorrente'
+    existir são reconhecidas pela descrição e vencimento.
+    """
+    if novas.empty or existentes.empty:
+        return novas
+
+    datas_existentes = pd.to_datetime(existentes["Data de Vencimento"], errors="coerce").dt.normalize()
+    datas_novas = pd.to_datetime(novas["Data de Vencimento"]).dt.normalize()
+
+    por_modelo = pd.MultiIndex.from_arrays([pd.to_numeric(existentes["Recorrente"]).astype(float), datas_existentes])
+    por_descricao = pd.MultiIndex.from_arrays([existentes["Descrição"], datas_existentes])
+
+    ja_existe = (
+        pd.MultiIndex.from_arrays([pd.to_numeric(novas["Recorrente"]).astype(float), datas_novas]).isin(por_modelo)
+        | pd.MultiIndex.from_arrays([novas["Descrição"], datas_novas]).isin(por_descricao)
+    )
+    return novas[~ja_existe]
+
+
+def _valor_sql(valor, tipo):
+    """Converte um valor do DataFrame para o tipo aceito pelo sqlite3."""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    if tipo == "DATA":
+        return pd.Timestamp(valor).strftime("%Y-%m-%d")
+    if tipo == "BOOL":
+        return int(bool(valor))
+    if tipo == "REAL":
+        return float(valor)
+    if tipo == "INTEIRO":
+        return int(valor)
+    # Texto vazio é gravado como nulo, igual ao que acontece no CSV
+    return str(valor) or None
+
+
+class ConflitoDeEdicao(Exception):
+    """A linha foi alterada ou excluída por outra sessão desde que foi lida."""
+
+
+def _normalizar(tabela, linha):
+    """Valores de uma linha (Series ou dict) no formato do banco, para comparação."""
+    return {coluna: _valor_sql(linha.get(coluna), tipo) for coluna, _, tipo in ESQUEMAS[tabela]}
+
+
+def _linhas_iguais(tabela, df, linha):
+    """Máscara das linhas do DataFrame com o mesmo conteúdo da linha informada."""
+    esperado = _normalizar(tabela, linha)
+    mascara = pd.Series(True, index=df.index)
+    for coluna, _, tipo in ESQUEMAS[tabela]:
+        valor = esperado[coluna]
+        atual = df[coluna]
+        if valor is None:
+            mascara &= atual.isna()
+        elif tipo == "DATA":
+            mascara &= atual.dt.normalize() == pd.Timestamp(valor)
+        elif tipo == "BOOL":
+            mascara &= atual.astype(bool) == bool(valor)
+        else:
+            mascara &= atual == valor
+    return mascara
+
+
+def verificar_edicao(tabela, atual, original, valores):
+    """
+    Controle otimista de concorrência de uma edição.
+
+    Só há conflito se outra sessão alterou um dos campos que esta sessão
+    também quer alterar (para um valor diferente). Alterações em campos
+    diferentes são mescladas.
+
+    Args:
+        atual: linha como está gravada agora (None se foi excluída)
+        original: linha como a sessão a leu
+        valores: {coluna: novo valor}
+    """
+    if atual is None:
+        raise ConflitoDeEdicao("O registro foi excluído por outra sessão.")
+
+    atual = _normalizar(tabela, atual)
+    original = _normalizar(tabela, original)
+    novos = _normalizar(tabela, valores)
+    conflitos = [
+        coluna for coluna in valores
+        if atual[coluna] != original[coluna] and atual[coluna] != novos[coluna]
+    ]
+    if conflitos:
+        raise ConflitoDeEdicao(
+            f"Outra sessão alterou {', '.join(conflitos)} deste registro. Recarregue e tente de novo."
+        )
+
+
+def verificar_inalterada(tabela, atual, original):
+    """Lança ConflitoDeEdicao se a linha foi excluída ou alterada desde que foi lida."""
+    if atual is None:
+        raise ConflitoDeEdicao("O registro foi excluído por outra sessão.")
+    if _normalizar(tabela, atual) != _normalizar(tabela, original):
+        raise ConflitoDeEdicao("O registro foi alterado por outra sessão. Recarregue e tente de novo.")
+
+
+# Cache de DataFrames já tipados, compartilhado por todas as sessões do processo.
+# Cada entrada guarda a versão da tabela no momento da leitura; se a versão
+# mudar (arquivo alterado fora do app) a tabela é lida de novo.
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _ler_com_cache(chave, versao, ler):
+    """Retorna uma cópia da tabela em cache, relendo-a se a versão mudou."""
+    with _cache_lock:
+        item = _cache.get(chave)
+
+    if item is None or item[0] != versao:
+        with instrumentacao.medir("carregar", f"Ler {os.path.basename(chave[-1])}"):
+            item = (versao, ler())
+        instrumentacao.contar("linhas lidas", len(item[1]))
+        with _cache_lock:
+            _cache[chave] = item
+    else:
+        instrumentacao.contar("leituras do cache")
+
+    # Cópia para que alterações feitas pelas abas não contaminem o cache
+    return item[1].copy()
+
+
+def _invalidar(chave):
+    with _cache_lock:
+        _cache.pop(chave, None)
+
+
+def limpar_cache():
+    """Descarta todas as tabelas em cache do processo."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _sincronizar_diretorio(diretorio):
+    """Garante que renomeações no diretório chegaram ao disco (sem efeito no Windows)."""
+    if os.name != "posix":
+        return
+    fd = os.open(diretorio or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _escrever_temporario(caminho, escrever):
+    """
+    Escreve um arquivo temporário ao lado de 'caminho' e força a gravação em disco.
+
+    Args:
+        caminho: arquivo final
+        escrever: função que recebe o arquivo aberto e grava o conteúdo
+
+    Returns:
+        Caminho do arquivo temporário
+    """
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporario, "w", encoding="utf-8", newline="") as arquivo:
+        escrever(arquivo)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    return temporario
+
+
+def _assinatura(caminho):
+    """Data de modificação e tamanho de um arquivo (None se não existir)."""
+    try:
+        info = os.stat(caminho)
+    except FileNotFoundError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+
+def _vazios_como_nan(df):
+    """Vazios das colunas de texto como NaN (o Arrow devolve None), para o snapshot e o CSV lerem igual."""
+    for coluna in df.columns[df.dtypes == object]:
+        vazios = df[coluna].isna().to_numpy()
+        if vazios.any():
+            valores = df[coluna].to_numpy(dtype=object, copy=True)
+            valores[vazios] = np.nan
+            df[coluna] = valores
+    return df
+
+
+@functools.lru_cache(maxsize=None)
+def _pyarrow():
+    """Módulo pyarrow, importado só no primeiro uso de um snapshot (None se não estiver instalado)."""
+    try:
+        import pyarrow
+        import pyarrow.feather
+    except ImportError:  # sem pyarrow: os CSVs são sempre lidos e convertidos
+        return None
+    return pyarrow
+
+
+def _ler_snapshot(caminho, assinatura):
+    """DataFrame do snapshot, se ele foi gerado a partir do CSV com esta assinatura (senão None)."""
+    if assinatura is None or not os.path.exists(caminho):
+        return None
+    pyarrow = _pyarrow()
+    if pyarrow is None:
+        return None
+    try:
+        # Mapeado em memória: só as colunas são convertidas, sem interpretar texto
+        tabela = pyarrow.feather.read_table(caminho, memory_map=True)
+    except (OSError, pyarrow.ArrowException):
+        return None
+    if (tabela.schema.metadata or {}).get(SNAPSHOT_METADADO) != json.dumps(assinatura).encode():
+        return None
+    return _vazios_como_nan(tabela.to_pandas())
+
+
+def _gravar_snapshot(caminho, df, assinatura):
+    """Grava o snapshot do CSV (sem pyarrow não faz nada; falhas são ignoradas, é só um atalho)."""
+    pyarrow = _pyarrow()
+    if pyarrow is None:
+        return
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        tabela = pyarrow.Table.from_pandas(df)
+        tabela = tabela.replace_schema_metadata(
+            {**(tabela.schema.metadata or {}), SNAPSHOT_METADADO: json.dumps(assinatura).encode()}
+        )
+        pyarrow.feather.write_feather(tabela, temporario, compression="uncompressed")
+        os.replace(temporario, caminho)
+    except (OSError, pyarrow.ArrowException):
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def _anexar_linhas(caminho, linhas):
+    """Anexa linhas a um arquivo e força a gravação em disco."""
+    with open(caminho, "a+b") as arquivo:
+        # Uma linha cortada por uma queda não pode grudar na próxima
+        if arquivo.tell() > 0:
+            arquivo.seek(-1, os.SEEK_END)
+            if arquivo.read(1) != b"\n":
+                arquivo.write(b"\n")
+        conteudo = "".join(linha + "\n" for linha in linhas).encode("utf-8")
+        arquivo.write(conteudo)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    instrumentacao.contar("bytes anexados aos logs", len(conteudo))
+
+
+def eventos_log(tabela, linhas):
+    """Converte linhas de um DataFrame em eventos JSON (um por linha) para o log."""
+    linhas = tipar(tabela, linhas)
+    eventos = []
+    for registro in linhas[colunas(tabela)].itertuples(index=False, name=None):
+        dados = {coluna: _valor_sql(valor, tipo) for valor, (coluna, _, tipo) in zip(registro, ESQUEMAS[tabela])}
+        eventos.append(json.dumps({"evento": uuid.uuid4().hex, "linha": dados}, ensure_ascii=False))
+    return eventos
+
+
+def _ler_csv(tabela, caminho, caminho_snapshot):
+    """Conteúdo tipado de um CSV, do snapshot quando ele está em dia."""
+    assinatura = _assinatura(caminho)
+    df = _ler_snapshot(caminho_snapshot, assinatura)
+    if df is not None:
+        return df
+
+    if assinatura is None:
+        return tipar(tabela, pd.DataFrame())
+
+    # Colunas de texto são lidas como texto (ex.: número do pedido de compra)
+    textos = {coluna: str for coluna, _, tipo in ESQUEMAS[tabela] if tipo == "TEXTO"}
+    df = _vazios_como_nan(tipar(tabela, pd.read_csv(caminho, dtype=textos)))
+
+    # Só vale como snapshot se o CSV não mudou durante a leitura
+    if _assinatura(caminho) == assinatura:
+        _gravar_snapshot(caminho_snapshot, df, assinatura)
+    return df
+
+
+def anos_da_particao(tabela, df):
+    """Ano de cada linha pela coluna de PARTICOES (NaN sem data)."""
+    return pd.to_datetime(df[PARTICOES[tabela]], errors="coerce").dt.year
+
+
+class ArquivoAnual:
+    """
+    Anos antigos de uma tabela, selados em um CSV por ano na pasta ARQUIVO_DIR.
+
+    Os anos só são lidos quando pedidos (cada um com o seu snapshot Arrow e o
+    mesmo cache das tabelas) e só mudam pelo arquivamento. O ano novo é
+    escrito em um temporário e só vai para o lugar na mesma confirmação que
+    tira as linhas da tabela (o journal no CSV, a transação no SQLite), então
+    uma linha nunca fica nos dois lugares nem em nenhum.
+    """
+
+    def __init__(self, diretorio="."):
+        self.diretorio = os.path.join(diretorio, ARQUIVO_DIR)
+
+    def caminho(self, tabela, ano):
+        nome, extensao = os.path.splitext(ARQUIVOS[tabela])
+        return os.path.join(self.diretorio, f"{nome}_{ano}{extensao}")
+
+    def caminho_snapshot(self, tabela, ano):
+        return os.path.join(
+            self.diretorio, SNAPSHOT_PREFIXO + os.path.basename(self.caminho(tabela, ano)) + SNAPSHOT_SUFIXO
+        )
+
+    def anos(self, tabela):
+        """Anos selados da tabela, em ordem."""
+        if tabela not in PARTICOES:
+            return []
+        nome, extensao = os.path.splitext(ARQUIVOS[tabela])
+        padrao = os.path.join(glob.escape(self.diretorio), glob.escape(nome) + "_[0-9][0-9][0-9][0-9]" + extensao)
+        return sorted(int(os.path.basename(caminho)[len(nome) + 1:len(nome) + 5]) for caminho in glob.glob(padrao))
+
+    def versao(self, tabela, anos=None):
+        """Versão dos anos informados (padrão: todos): o ano e a assinatura do CSV de cada um."""
+        anos = self.anos(tabela) if anos is None else anos
+        return tuple((ano, _assinatura(self.caminho(tabela, ano))) for ano in anos)
+
+    def carregar(self, tabela, anos=None):
+        """Linhas dos anos informados (padrão: todos), na ordem dos anos. O id é a posição no resultado."""
+        anos = self.anos(tabela) if anos is None else anos
+        partes = [
+            _ler_com_cache(
+                (self.caminho(tabela, ano),),
+                _assinatura(self.caminho(tabela, ano)),
+                lambda ano=ano: _ler_csv(tabela, self.caminho(tabela, ano), self.caminho_snapshot(tabela, ano)),
+            )
+            for ano in anos
+        ]
+        if not partes:
+            return tipar(tabela, pd.DataFrame())
+        return pd.concat(partes, ignore_index=True)
+
+    def preparar(self, tabela, ano, linhas):
+        """
+        Escreve (sem confirmar) o ano do arquivo com as linhas acrescentadas.
+
+        Returns:
+            Caminho do arquivo temporário, a renomear para caminho(tabela, ano)
+            junto com a remoção das linhas da tabela
+        """
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._descartar_temporarios()
+        caminho = self.caminho(tabela, ano)
+        seladas = self.carregar(tabela, [ano]) if os.path.exists(caminho) else tipar(tabela, pd.DataFrame())
+        df = pd.concat([seladas[colunas(tabela)], tipar(tabela, linhas)[colunas(tabela)]], ignore_index=True)
+        with instrumentacao.medir("persistir", f"Arquivar {os.path.basename(caminho)}"):
+            temporario = _escrever_temporario(caminho, lambda arquivo: df.to_csv(arquivo, index=False))
+        instrumentacao.contar("linhas arquivadas", len(linhas))
+        return temporario
+
+    def _descartar_temporarios(self):
+        # Restos de selagens interrompidas (os recentes podem ser de outro processo)
+        limite = time.time() - TEMPORARIO_ORFAO_SEGUNDOS
+        for temporario in glob.glob(os.path.join(glob.escape(self.diretorio), "*.tmp")):
+            if os.path.getmtime(temporario) < limite:
+                os.remove(temporario)
+
+
+def _preparar_anos(arquivo, tabela, df, ate_ano):
+    """
+    Prepara os anos do arquivo com as linhas da tabela até ate_ano (inclusive).
+
+    Returns:
+        (ids das linhas arquivadas, dicionário {arquivo do ano: temporário})
+    """
+    anos = anos_da_particao(tabela, df)
+    antigas = df[anos <= ate_ano]
+    renomeacoes = {}
+    for ano, linhas in antigas.groupby(anos[antigas.index]):
+        renomeacoes[arquivo.caminho(tabela, int(ano))] = arquivo.preparar(tabela, int(ano), linhas)
+    return antigas.index, renomeacoes
+
+
+class RepositorioCSV:
+    """
+    Repositório sobre os arquivos CSV. O id de cada linha é a sua posição no arquivo.
+
+    Toda gravação escreve um arquivo temporário, força-o em disco e o renomeia
+    por cima do original, de modo que uma queda nunca deixa um CSV pela metade.
+    Operações que alteram mais de um arquivo (como pagar uma conta) registram
+    antes um journal com as mudanças pendentes; se o processo cair no meio,
+    a próxima abertura do repositório conclui a operação.
+
+    O histórico de pagamentos é o CSV (snapshot) mais um log de eventos só de
+    acréscimo: cada pagamento anexa uma linha ao log em vez de reescrever o
+    histórico inteiro. O log é compactado no CSV quando passa de
+    COMPACTAR_LOG_BYTES ou quando o histórico é editado.
+
+    Ao ler um CSV, o DataFrame já tipado é guardado em um snapshot Arrow IPC
+    com a assinatura (data de modificação e tamanho) do CSV. Enquanto o CSV
+    não muda, a leitura usa o snapshot em vez de interpretar o texto; o log
+    de eventos é sempre aplicado por cima.
+    """
+
+    def __init__(self, diretorio="."):
+        self.diretorio = diretorio
+        self.arquivo = ArquivoAnual(diretorio)
+        self._lock = threading.RLock()
+        self._profundidade = 0
+        with self._trava():
+            self._recuperar()
+
+    def _caminho_journal(self):
+        return os.path.join(self.diretorio, JOURNAL_FILE)
+
+    @contextlib.contextmanager
+    def _trava(self):
+        """
+        Trava exclusiva de leitura-alteração-gravação, entre threads e entre
+        processos (arquivo de trava com flock). Pode ser aninhada.
+        """
+        with self._lock:
+            arquivo = None
+            if self._profundidade == 0 and fcntl is not None:
+                arquivo = open(os.path.join(self.diretorio, TRAVA_FILE), "a")
+                fcntl.flock(arquivo, fcntl.LOCK_EX)
+            self._profundidade += 1
+            try:
+                yield
+            finally:
+                self._profundidade -= 1
+                if arquivo is not None:
+                    fcntl.flock(arquivo, fcntl.LOCK_UN)
+                    arquivo.close()
+
+    def _localizar(self, df, tabela, id_, original, usados=()):
+        """
+        Id atual da linha que a sessão leu. As posições no CSV mudam quando
+        outra sessão exclui linhas; nesse caso a linha é procurada pelo conteúdo.
+
+        Args:
+            usados: ids já atribuídos a outras linhas da mesma operação
+
+        Raises:
+            ConflitoDeEdicao: nenhuma linha tem o conteúdo lido. Sem uma chave
+                estável, a linha que ocupa a posição agora pode ser outra
+                conta, então não há como mesclar a alteração
+        """
+        if original is None:
+            return id_
+        if id_ in df.index and id_ not in usados and _linhas_iguais(tabela, df.loc[[id_]], original).iloc[0]:
+            return id_
+
+        # Linhas idênticas são intercambiáveis: qualquer uma ainda não usada serve
+        candidatos = df.index[_linhas_iguais(tabela, df, original)].difference(list(usados))
+        if len(candidatos):
+            return candidatos[0]
+        raise ConflitoDeEdicao("O registro foi alterado ou excluído por outra sessão. Recarregue e tente de novo.")
+
+    def caminho_log(self, tabela):
+        return os.path.join(self.diretorio, LOGS[tabela])
+
+    def _recuperar(self):
+        """Conclui uma gravação interrompida e descarta temporários órfãos."""
+        # O journal só aparece completo (é renomeado para o lugar), então se
+        # ele existe a operação foi confirmada e basta refazê-la. Eventos
+        # anexados duas vezes são descartados na leitura do log.
+        journal = self._caminho_journal()
+        if os.path.exists(journal):
+            with open(journal, encoding="utf-8") as arquivo:
+                self._aplicar(json.load(arquivo))
+            os.remove(journal)
+
+        # Temporários antigos são restos de gravações nunca confirmadas
+        # (os recentes podem pertencer a outro processo gravando agora)
+        limite = time.time() - TEMPORARIO_ORFAO_SEGUNDOS
+        snapshots = [SNAPSHOT_PREFIXO + arquivo + SNAPSHOT_SUFIXO for arquivo in ARQUIVOS.values()]
+        for arquivo in list(ARQUIVOS.values()) + snapshots + [JOURNAL_FILE]:
+            padrao = os.path.join(glob.escape(self.diretorio), glob.escape(arquivo) + ".*.tmp")
+            for temporario in glob.glob(padrao):
+                if os.path.getmtime(temporario) < limite:
+                    os.remove(temporario)
+
+    def _aplicar(self, operacao):
+        """Executa renomeações, acréscimos a logs e remoções de uma operação."""
+        for destino, temporario in operacao["renomeacoes"].items():
+            if os.path.exists(temporario):
+                os.replace(temporario, destino)
+        for caminho, linhas in operacao["anexos"].items():
+            _anexar_linhas(caminho, linhas)
+        for caminho in operacao["remocoes"]:
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        for diretorio in {self.diretorio} | {os.path.dirname(destino) for destino in operacao["renomeacoes"]}:
+            _sincronizar_diretorio(diretorio)
+
+    def _gravar(self, tabelas, anexos=None, renomeacoes=None):
+        """
+        Grava de forma atômica um ou mais arquivos.
+
+        Args:
+            tabelas: dicionário {tabela: DataFrame completo a gravar}
+            anexos: dicionário {tabela com log: DataFrame de linhas a anexar}
+            renomeacoes: dicionário {arquivo: temporário já escrito} a
+                confirmar junto (ex.: os anos do arquivo)
+        """
+        anexos = anexos or {}
+        renomeacoes = renomeacoes or {}
+        with instrumentacao.medir("persistir", "Gravar " + ", ".join([*tabelas, *anexos])):
+            self._gravar_arquivos(tabelas, anexos, renomeacoes)
+
+        # Compactação periódica do log
+        for tabela in anexos:
+            assinatura = _assinatura(self.caminho_log(tabela))
+            if assinatura and assinatura[1] > COMPACTAR_LOG_BYTES:
+                self.compactar(tabela)
+
+    def _gravar_arquivos(self, tabelas, anexos, renomeacoes):
+        operacao = {"renomeacoes": dict(renomeacoes), "anexos": {}, "remocoes": []}
+
+        for tabela, df in tabelas.items():
+            temporario = _escrever_temporario(
+                self.caminho(tabela), lambda arquivo, df=df: df.to_csv(arquivo, index=False)
+            )
+            operacao["renomeacoes"][self.caminho(tabela)] = temporario
+            instrumentacao.contar("linhas gravadas", len(df))
+            instrumentacao.contar("bytes gravados (to_csv)", os.path.getsize(temporario))
+            # O CSV reescrito já contém o que estava no log
+            if tabela in LOGS and os.path.exists(self.caminho_log(tabela)):
+                operacao["remocoes"].append(self.caminho_log(tabela))
+
+        for tabela, linhas in anexos.items():
+            operacao["anexos"][self.caminho_log(tabela)] = eventos_log(tabela, linhas)
+            instrumentacao.contar("linhas gravadas", len(linhas))
+
+        # Com mais de uma mudança, o journal é o ponto de confirmação da operação
+        mudancas = sum(len(v) for v in operacao.values())
+        if mudancas > 1:
+            journal = _escrever_temporario(
+                self._caminho_journal(), lambda arquivo: json.dump(operacao, arquivo)
+            )
+            os.replace(journal, self._caminho_journal())
+            _sincronizar_diretorio(self.diretorio)
+
+        self._aplicar(operacao)
+        for tabela in set(tabelas) | set(anexos):
+            _invalidar((self.caminho(tabela),))
+        for caminho in renomeacoes:
+            _invalidar((caminho,))
+
+        if mudancas > 1:
+            os.remove(self._caminho_journal())
+
+    def compactar(self, tabela):
+        """Incorpora o log de eventos da tabela ao CSV e apaga o log."""
+        with self._trava():
+            if tabela in LOGS and os.path.exists(self.caminho_log(tabela)):
+                self._gravar({tabela: self.carregar(tabela)})
+
+    def caminho(self, tabela):
+        return os.path.join(self.diretorio, ARQUIVOS[tabela])
+
+    def caminho_snapshot(self, tabela):
+        return os.path.join(self.diretorio, SNAPSHOT_PREFIXO + ARQUIVOS[tabela] + SNAPSHOT_SUFIXO)
+
+    def existe(self, tabela):
+        if tabela in LOGS and os.path.exists(self.caminho_log(tabela)):
+            return True
+        return os.path.exists(self.caminho(tabela))
+
+    def versao(self, tabela):
+        """Versão da tabela: data de modificação e tamanho do arquivo (e do log)."""
+        if tabela in LOGS:
+            return (_assinatura(self.caminho(tabela)), _assinatura(self.caminho_log(tabela)))
+        return _assinatura(self.caminho(tabela))
+
+    def _ler_log(self, tabela):
+        """Reconstrói as linhas anexadas ao log, na ordem, sem eventos repetidos."""
+        if tabela not in LOGS or not os.path.exists(self.caminho_log(tabela)):
+            return []
+
+        vistos = set()
+        linhas = []
+        with open(self.caminho_log(tabela), encoding="utf-8") as arquivo:
+            for texto in arquivo:
+                try:
+                    evento = json.loads(texto)
+                except ValueError:
+                    # Linha cortada por uma queda durante a gravação
+                    continue
+                if evento["evento"] not in vistos:
+                    vistos.add(evento["evento"])
+                    linhas.append(evento["linha"])
+        return linhas
+
+    def _ler_csv(self, tabela):
+        """Conteúdo tipado do CSV (sem o log), do snapshot quando ele está em dia."""
+        return _ler_csv(tabela, self.caminho(tabela), self.caminho_snapshot(tabela))
+
+    def _ler(self, tabela):
+        df = self._ler_csv(tabela)
+        anexadas = self._ler_log(tabela)
+        if anexadas:
+            df = tipar(tabela, pd.concat([df, pd.DataFrame(anexadas)], ignore_index=True))
+        return df
+
+    def carregar(self, tabela):
+        return _ler_com_cache((self.caminho(tabela),), self.versao(tabela), lambda: self._ler(tabela))
+
+    def _conferir_versao(self, tabela, versao_esperada):
+        if versao_esperada is not None and self.versao(tabela) != versao_esperada:
+            raise ConflitoDeEdicao("A tabela foi alterada por outra sessão. Recarregue e tente de novo.")
+
+    def substituir(self, tabela, df, versao_esperada=None):
+        """Grava a tabela inteira. Com versao_esperada, falha se outra sessão gravou antes."""
+        with self._trava():
+            self._conferir_versao(tabela, versao_esperada)
+            self._gravar({tabela: df})
+
+    def _com_inseridas(self, tabela, linhas):
+        # Partes vazias ficam fora do concat (o pandas está mudando os tipos
+        # que elas produzem) e o resultado volta aos tipos da tabela
+        partes = [df for df in (self.carregar(tabela), tipar(tabela, linhas)) if not df.empty]
+        if not partes:
+            return tipar(tabela, pd.DataFrame())
+        return tipar(tabela, pd.concat(partes, ignore_index=True))
+
+    def inserir(self, tabela, linhas):
+        with self._trava():
+            total = len(self.carregar(tabela))
+            if tabela in LOGS:
+                self._gravar({}, anexos={tabela: linhas})
+            else:
+                self._gravar({tabela: self._com_inseridas(tabela, linhas)})
+        return list(range(total, total + len(linhas)))
+
+    def _ids_conferidos(self, df, tabela, ids, originais):
+        """Localiza as linhas lidas pela sessão e confere que não foram alteradas."""
+        if originais is None:
+            return list(ids)
+        conferidos = []
+        usados = set()
+        for id_, original in zip(ids, originais):
+            conferidos.append(self._localizar(df, tabela, id_, original, usados))
+            usados.add(conferidos[-1])
+        return conferidos
+
+    def atualizar(self, tabela, id_, valores, original=None):
+        with self._trava():
+            df = self.carregar(tabela)
+            if original is not None:
+                id_ = self._localizar(df, tabela, id_, original)
+            for coluna, valor in valores.items():
+                df.at[id_, coluna] = valor
+            self._gravar({tabela: df})
+
+    def atualizar_varias(self, tabela, alteracoes, originais=None):
+        """
+        Altera várias linhas em uma única gravação.
+
+        Args:
+            alteracoes: DataFrame indexado pelo id, com as colunas a alterar
+            originais: linhas como a sessão as leu, na ordem de alteracoes
+                (a operação inteira falha se alguma mudou)
+        """
+        with self._trava():
+            df = self.carregar(tabela)
+            ids = self._ids_conferidos(df, tabela, alteracoes.index, originais)
+            for coluna in alteracoes.columns:
+                df.loc[ids, coluna] = alteracoes[coluna].to_numpy()
+            self._gravar({tabela: df})
+
+    def excluir(self, tabela, ids, originais=None):
+        with self._trava():
+            df = self.carregar(tabela)
+            ids = self._ids_conferidos(df, tabela, ids, originais)
+            self._gravar({tabela: df.drop(ids)})
+
+    def arquivar(self, tabela, ate_ano):
+        """Sela no arquivo os anos até ate_ano (inclusive) e os tira da tabela. Retorna quantas linhas saíram."""
+        with self._trava():
+            # Um journal pendente pode ter anos do arquivo ainda por renomear
+            self._recuperar()
+            df = self.carregar(tabela)
+            ids, renomeacoes = _preparar_anos(self.arquivo, tabela, df, ate_ano)
+            if len(ids):
+                self._gravar({tabela: df.drop(ids)}, renomeacoes=renomeacoes)
+            return len(ids)
+
+    def pagar_contas(self, ids, data_pagamento, originais=None):
+        with self._trava():
+            contas = self.carregar("contas")
+            ids = self._ids_conferidos(contas, "contas", ids, originais)
+            pagas = marcar_pagas(contas.loc[ids], data_pagamento)
+
+            # Contas e histórico são confirmados juntos; o pagamento só é anexado ao log
+            self._gravar({"contas": contas.drop(ids)}, anexos={"historico": pagas})
+
+    def lancar_servico(self, linha):
+        """Inclui um lançamento Cofap (a 'Situação' é calculada) e desloca o saldo dos posteriores."""
+        with self._trava():
+            servicos = self.carregar("servicos")
+            situacao, ajustes = LivroCofap(servicos).lancar(linha)
+            servicos.loc[ajustes.index, "Situação"] = ajustes
+            novo = tipar("servicos", pd.DataFrame([{**linha, "Situação": situacao}]))
+            self._gravar({"servicos": pd.concat([servicos, novo], ignore_index=True)})
+
+    def excluir_servicos(self, ids, versao_esperada=None):
+        """Exclui lançamentos Cofap e refaz o saldo só a partir do primeiro excluído."""
+        with self._trava():
+            self._conferir_versao("servicos", versao_esperada)
+            servicos = self.carregar("servicos")
+            ajustes = LivroCofap(servicos).excluir(ids)
+            servicos.loc[ajustes.index, "Situação"] = ajustes
+            self._gravar({"servicos": servicos.drop(ids, errors="ignore")})
+
+    def registrar_geracao(self, novas_contas, proximos):
+        """Grava as contas geradas que ainda não existem e avança os modelos. Retorna quantas foram gravadas."""
+        with self._trava():
+            return self._registrar_geracao(novas_contas, proximos)
+
+    def _registrar_geracao(self, novas_contas, proximos):
+        existentes = pd.concat([self.carregar("contas"), self.carregar("historico")], ignore_index=True)
+        novas_contas = sem_duplicatas(novas_contas, existentes)
+
+        recorrentes = self.carregar("recorrentes")
+        for coluna in proximos.columns:
+            recorrentes.loc[proximos.index, coluna] = proximos[coluna]
+
+        tabelas = {"recorrentes": recorrentes}
+        if not novas_contas.empty:
+            tabelas["contas"] = self._com_inseridas("contas", novas_contas)
+        self._gravar(tabelas)
+        return len(novas_contas)
+
+
+class RepositorioSQLite:
+    """
+    Repositório sobre um banco SQLite em modo WAL.
+
+    O id de cada linha é a chave primária da tabela e continua válido entre
+    execuções do script, o que permite gravar apenas a linha alterada.
+    """
+
+    def __init__(self, caminho=BANCO_FILE):
+        self.caminho = caminho
+        self.arquivo = ArquivoAnual(os.path.dirname(caminho) or ".")
+        with self._transacao() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("CREATE TABLE IF NOT EXISTS versoes (tabela TEXT PRIMARY KEY, versao INTEGER NOT NULL)")
+            # Anos do arquivo confirmados pela transação e ainda não renomeados
+            con.execute("CREATE TABLE IF NOT EXISTS arquivamentos (destino TEXT PRIMARY KEY, temporario TEXT NOT NULL)")
+            existentes = {linha[0] for linha in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            for tabela in ESQUEMAS:
+                if tabela in existentes:
+                    self._criar_tabela(con, tabela)
+        with self._transacao() as con:
+            con.execute("BEGIN IMMEDIATE")
+            self._concluir_arquivamentos(con)
+
+    @contextlib.contextmanager
+    def _transacao(self):
+        """Abre uma conexão e executa o bloco em uma única transação."""
+        inicio = time.perf_counter()
+        con = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            con.execute("PRAGMA synchronous=NORMAL")
+            with con:
+                yield con
+            # Só as transações que escreveram contam como persistência (as linhas
+            # incluem o contador de versão de cada tabela alterada)
+            if con.total_changes:
+                instrumentacao.contar("linhas gravadas", con.total_changes)
+                instrumentacao.registrar("persistir", "Transação SQLite", time.perf_counter() - inicio)
+        finally:
+            con.close()
+
+    def _criar_tabela(self, con, tabela):
+        definicoes = ", ".join(f"{nome} {TIPOS_SQL[tipo]}" for _, nome, tipo in ESQUEMAS[tabela])
+        con.execute(f"CREATE TABLE IF NOT EXISTS {tabela} (id INTEGER PRIMARY KEY, {definicoes})")
+
+        # Bancos criados por versões anteriores podem não ter as colunas novas
+        atuais = {linha[1] for linha in con.execute(f"PRAGMA table_info({tabela})")}
+        for _, nome, tipo in ESQUEMAS[tabela]:
+            if nome not in atuais:
+                con.execute(f"ALTER TABLE {tabela} ADD COLUMN {nome} {TIPOS_SQL[tipo]}")
+
+        for nome in INDICES[tabela]:
+            con.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_{nome} ON {tabela} ({nome})")
+
+    def _gravou(self, con, tabela):
+        """Incrementa a versão da tabela (na mesma transação da escrita) e invalida o cache."""
+        con.execute(
+            "INSERT INTO versoes (tabela, versao) VALUES (?, 1) "
+            "ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1",
+            (tabela,),
+        )
+        _invalidar((self.caminho, tabela))
+
+    def _linhas_sql(self, tabela, df):
+        """Converte as linhas de um DataFrame em tuplas prontas para o INSERT."""
+        df = tipar(tabela, df)
+        esquema = ESQUEMAS[tabela]
+        return [
+            tuple(_valor_sql(valor, tipo) for valor, (_, _, tipo) in zip(linha, esquema))
+            for linha in df[colunas(tabela)].itertuples(index=False, name=None)
+        ]
+
+    def existe(self, tabela):
+        with self._transacao() as con:
+            cursor = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (tabela,))
+            return cursor.fetchone() is not None
+
+    def versao(self, tabela):
+        """Versão da tabela: contador incrementado a cada escrita, inclusive de outros processos."""
+        with self._transacao() as con:
+            linha = con.execute("SELECT versao FROM versoes WHERE tabela = ?", (tabela,)).fetchone()
+        return linha[0] if linha else 0
+
+    def _consultar(self, con, tabela, filtro=None, parametros=()):
+        """Linhas da tabela (todas ou as que atendem ao filtro SQL) como DataFrame tipado, em ordem de id."""
+        onde = f" WHERE {filtro}" if filtro else ""
+        df = pd.read_sql_query(f"SELECT * FROM {tabela}{onde} ORDER BY id", con, params=parametros, index_col="id")
+        df = df.rename(columns={nome: coluna for coluna, nome, _ in ESQUEMAS[tabela]})
+        df.index.name = None
+        return tipar(tabela, df)
+
+    def _ler(self, tabela):
+        if not self.existe(tabela):
+            return tipar(tabela, pd.DataFrame())
+
+        with self._transacao() as con:
+            return self._consultar(con, tabela)
+
+    def carregar(self, tabela):
+        return _ler_com_cache((self.caminho, tabela), self.versao(tabela), lambda: self._ler(tabela))
+
+    def _linha_atual(self, con, tabela, id_):
+        """Linha gravada agora (dict com os nomes do DataFrame) ou None se não existe."""
+        cursor = con.execute(f"SELECT * FROM {tabela} WHERE id = ?", (int(id_),))
+        linha = cursor.fetchone()
+        if linha is None:
+            return None
+        nomes = {nome: coluna for coluna, nome, _ in ESQUEMAS[tabela]}
+        return {nomes[d[0]]: valor for d, valor in zip(cursor.description, linha) if d[0] in nomes}
+
+    def _conferir_inalteradas(self, con, tabela, ids, originais):
+        if originais is not None:
+            for id_, original in zip(ids, originais):
+                verificar_inalterada(tabela, self._linha_atual(con, tabela, id_), original)
+
+    def _conferir_versao(self, con, tabela, versao_esperada):
+        if versao_esperada is not None:
+            atual = con.execute("SELECT versao FROM versoes WHERE tabela = ?", (tabela,)).fetchone()
+            if (atual[0] if atual else 0) != versao_esperada:
+                raise ConflitoDeEdicao("A tabela foi alterada por outra sessão. Recarregue e tente de novo.")
+
+    def substituir(self, tabela, df, versao_esperada=None):
+        """Grava a tabela inteira. Com versao_esperada, falha se outra sessão gravou antes."""
+        nomes = [nome for _, nome, _ in ESQUEMAS[tabela]]
+        marcadores = ", ".join("?" * (len(nomes) + 1))
+        linhas = [(int(id_),) + linha for id_, linha in zip(df.index, self._linhas_sql(tabela, df))]
+
+        with self._transacao() as con:
+            con.execute("BEGIN IMMEDIATE")
+            self._conferir_versao(con, tabela, versao_esperada)
+            self._criar_tabela(con, tabela)
+            con.execute(f"DELETE FROM {tabela}")
+            con.executemany(
+                f"INSERT INTO {tabela} (id, {', '.join(nomes)}) VALUES ({marcadores})", linhas
+            )
+            self._gravou(con, tabela)
+
+    def _inserir(self, con, tabela, linhas):
+        nomes = [nome for _, nome, _ in ESQUEMAS[tabela]]
+        marcadores = ", ".join("?" * len(nomes))
+        ids = []
+
+        self._criar_tabela(con, tabela)
+        for linha in self._linhas_sql(tabela, linhas):
+            cursor = con.execute(
+                f"INSERT INTO {tabela} ({', '.join(nomes)}) VALUES ({marcadores})", linha
+            )
+            ids.append(cursor.lastrowid)
+        self._gravou(con, tabela)
+        return ids
+
+    def _atualizar(self, con, tabela, id_, valores):
+        tipos = {coluna: (nome, tipo) for coluna, nome, tipo in ESQUEMAS[tabela]}
+        atribuicoes = ", ".join(f"{tipos[coluna][0]} = ?" for coluna in valores)
+        parametros = [_valor_sql(valor, tipos[coluna][1]) for coluna, valor in valores.items()]
+
+        con.execute(f"UPDATE {tabela} SET {atribuicoes} WHERE id = ?", parametros + [int(id_)])
+        self._gravou(con, tabela)
+
+    def inserir(self, tabela, linhas):
+        with self._transacao() as con:
+            return self._inserir(con, tabela, linhas)
+
+    def atualizar(self, tabela, id_, valores, original=None):
+        with self._transacao() as con:
+            if original is not None:
+                con.execute("BEGIN IMMEDIATE")
+                verificar_edicao(tabela, self._linha_atual(con, tabela, id_), original, valores)
+            self._atualizar(con, tabela, id_, valores)
+
+    def atualizar_varias(self, tabela, alteracoes, originais=None):
+        """
+        Altera várias linhas em uma única transação.
+
+        Args:
+            alteracoes: DataFrame indexado pelo id, com as colunas a alterar
+            originais: linhas como a sessão as leu, na ordem de alteracoes
+                (a operação inteira falha se alguma mudou)
+        """
+        tipos = {coluna: (nome, tipo) for coluna, nome, tipo in ESQUEMAS[tabela]}
+        atribuicoes = ", ".join(f"{tipos[coluna][0]} = ?" for coluna in alteracoes.columns)
+        parametros = [
+            tuple(_valor_sql(valor, tipos[coluna][1]) for coluna, valor in zip(alteracoes.columns, linha)) + (int(id_),)
+            for id_, linha in zip(alteracoes.index, alteracoes.itertuples(index=False, name=None))
+        ]
+
+        with self._transacao() as con:
+            con.execute("BEGIN IMMEDIATE")
+            self._conferir_inalteradas(con, tabela, alteracoes.index, originais)
+            con.executemany(f"UPDATE {tabela} SET {atribuicoes} WHERE id = ?", parametros)
+            self._gravou(con, tabela)
+
+    def excluir(self, tabela, ids, originais=None):
+        with self._transacao() as con:
+            con.execute("BEGIN IMMEDIATE")
+            self._conferir_inalteradas(con, tabela, ids, originais)
+            con.executemany(f"DELETE FROM {tabela} WHERE id = ?", [(int(id_),) for id_ in ids])
+            self._gravou(con, tabela)
+
+    def _concluir_arquivamentos(self, con):
+        """Põe no lugar os anos do arquivo de arquivamentos já confirmados."""
+        pendentes = con.execute("SELECT destino, temporario FROM arquivamentos").fetchall()
+        for destino, temporario in pendentes:
+            if os.path.exists(temporario):
+                os.replace(temporario, destino)
+            _invalidar((destino,))
+        if pendentes:
+            _sincronizar_diretorio(self.arquivo.diretorio)
+            con.execute("DELETE FROM arquivamentos")
+
+    def arquivar(self, tabela, ate_ano):
+        """Sela no arquivo os anos até ate_ano (inclusive) e os tira da tabela. Retorna quantas linhas saíram."""
+        with self._transacao() as con:
+            # Trava de escrita desde a leitura: nada entra nos anos sendo
+            # arquivados e nenhum outro arquivamento mexe no arquivo
+            con.execute("BEGIN IMMEDIATE")
+            self._concluir_arquivamentos(con)
+            self._criar_tabela(con, tabela)
+            fim = _valor_sql(pd.Timestamp(year=ate_ano + 1, month=1, day=1), "DATA")
+            coluna = {c: nome for c, nome, _ in ESQUEMAS[tabela]}[PARTICOES[tabela]]
+            antigas = self._consultar(con, tabela, f"{coluna} < ?", (fim,))
+            ids, renomeacoes = _preparar_anos(self.arquivo, tabela, antigas, ate_ano)
+            if len(ids):
+                con.executemany(f"DELETE FROM {tabela} WHERE id = ?", [(int(id_),) for id_ in ids])
+                con.executemany("INSERT INTO arquivamentos (destino, temporario) VALUES (?, ?)", renomeacoes.items())
+                self._gravou(con, tabela)
+
+        # Confirmado: os anos vão para o lugar (se o processo cair antes, a
+        # próxima abertura do banco termina o serviço)
+        with self._transacao() as con:
+            con.execute("BEGIN IMMEDIATE")
+            self._concluir_arquivamentos(con)
+        return len(ids)
+
+    def pagar_contas(self, ids, data_pagamento, originais=None):
+        data = _valor_sql(data_pagamento, "DATA")
+        parametros = [(int(id_),) for id_ in ids]
+        copiadas = ", ".join(
+            nome for _, nome, _ in ESQUEMAS["historico"] if nome not in ("data_pagamento", "status")
+        )
+
+        # Mover para o histórico e remover das contas na mesma transação
+        with self._transacao() as con:
+            con.execute("BEGIN IMMEDIATE")
+            self._conferir_inalteradas(con, "contas", ids, originais)
+            self._criar_tabela(con, "historico")
+            con.executemany(
+                f"INSERT INTO historico (data_pagamento, status, {copiadas}) "
+                f"SELECT ?, 'Paga', {copiadas} FROM contas WHERE id = ?",
+                [(data,) + p for p in parametros],
+            )
+            con.executemany("DELETE FROM contas WHERE id = ?", parametros)
+            self._gravou(con, "contas")
+            self._gravou(con, "historico")
+
+    def _janela_servicos(self, con, dia):
+        """
+        Trecho do livro Cofap afetado por uma alteração em 'dia': do último
+        lançamento anterior a esse dia em diante (a tabela toda se não houver).
+        """
+        anterior = con.execute(
+            "SELECT dia, id FROM servicos WHERE dia < ? ORDER BY dia DESC, id DESC LIMIT 1", (dia,)
+        ).fetchone()
+        if anterior is None:
+            return self._consultar(con, "servicos")
+        return self._consultar(con, "servicos", "dia > ? OR (dia = ? AND id >= ?)", (anterior[0],) + anterior)
+
+    def _gravar_saldos(self, con, ajustes):
+        con.executemany(
+            "UPDATE servicos SET situacao = ? WHERE id = ?",
+            [(float(saldo), int(id_)) for id_, saldo in ajustes.items()],
+        )
+
+    def lancar_servico(self, linha):
+        """Inclui um lançamento Cofap (a 'Situação' é calculada) e desloca o saldo dos posteriores."""
+        with self._transacao() as con:
+            con.execute("BEGIN IMMEDIATE")
+            self._criar_tabela(con, "servicos")
+            janela = self._janela_servicos(con, _valor_sql(linha["Dia"], "DATA"))
+            situacao, ajustes = LivroCofap(janela).lancar(linha)
+            self._gravar_saldos(con, ajustes)
+            self._inserir(con, "servicos", pd.DataFrame([{**linha, "Situação": situacao}]))
+
+    def excluir_servicos(self, ids, versao_esperada=None):
+        """Exclui lançamentos Cofap e refaz o saldo só a partir do primeiro excluído."""
+        parametros = [(int(id_),) for id_ in ids]
+        if not parametros:
+            return
+        with self._transacao() as con:
+            con.execute("BEGIN IMMEDIATE")
+            self._conferir_versao(con, "servicos", versao_esperada)
+            marcadores = ", ".join("?" * len(parametros))
+            inicio = con.execute(
+                f"SELECT MIN(dia) FROM servicos WHERE id IN ({marcadores})", [p[0] for p in parametros]
+            ).fetchone()[0]
+
+            if inicio is not None:
+                ajustes = LivroCofap(self._janela_servicos(con, inicio)).excluir(ids)
+                self._gravar_saldos(con, ajustes)
+            con.executemany("DELETE FROM servicos WHERE id = ?", parametros)
+            self._gravou(con, "servicos")
+
+    def registrar_geracao(self, novas_contas, proximos):
+        """Grava as contas geradas que ainda não existem e avança os modelos. Retorna quantas foram gravadas."""
+        with self._transacao() as con:
+            # Trava de escrita desde a leitura: duas sessões não geram a mesma conta
+            con.execute("BEGIN IMMEDIATE")
+            for tabela in ("contas", "historico", "recorrentes"):
+                self._criar_tabela(con, tabela)
+
+            if not novas_contas.empty:
+                inicio = _valor_sql(novas_contas["Data de Vencimento"].min(), "DATA")
+                existentes = pd.read_sql_query(
+                    "SELECT descricao, data_vencimento, recorrente FROM contas WHERE data_vencimento >= ? "
+                    "UNION ALL "
+                    "SELECT descricao, data_vencimento, recorrente FROM historico WHERE data_vencimento >= ?",
+                    con,
+                    params=(inicio, inicio),
+                )
+                existentes.columns = ["Descrição", "Data de Vencimento", "Recorrente"]
+                novas_contas = sem_duplicatas(novas_contas, existentes)
+                if not novas_contas.empty:
+                    self._inserir(con, "contas", novas_contas)
+
+            for id_, valores in proximos.iterrows():
+                self._atualizar(con, "recorrentes", id_, valores.to_dict())
+        return len(novas_contas)
+
+
+def importar_csvs(repositorio, diretorio="."):
+    """
+    Copia de uma só vez os CSVs existentes para o repositório informado.
+
+    Returns:
+        Dicionário {tabela: número de linhas importadas}
+    """
+    origem = RepositorioCSV(diretorio)
+    importadas = {}
+    for tabela in ESQUEMAS:
+        if origem.existe(tabela):
+            df = origem.carregar(tabela)
+            repositorio.substituir(tabela, df)
+            importadas[tabela] = len(df)
+    return importadas
+
+
+def _criar_banco(caminho, diretorio):
+    """Cria o banco com os CSVs do diretório importados, de forma atômica."""
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        importar_csvs(RepositorioSQLite(temporario), diretorio)
+        os.replace(temporario, caminho)
+        _sincronizar_diretorio(diretorio)
+    finally:
+        for resto in (temporario, temporario + "-wal", temporario + "-shm"):
+            if os.path.exists(resto):
+                os.remove(resto)
+
+
+_repositorios = {}
+
+
+def abrir_repositorio(backend=None, diretorio="."):
+    """
+    Retorna o repositório do processo (um por backend e diretório).
+
+    Na primeira abertura do backend SQLite, se o banco ainda não existir,
+    os CSVs presentes no diretório são importados automaticamente, em um
+    banco temporário que só toma o lugar do definitivo quando a importação
+    termina (uma importação interrompida é refeita na próxima abertura).
+    """
+    backend = backend or os.environ.get("CONTAS_ARMAZENAMENTO", "sqlite")
+    chave = (backend, os.path.abspath(diretorio))
+
+    if chave not in _repositorios:
+        if backend == "csv":
+            repositorio = RepositorioCSV(diretorio)
+        else:
+            caminho = os.path.join(diretorio, BANCO_FILE)
+            if not os.path.exists(caminho):
+                _criar_banco(caminho, diretorio)
+            repositorio = RepositorioSQLite(caminho)
+        _repositorios[chave] = repositorio
+
+    return _repositorios[chave]
+
+
+def fechar_repositorio(diretorio="."):
+    """Esquece os repositórios do diretório e as tabelas dele em cache (são reabertos e relidos sob demanda)."""
+    diretorio = os.path.abspath(diretorio)
+    for chave in [chave for chave in _repositorios if chave[1] == diretorio]:
+        del _repositorios[chave]
+
+    # Só os arquivos do próprio diretório: outros livros podem estar em subpastas
+    pastas = {diretorio, os.path.join(diretorio, ARQUIVO_DIR)}
+    with _cache_lock:
+        for chave in [chave for chave in _cache if os.path.dirname(os.path.abspath(chave[0])) in pastas]:
+            del _cache[chave]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ferramentas de armazenamento do dashboard de contas")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    importar = subcomandos.add_parser("importar", help="Importa os CSVs para o banco SQLite")
+    importar.add_argument("--diretorio", default=".", help="Diretório dos CSVs e do banco")
+    arquivar = subcomandos.add_parser("arquivar", help="Sela os anos antigos do histórico no arquivo")
+    arquivar.add_argument(
+        "--ate-ano", type=int, default=datetime.date.today().year - 1,
+        help="Último ano a arquivar (padrão: o ano passado)",
+    )
+    arquivar.add_argument("--backend", choices=["sqlite", "csv"], help="Padrão: CONTAS_ARMAZENAMENTO ou sqlite")
+    arquivar.add_argument("--diretorio", default=".", help="Diretório dos dados")
+    args = parser.parse_args()
+
+    if args.comando == "arquivar":
+        repositorio = abrir_repositorio(args.backend, args.diretorio)
+        for tabela in PARTICOES:
+            if repositorio.existe(tabela):
+                total = repositorio.arquivar(tabela, args.ate_ano)
+                print(f"{tabela}: {total} linha(s) arquivada(s) até {args.ate_ano}")
+
+    if args.comando == "importar":
+        banco = RepositorioSQLite(os.path.join(args.diretorio, BANCO_FILE))
+        for tabela, total in importar_csvs(banco, args.diretorio).items():
+            print(f"{tabela}: {total} linha(s) importada(s)")
@@ -0,0 +1,396 @@
+"""
+Benchmark das etapas do dashboard com dados sintéticos.
+
+Gera tabelas de contas, histórico, recorrentes e serviços Cofap do tamanho
+pedido (com a mesma semente, sempre os mesmos dados) e cronometra cada etapa
+do app sem servidor Streamlit: gravação e leitura nos dois backends, geração
+das recorrentes, índice e resumo do dashboard, calendário, previsão de
+caixa, cubo de pagamentos, busca, listas, livro Cofap e relatórios em PDF.
+O relatório pode ser salvo em JSON e comparado com um relatório anterior:
+
+    python benchmark.py --linhas 10000 100000 --json atual.json
+    python benchmark.py --linhas 10000 100000 --comparar atual.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import analise
+import armazenamento
+import busca
+import calendario
+import cofap
+import consultas
+import instrumentacao
+import previsao
+import recorrencia
+import relatorios
+import resumo
+
+# Tamanho de cada tabela em relação ao número de linhas pedido
+PROPORCOES = {
+    "contas": 1.0,
+    "historico": 1.0,
+    "recorrentes": 0.01,
+    "servicos": 0.1,
+}
+
+# Linhas escritas nos relatórios em PDF (o FPDF escreve célula por célula;
+# acima disso o benchmark mede só o PDF e nada mais)
+MAX_LINHAS_PDF = 20000
+
+DESCRICOES = [
+    "Aluguel", "Energia", "Água", "Internet", "Telefone", "Contabilidade", "Salário", "Fornecedor de peças",
+    "Manutenção", "Combustível", "Seguro", "IPTU", "Consórcio", "Empréstimo", "Material de escritório",
+]
+FUNCIONARIOS = ["Richard", "Fernando", "Valter", "Osmar"]
+EQUIPAMENTOS = ["Empilhadeira", "Guindaste", "Caminhão", "Retroescavadeira"]
+
+
+def _milhar(numero):
+    return f"{numero:,}".replace(",", ".")
+
+
+def _datas(rng, inicio, dias, quantidade):
+    return pd.Timestamp(inicio).normalize() + pd.to_timedelta(rng.integers(0, dias, quantidade), unit="D")
+
+
+def _descricoes(rng, quantidade):
+    bases = np.array(DESCRICOES, dtype=object)[rng.integers(0, len(DESCRICOES), quantidade)]
+    return bases + " " + rng.integers(1, 500, quantidade).astype(str).astype(object)
+
+
+def gerar_dados(linhas, semente=0, hoje=None):
+    """
+    Tabelas sintéticas no formato do repositório.
+
+    As contas pendentes vencem de dois anos atrás a um ano à frente, os
+    modelos recorrentes têm o próximo vencimento espalhado em torno de hoje
+    (parte deles atrasada, para a geração ter trabalho) e os serviços Cofap
+    já vêm com a situação acumulada.
+
+    Args:
+        linhas: número de linhas de referência (ver PROPORCOES)
+        semente: semente do gerador aleatório
+        hoje: data de referência (padrão: hoje)
+
+    Returns:
+        Dicionário {tabela: DataFrame}
+    """
+    rng = np.random.default_rng(semente)
+    hoje = pd.Timestamp(hoje or pd.Timestamp.today()).normalize()
+    tamanhos = {tabela: max(1, int(linhas * proporcao)) for tabela, proporcao in PROPORCOES.items()}
+
+    n = tamanhos["contas"]
+    contas = pd.DataFrame({
+        "Descrição": _descricoes(rng, n),
+        "Valor": rng.uniform(10, 20000, n).round(2),
+        "Data de Vencimento": _datas(rng, hoje - pd.DateOffset(years=2), 3 * 365, n),
+        "Status": "Pendente",
+        "Data de Pagamento": pd.NaT,
+        "Origem": np.where(rng.random(n) < 0.2, "Recorrente", ""),
+        "Recorrente": np.nan,
+    })
+
+    n = tamanhos["historico"]
+    vencimentos = _datas(rng, hoje - pd.DateOffset(years=3), 3 * 365, n)
+    historico = pd.DataFrame({
+        "Descrição": _descricoes(rng, n),
+        "Valor": rng.uniform(10, 20000, n).round(2),
+        "Data de Pagamento": vencimentos + pd.to_timedelta(rng.integers(-5, 30, n), unit="D"),
+        "Data de Vencimento": vencimentos,
+        "Status": "Paga",
+        "Origem": "",
+        "Recorrente": np.nan,
+    })
+
+    n = tamanhos["recorrentes"]
+    proximos = _datas(rng, hoje - pd.DateOffset(months=18), 30 * 30, n)
+    recorrentes = pd.DataFrame({
+        "Descrição": _descricoes(rng, n),
+        "Valor": rng.uniform(50, 5000, n).round(2),
+        "Próximo Vencimento": proximos,
+        "Frequência": np.array(list(recorrencia.MESES_POR_FREQUENCIA), dtype=object)[rng.integers(0, 4, n)],
+        "Dia Vencimento": proximos.day,
+        "Última Geração": pd.NaT,
+        "Ativa": rng.random(n) < 0.9,
+    })
+
+    n = tamanhos["servicos"]
+    pedido = rng.random(n) < 0.1
+    servicos = pd.DataFrame({
+        "Funcionario": np.array(FUNCIONARIOS, dtype=object)[rng.integers(0, len(FUNCIONARIOS), n)],
+        "Equipamento": np.array(EQUIPAMENTOS, dtype=object)[rng.integers(0, len(EQUIPAMENTOS), n)],
+        "Dia": _datas(rng, hoje - pd.DateOffset(years=3), 3 * 365, n).sort_values(),
+        "Valor diaria": np.where(pedido, rng.uniform(20000, 80000, n), rng.uniform(1000, 5000, n)).round(2),
+        "Pedidos de compra": np.where(pedido, "PC-" + pd.Series(rng.integers(1000, 9999, n)).astype(str), ""),
+    })
+    servicos["Situação"] = cofap.saldos_acumulados(cofap.movimentos(servicos), 0.0)
+
+    tabelas = {"contas": contas, "historico": historico, "recorrentes": recorrentes, "servicos": servicos}
+    return {tabela: armazenamento.tipar(tabela, df) for tabela, df in tabelas.items()}
+
+
+def etapas(dados, diretorio, hoje, max_linhas_pdf=MAX_LINHAS_PDF):
+    """
+    Etapas cronometradas, na ordem em que rodam.
+
+    Cada etapa é (nome, preparar, executar): preparar (ou None) roda antes de
+    cada repetição, fora do cronômetro; executar devolve quantas linhas
+    processou.
+    """
+    csv = armazenamento.RepositorioCSV(diretorio)
+    sqlite = armazenamento.RepositorioSQLite(os.path.join(diretorio, armazenamento.BANCO_FILE))
+    contas, historico = dados["contas"], dados["historico"]
+    recorrentes, servicos = dados["recorrentes"], dados["servicos"]
+    indice = consultas.IndiceVencimentos(contas)
+    pendentes = indice.com_status("Pendente")
+    periodo = calendario.periodo_12_meses(hoje)
+    tabelas_busca = {tabela: (0, dados[tabela]) for tabela in busca.TABELAS}
+    textos = busca.IndiceBusca()
+    textos.sincronizar(tabelas_busca)
+
+    def gravar(repositorio):
+        def executar():
+            for tabela, df in dados.items():
+                repositorio.substituir(tabela, df)
+            return sum(len(df) for df in dados.values())
+        return executar
+
+    def ler(repositorio):
+        def executar():
+            return sum(len(repositorio.carregar(tabela)) for tabela in dados)
+        return executar
+
+    def com_tabelas(repositorio, preparar=None):
+        # Leituras e pagamentos rodam também sem a etapa de gravação (--apenas)
+        def garantir():
+            if not all(repositorio.existe(tabela) for tabela in dados):
+                gravar(repositorio)()
+            if preparar is not None:
+                preparar()
+        return garantir
+
+    def sem_snapshots():
+        armazenamento.limpar_cache()
+        for tabela in dados:
+            if os.path.exists(csv.caminho_snapshot(tabela)):
+                os.remove(csv.caminho_snapshot(tabela))
+
+    def pagar(repositorio):
+        # Uma conta por repetição, como o botão "Pagar" da lista
+        def executar():
+            atual = repositorio.carregar("contas")
+            repositorio.pagar_contas(atual.index[:1], hoje)
+            return 1
+        return executar
+
+    def proximas_datas():
+        for data, frequencia, dia in zip(
+            recorrentes["Próximo Vencimento"], recorrentes["Frequência"], recorrentes["Dia Vencimento"]
+        ):
+            recorrencia.calcular_proxima_data(data, frequencia, int(dia))
+        return len(recorrentes)
+
+    def gerar_recorrentes():
+        novas, _ = recorrencia.ocorrencias_pendentes(recorrentes, hoje)
+        return len(novas)
+
+    def resumo_financeiro():
+        resumo.resumo_financeiro(indice, recorrentes, hoje)
+        return len(contas)
+
+    def montar_cubo():
+        analise.CuboPagamentos().sincronizar(0, historico)
+        return len(historico)
+
+    # Um pagamento novo sobre o cubo já montado (montado fora do cronômetro)
+    cubo = {}
+
+    def montar_cubo_sem_ultimo():
+        cubo["atual"] = analise.CuboPagamentos()
+        cubo["atual"].sincronizar(0, historico.iloc[:-1])
+
+    def atualizar_cubo():
+        cubo["atual"].sincronizar(1, historico)
+        return 1
+
+    def montar_indice_busca():
+        busca.IndiceBusca().sincronizar(tabelas_busca)
+        return sum(len(df) for _, df in tabelas_busca.values())
+
+    def buscar():
+        for consulta in ["alug", "fornecedor pecas", "manutensao", "agua 12", "zzz"]:
+            textos.descricoes(consulta)
+        return 5
+
+    def listas():
+        filtradas = consultas.ordenar(textos.filtrar(pendentes, "aluguel"), "Valor", decrescente=True)
+        consultas.paginar(filtradas, 1)
+        consultas.paginar(consultas.ordenar(pendentes, "Data de Vencimento"), 1)
+        return len(pendentes)
+
+    def calendario_mes():
+        por_dia = calendario.agregar_por_dia(indice, recorrentes, hoje.year, hoje.month)
+        calendario.montar_figura(hoje.year, hoje.month, por_dia, hoje.date())
+        return len(contas)
+
+    def mapa_calor():
+        diaria = calendario.tabela_diaria(indice, recorrentes, *periodo)
+        calendario.montar_mapa_calor(diaria, "Próximos 12 meses")
+        return len(contas)
+
+    def previsao_caixa():
+        previsao.projetar(indice, recorrentes, hoje, previsao.HORIZONTE_MESES, "Semanal")
+        return len(contas)
+
+    def pdf(gerar, df):
+        def executar():
+            gerar(df.iloc[:max_linhas_pdf])
+            return min(len(df), max_linhas_pdf)
+        return executar
+
+    return [
+        ("Gravar tabelas (CSV)", None, gravar(csv)),
+        ("Ler tabelas (CSV, sem snapshot)", com_tabelas(csv, sem_snapshots), ler(csv)),
+        ("Ler tabelas (CSV, com snapshot)", com_tabelas(csv, armazenamento.limpar_cache), ler(csv)),
+        ("Pagar uma conta (CSV)", com_tabelas(csv), pagar(csv)),
+        ("Gravar tabelas (SQLite)", None, gravar(sqlite)),
+        ("Ler tabelas (SQLite)", com_tabelas(sqlite, armazenamento.limpar_cache), ler(sqlite)),
+        ("Pagar uma conta (SQLite)", com_tabelas(sqlite), pagar(sqlite)),
+        ("calcular_proxima_data (por modelo)", None, proximas_datas),
+        ("Gerar contas recorrentes", None, gerar_recorrentes),
+        ("Índice de vencimentos", None, lambda: len(consultas.IndiceVencimentos(contas).contas)),
+        ("Resumo financeiro", None, resumo_financeiro),
+        ("Cubo de pagamentos (montar)", None, montar_cubo),
+        ("Cubo de pagamentos (um pagamento novo)", montar_cubo_sem_ultimo, atualizar_cubo),
+        ("Índice de busca (montar)", None, montar_indice_busca),
+        ("Busca (5 consultas)", None, buscar),
+        ("Listas (busca, ordenação, página)", None, listas),
+        ("Calendário do mês", None, calendario_mes),
+        ("Mapa de calor (12 meses)", None, mapa_calor),
+        ("Previsão de caixa (24 meses)", None, previsao_caixa),
+        ("Livro Cofap", None, lambda: len(cofap.LivroCofap(servicos).ordenado)),
+        ("PDF contas a vencer", None, pdf(lambda df: relatorios.pdf_contas("Contas a Vencer", df, "A Vencer"), pendentes)),
+        ("PDF contas pagas", None, pdf(relatorios.pdf_historico, historico)),
+        ("PDF serviços Cofap", None, pdf(relatorios.pdf_servicos, servicos)),
+    ]
+
+
+def medir_etapa(preparar, executar, repeticoes):
+    """
+    Roda a etapa várias vezes.
+
+    Returns:
+        Dicionário com os tempos (s), as linhas processadas e os contadores da
+        instrumentação (bytes gravados etc.) da última repetição
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar is not None:
+            preparar()
+        instrumentacao.iniciar(True)
+        inicio = time.perf_counter()
+        linhas = executar()
+        tempos.append(time.perf_counter() - inicio)
+        execucao = instrumentacao.finalizar()
+    return {
+        "min_s": min(tempos),
+        "mediana_s": statistics.median(tempos),
+        "linhas": int(linhas),
+        "contadores": dict(execucao.contadores),
+    }
+
+
+def executar_benchmark(tamanhos, repeticoes=3, semente=0, hoje=None, max_linhas_pdf=MAX_LINHAS_PDF, apenas=None, saida=print):
+    """
+    Roda todas as etapas para cada tamanho.
+
+    Args:
+        tamanhos: números de linhas de referência (ex.: [10000, 100000])
+        repeticoes: repetições de cada etapa (vale o menor tempo)
+        semente: semente dos dados sintéticos
+        hoje: data de referência (padrão: hoje)
+        max_linhas_pdf: limite de linhas dos relatórios em PDF
+        apenas: textos; só roda as etapas cujo nome contém algum deles
+        saida: função chamada com uma linha de texto a cada etapa medida
+
+    Returns:
+        Relatório (dicionário serializável em JSON)
+    """
+    hoje = pd.Timestamp(hoje or pd.Timestamp.today()).normalize()
+    relatorio = {
+        "ambiente": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "plataforma": platform.platform(),
+        },
+        "parametros": {"repeticoes": repeticoes, "semente": semente, "hoje": hoje.date().isoformat(), "max_linhas_pdf": max_linhas_pdf},
+        "resultados": {},
+    }
+
+    for linhas in tamanhos:
+        resultados = relatorio["resultados"][str(linhas)] = {}
+        dados = gerar_dados(linhas, semente, hoje)
+        saida(f"== {_milhar(linhas)} linhas ({', '.join(f'{t}: {_milhar(len(df))}' for t, df in dados.items())})")
+
+        with tempfile.TemporaryDirectory(prefix="contas-benchmark-") as diretorio:
+            for nome, preparar, executar in etapas(dados, diretorio, hoje, max_linhas_pdf):
+                if apenas and not any(texto.lower() in nome.lower() for texto in apenas):
+                    continue
+                try:
+                    resultado = medir_etapa(preparar, executar, repeticoes)
+                except ImportError as erro:
+                    # plotly e fpdf são necessários só para calendário e PDFs
+                    saida(f"  {nome:<38} indisponível ({erro})")
+                    continue
+                resultados[nome] = resultado
+                saida(f"  {nome:<38} {resultado['min_s'] * 1000:>10.1f} ms  {_milhar(resultado['linhas']):>10} linhas")
+            armazenamento.limpar_cache()
+
+    return relatorio
+
+
+def comparar(atual, anterior, saida=print):
+    """Imprime a razão entre os tempos (menores) de dois relatórios: < 1 é mais rápido."""
+    for linhas, resultados in atual["resultados"].items():
+        base = anterior["resultados"].get(linhas, {})
+        saida(f"== {_milhar(int(linhas))} linhas: atual / anterior")
+        for nome, resultado in resultados.items():
+            if nome not in base:
+                saida(f"  {nome:<38} {resultado['min_s'] * 1000:>10.1f} ms  (sem referência)")
+                continue
+            razao = resultado["min_s"] / base[nome]["min_s"] if base[nome]["min_s"] else float("inf")
+            saida(f"  {nome:<38} {resultado['min_s'] * 1000:>10.1f} ms  {base[nome]['min_s'] * 1000:>10.1f} ms  {razao:>6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do dashboard de contas com dados sintéticos")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10000, 100000],
+                        help="Tamanhos de referência (contas e histórico; ver PROPORCOES)")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Repetições de cada etapa (vale o menor tempo)")
+    parser.add_argument("--semente", type=int, default=0, help="Semente dos dados sintéticos")
+    parser.add_argument("--hoje", help="Data de referência (aaaa-mm-dd); fixe-a para comparar execuções")
+    parser.add_argument("--max-linhas-pdf", type=int, default=MAX_LINHAS_PDF, help="Limite de linhas dos PDFs")
+    parser.add_argument("--apenas", nargs="+", help="Só as etapas cujo nome contém algum destes textos")
+    parser.add_argument("--json", help="Salva o relatório neste arquivo")
+    parser.add_argument("--comparar", help="Relatório JSON anterior para comparar os tempos")
+    args = parser.parse_args()
+
+    relatorio = executar_benchmark(
+        args.linhas, args.repeticoes, args.semente, args.hoje, args.max_linhas_pdf, args.apenas
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparar(relatorio, json.load(arquivo))
@@ -0,0 +1,216 @@
+"""
+Busca por descrição nas contas pendentes, no histórico e nos modelos
+recorrentes.
+
+O índice invertido guarda cada descrição distinta uma vez (descrições como
+"Diferencial peças (renegociação)" se repetem em muitas linhas), com quantas
+linhas de cada tabela a usam, e associa cada palavra às descrições que a
+contêm. Palavras são comparadas sem acentos e sem diferenciar maiúsculas;
+cada palavra da busca casa com as palavras do índice que começam com ela e,
+se nenhuma começar, com as parecidas (erros de digitação). Todas as palavras
+da busca precisam casar.
+
+O índice é mantido por repositório (livro) e atualizado a cada nova versão de uma
+tabela só com as linhas inseridas, alteradas ou excluídas.
+"""
+import bisect
+import difflib
+import re
+import threading
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+import instrumentacao
+
+# Tabelas indexadas
+TABELAS = ["contas", "historico", "recorrentes"]
+
+# Palavras menores que isso não são corrigidas (só o prefixo vale)
+MIN_LETRAS_APROXIMADA = 4
+
+# Semelhança mínima (0 a 1) para uma palavra ser considerada erro de digitação
+SEMELHANCA_MINIMA = 0.8
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def normalizar(texto):
+    """Texto sem acentos e em minúsculas."""
+    decomposto = unicodedata.normalize("NFKD", str(texto))
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).casefold()
+
+
+def palavras(texto):
+    """Palavras (sem acentos, minúsculas) do texto."""
+    return re.findall(r"\w+", normalizar(texto))
+
+
+def _descricoes(df):
+    if "Descrição" not in df.columns:
+        return pd.Series(dtype=object)
+    descricoes = df["Descrição"]
+    return descricoes[descricoes.notna()].astype(str)
+
+
+class IndiceBusca:
+    """Índice invertido das descrições de várias tabelas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versoes = {}
+        self._linhas = {}         # tabela -> Series {id: descrição}
+        self._contagem = {}       # descrição -> {tabela: linhas}
+        self._postagens = {}      # palavra -> set de descrições
+        self._vocabulario = None  # palavras ordenadas (refeito sob demanda)
+
+    def sincronizar(self, tabelas):
+        """
+        Atualiza o índice com as tabelas cuja versão mudou.
+
+        Args:
+            tabelas: dicionário {tabela: (versão, DataFrame)}
+        """
+        with self._lock:
+            for tabela, (versao, df) in tabelas.items():
+                if self._versoes.get(tabela, object()) != versao:
+                    with instrumentacao.medir("agregar", f"Índice de busca ({tabela})"):
+                        self._atualizar(tabela, _descricoes(df))
+                    self._versoes[tabela] = versao
+
+    def _atualizar(self, tabela, novas):
+        antigas = self._linhas.get(tabela, pd.Series(dtype=object))
+        comuns = antigas.index.intersection(novas.index)
+        alteradas = comuns[antigas.loc[comuns].to_numpy() != novas.loc[comuns].to_numpy()]
+
+        removidas = antigas[antigas.index.difference(novas.index).append(alteradas)]
+        inseridas = novas[novas.index.difference(antigas.index).append(alteradas)]
+        instrumentacao.contar("linhas reindexadas", len(removidas) + len(inseridas))
+
+        for descricao, quantidade in removidas.value_counts().items():
+            contagem = self._contagem[descricao]
+            contagem[tabela] -= quantidade
+            if contagem[tabela] <= 0:
+                del contagem[tabela]
+            if not contagem:
+                self._remover_descricao(descricao)
+
+        for descricao, quantidade in inseridas.value_counts().items():
+            if descricao not in self._contagem:
+                self._incluir_descricao(descricao)
+            contagem = self._contagem[descricao]
+            contagem[tabela] = contagem.get(tabela, 0) + quantidade
+
+        self._linhas[tabela] = novas
+
+    def _incluir_descricao(self, descricao):
+        self._contagem[descricao] = {}
+        for palavra in set(palavras(descricao)):
+            if palavra not in self._postagens:
+                self._postagens[palavra] = set()
+                self._vocabulario = None
+            self._postagens[palavra].add(descricao)
+
+    def _remover_descricao(self, descricao):
+        del self._contagem[descricao]
+        for palavra in set(palavras(descricao)):
+            postagem = self._postagens[palavra]
+            postagem.discard(descricao)
+            if not postagem:
+                del self._postagens[palavra]
+                self._vocabulario = None
+
+    def _palavras_do_indice(self, palavra):
+        """Palavras do índice que começam com a palavra ou, sem nenhuma, parecidas com ela."""
+        if self._vocabulario is None:
+            self._vocabulario = sorted(self._postagens)
+        vocabulario = self._vocabulario
+
+        inicio = bisect.bisect_left(vocabulario, palavra)
+        fim = bisect.bisect_left(vocabulario, palavra + "\U0010ffff", lo=inicio)
+        if fim > inicio or len(palavra) < MIN_LETRAS_APROXIMADA:
+            return vocabulario[inicio:fim]
+
+        # Erros de digitação: só entre as palavras com a mesma inicial
+        a = bisect.bisect_left(vocabulario, palavra[0])
+        b = bisect.bisect_left(vocabulario, palavra[0] + "\U0010ffff", lo=a)
+        return difflib.get_close_matches(palavra, vocabulario[a:b], n=5, cutoff=SEMELHANCA_MINIMA)
+
+    def descricoes(self, consulta):
+        """
+        Descrições que casam com todas as palavras da consulta.
+
+        Returns:
+            Dicionário {descrição: {tabela: linhas com essa descrição}}
+            (None se a consulta não tem palavras)
+        """
+        termos = palavras(consulta)
+        if not termos:
+            return None
+
+        with self._lock:
+            encontradas = None
+            for termo in sorted(set(termos), key=len, reverse=True):
+                casadas = set()
+                for palavra in self._palavras_do_indice(termo):
+                    casadas |= self._postagens[palavra]
+                encontradas = casadas if encontradas is None else encontradas & casadas
+                if not encontradas:
+                    break
+            return {descricao: dict(self._contagem[descricao]) for descricao in encontradas}
+
+    def filtrar(self, df, consulta):
+        """
+        Linhas do DataFrame cuja descrição casa com a consulta.
+
+        Descrições que não estão no índice (como as ocorrências projetadas
+        das recorrentes) são conferidas diretamente.
+        """
+        encontradas = self.descricoes(consulta)
+        if encontradas is None:
+            return df
+
+        # Uma decisão por descrição distinta, espalhada depois para as linhas
+        # (o False no fim é o das descrições vazias, de código -1)
+        codigos, distintas = pd.factorize(df["Descrição"])
+        termos = set(palavras(consulta))
+        with self._lock:
+            casam = np.array([
+                descricao in encontradas if descricao in self._contagem else _casa(termos, set(palavras(descricao)))
+                for descricao in map(str, distintas)
+            ] + [False], dtype=bool)
+        return df[casam[codigos]]
+
+
+def _casa(termos, palavras_descricao):
+    # Mesma regra do índice, aplicada a uma descrição avulsa
+    for termo in termos:
+        if any(p.startswith(termo) for p in palavras_descricao):
+            continue
+        if len(termo) < MIN_LETRAS_APROXIMADA or not difflib.get_close_matches(
+            termo, [p for p in palavras_descricao if p[:1] == termo[:1]], n=1, cutoff=SEMELHANCA_MINIMA
+        ):
+            return False
+    return True
+
+
+def indice_busca(chave, tabelas):
+    """
+    Índice de busca do repositório, atualizado com as tabelas informadas.
+
+    Args:
+        chave: identificação do repositório
+        tabelas: dicionário {tabela: (versão, DataFrame)}
+    """
+    with _indices_lock:
+        indice = _indices.setdefault(chave, IndiceBusca())
+    indice.sincronizar(tabelas)
+    return indice
+
+
+def descartar(chave):
+    """Esquece o índice do repositório."""
+    with _indices_lock:
+        _indices.pop(chave, None)
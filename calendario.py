@@ -0,0 +1,291 @@
+"""
+Calendário de vencimentos: visão mensal e mapas de calor anuais.
+
+As contas do mês (mais a próxima ocorrência dos modelos recorrentes ativos)
+são agregadas por dia com um único groupby. A figura pronta fica em memória
+por (ano, mês, versão dos dados, hoje): trocar de mês e voltar a um mês já
+visto não recalcula nada.
+
+Os mapas de calor (um ano inteiro ou os próximos 12 meses) saem de uma tabela
+diária de totais a pagar, calculada uma vez para o período todo, que inclui
+as ocorrências futuras dos modelos recorrentes.
+"""
+import calendar
+import collections
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+import instrumentacao
+from armazenamento import sem_duplicatas
+from recorrencia import ocorrencias_pendentes
+
+# Figuras e tabelas já montadas mantidas em memória
+MAX_FIGURAS = 36
+
+MESES = [
+    'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
+]
+
+# Semana no formato brasileiro (começando no domingo)
+DIAS_SEMANA = ['Dom', 'Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb']
+
+# Cores das células: (tem conta pendente, vencida, recorrente) -> cor
+CORES = {
+    (True, True, True): '#FF4500',    # Laranja escuro para contas vencidas recorrentes
+    (True, True, False): '#FF6B6B',   # Vermelho para vencidas normais
+    (True, False, True): '#FFA500',   # Laranja para contas a vencer recorrentes
+    (True, False, False): '#FFEB3B',  # Amarelo para contas a vencer normais
+}
+COR_PAGAS = '#4CAF50'      # Verde para dias com todas as contas pagas
+COR_SEM_CONTAS = '#FFFFFF'
+
+_figuras = collections.OrderedDict()
+_figuras_lock = threading.Lock()
+
+
+def _memorizado(chave, calcular):
+    """Valor guardado para a chave, ou calculado e guardado (os mais antigos saem primeiro)."""
+    with _figuras_lock:
+        if chave in _figuras:
+            _figuras.move_to_end(chave)
+            return _figuras[chave]
+
+    with instrumentacao.medir("agregar", f"Calendário ({chave[0]})"):
+        valor = calcular()
+
+    with _figuras_lock:
+        _figuras[chave] = valor
+        while len(_figuras) > MAX_FIGURAS:
+            _figuras.popitem(last=False)
+    return valor
+
+
+def agregar_por_dia(indice, recorrentes, ano, mes):
+    """
+    Resumo de cada dia do mês que tem contas (de qualquer status).
+
+    Returns:
+        DataFrame indexado pelo dia do mês com 'quantidade', 'total',
+        'pendente' (alguma conta pendente) e 'recorrente' (alguma recorrente)
+    """
+    inicio = pd.Timestamp(ano, mes, 1)
+    fim = inicio + pd.offsets.MonthEnd(1)
+
+    proximos = pd.to_datetime(recorrentes["Próximo Vencimento"], errors="coerce")
+    modelos = recorrentes["Ativa"] & proximos.between(inicio, fim)
+
+    # Uma linha por conta do mês, indexada pela data de vencimento
+    contas = indice.entre(inicio, fim, status=None)
+    eventos = pd.concat([
+        pd.DataFrame({
+            "Valor": contas["Valor"].to_numpy(),
+            "pendente": (contas["Status"] == "Pendente").to_numpy(),
+            "recorrente": (contas["Origem"] == "Recorrente").to_numpy(),
+        }, index=pd.DatetimeIndex(contas["Data de Vencimento"]).normalize()),
+        pd.DataFrame({
+            "Valor": recorrentes.loc[modelos, "Valor"].to_numpy(),
+            "pendente": True,
+            "recorrente": True,
+        }, index=pd.DatetimeIndex(proximos[modelos]).normalize()),
+    ])
+
+    return eventos.groupby(eventos.index.day).agg(
+        quantidade=("Valor", "size"),
+        total=("Valor", "sum"),
+        pendente=("pendente", "any"),
+        recorrente=("recorrente", "any"),
+    )
+
+
+def montar_figura(ano, mes, por_dia, hoje):
+    """Monta a tabela Plotly do mês a partir do resumo por dia."""
+    import plotly.graph_objects as go  # só quando um calendário é desenhado
+
+    semanas = calendar.Calendar(firstweekday=6).monthdayscalendar(ano, mes)
+    resumo = por_dia.to_dict("index")
+
+    cell_colors = [['#CCCCCC'] * 7]
+    cell_text = [DIAS_SEMANA]
+    for semana in semanas:
+        cores = []
+        textos = []
+        for dia in semana:
+            if dia == 0:
+                cores.append(COR_SEM_CONTAS)
+                textos.append('')
+            elif dia in resumo:
+                info = resumo[dia]
+                vencida = datetime.date(ano, mes, dia) < hoje
+                cores.append(CORES.get((info["pendente"], vencida, info["recorrente"]), COR_PAGAS))
+                textos.append(f"{dia}<br>{info['quantidade']} conta(s)<br>R$ {info['total']:.2f}")
+            else:
+                cores.append(COR_SEM_CONTAS)
+                textos.append(str(dia))
+        cell_colors.append(cores)
+        cell_text.append(textos)
+
+    fig = go.Figure()
+    fig.add_trace(go.Table(
+        header=dict(
+            values=[f"{MESES[mes - 1]} {ano}"] * 7,
+            fill_color='#4285F4',
+            align='center',
+            font=dict(color='white', size=16),
+            height=40
+        ),
+        cells=dict(
+            values=cell_text,
+            fill_color=cell_colors,
+            align='center',
+            font=dict(color='black', size=14),
+            height=60
+        )
+    ))
+    fig.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        height=500
+    )
+    return fig
+
+
+def figura_mes(indice, recorrentes, ano, mes, versao, hoje=None):
+    """
+    Figura do calendário do mês, reaproveitada enquanto os dados não mudam.
+
+    Args:
+        indice: consultas.IndiceVencimentos das contas
+        recorrentes: DataFrame de contas recorrentes
+        ano, mes: mês a exibir
+        versao: versão dos dados de contas e recorrentes (faz parte da chave)
+        hoje: data de referência para contas vencidas (padrão: hoje)
+    """
+    hoje = hoje or datetime.date.today()
+    return _memorizado(
+        ("mes", ano, mes, versao, hoje),
+        lambda: montar_figura(ano, mes, agregar_por_dia(indice, recorrentes, ano, mes), hoje),
+    )
+
+
+def tabela_diaria(indice, recorrentes, inicio, fim):
+    """
+    Totais a pagar de cada dia do período.
+
+    Soma as contas pendentes e todas as ocorrências dos modelos recorrentes
+    ativos até o fim do período que ainda não viraram conta.
+
+    Returns:
+        DataFrame indexado por todos os dias de inicio a fim, com 'total' e
+        'quantidade' (zero nos dias sem contas)
+    """
+    inicio, fim = pd.Timestamp(inicio).normalize(), pd.Timestamp(fim).normalize()
+    pendentes = indice.entre(inicio, fim)
+    projetadas, _ = ocorrencias_pendentes(recorrentes, fim)
+
+    valores = [pd.Series(pendentes["Valor"].to_numpy(), index=pd.DatetimeIndex(pendentes["Data de Vencimento"]))]
+    if not projetadas.empty:
+        projetadas = sem_duplicatas(projetadas, indice.contas)
+        valores.append(pd.Series(projetadas["Valor"].to_numpy(), index=pd.DatetimeIndex(projetadas["Data de Vencimento"])))
+
+    valores = pd.concat(valores)
+    valores.index = valores.index.normalize()
+    valores = valores[(valores.index >= inicio) & (valores.index <= fim)]
+
+    por_dia = valores.groupby(level=0).agg(["sum", "size"]).rename(columns={"sum": "total", "size": "quantidade"})
+    return por_dia.reindex(pd.date_range(inicio, fim, freq="D"), fill_value=0)
+
+
+def montar_mapa_calor(diaria, titulo):
+    """
+    Mapa de calor do período da tabela diária: uma coluna por semana e uma
+    linha por dia da semana (domingo no topo), com o mês marcado no eixo.
+    """
+    import plotly.graph_objects as go  # só quando um calendário é desenhado
+
+    datas = diaria.index
+    dia_semana = (datas.dayofweek.to_numpy() + 1) % 7  # domingo = 0
+    primeiro_domingo = datas[0] - pd.Timedelta(days=int(dia_semana[0]))
+    semana = (datas - primeiro_domingo).days.to_numpy() // 7
+
+    n_semanas = int(semana[-1]) + 1
+    totais = np.full((7, n_semanas), np.nan)
+    quantidades = np.zeros((7, n_semanas), dtype=int)
+    rotulos = np.full((7, n_semanas), "", dtype=object)
+    totais[dia_semana, semana] = diaria["total"].to_numpy()
+    quantidades[dia_semana, semana] = diaria["quantidade"].to_numpy()
+    rotulos[dia_semana, semana] = datas.strftime('%d/%m/%Y')
+
+    # Dias sem contas ficam em branco
+    totais[quantidades == 0] = np.nan
+
+    # Uma marca no eixo x na semana em que cada mês começa
+    inicios_mes = datas[datas.day == 1]
+    if len(inicios_mes) == 0 or inicios_mes[0] != datas[0]:
+        inicios_mes = datas[:1].append(inicios_mes)
+    posicoes = ((inicios_mes - primeiro_domingo).days // 7).tolist()
+    nomes = [f"{MESES[data.month - 1][:3]}/{data.year % 100:02d}" for data in inicios_mes]
+
+    fig = go.Figure(go.Heatmap(
+        z=totais,
+        customdata=np.dstack([rotulos, quantidades]),
+        x=list(range(n_semanas)),
+        y=DIAS_SEMANA,
+        colorscale="YlOrRd",
+        xgap=2,
+        ygap=2,
+        hoverongaps=False,
+        hovertemplate="%{customdata[0]}<br>%{customdata[1]} conta(s)<br>R$ %{z:,.2f}<extra></extra>",
+        colorbar=dict(title="R$"),
+    ))
+    fig.update_layout(
+        title=titulo,
+        xaxis=dict(tickmode="array", tickvals=posicoes, ticktext=nomes, showgrid=False),
+        yaxis=dict(autorange="reversed", showgrid=False),
+        margin=dict(l=0, r=0, t=40, b=0),
+        height=260,
+    )
+    return fig
+
+
+def periodo_anual(ano):
+    """Primeiro e último dia do ano."""
+    return pd.Timestamp(ano, 1, 1), pd.Timestamp(ano, 12, 31)
+
+
+def periodo_12_meses(hoje=None):
+    """Do primeiro dia do mês atual ao último dia do 12º mês."""
+    inicio = pd.Timestamp(hoje or datetime.date.today()).normalize().replace(day=1)
+    return inicio, inicio + pd.DateOffset(months=12) - pd.Timedelta(days=1)
+
+
+def mapa_calor(indice, recorrentes, inicio, fim, versao, titulo):
+    """
+    Tabela diária e figura do mapa de calor do período, reaproveitadas
+    enquanto os dados não mudam.
+
+    Returns:
+        Tupla (figura, tabela diária)
+    """
+    def calcular():
+        diaria = tabela_diaria(indice, recorrentes, inicio, fim)
+        return montar_mapa_calor(diaria, titulo), diaria
+
+    return _memorizado(("periodo", inicio, fim, versao, titulo), calcular)
+
+
+def totais_mensais(diaria):
+    """Total e quantidade de contas por mês da tabela diária."""
+    return diaria.resample("MS").sum()
+
+
+def anos_disponiveis(*datas, hoje=None):
+    """Anos entre a conta mais antiga e a mais distante (e pelo menos o ano atual e o próximo)."""
+    ano_atual = (hoje or datetime.date.today()).year
+    anos = [serie.dropna().dt.year for serie in datas if len(serie)]
+    anos = pd.concat(anos) if anos else pd.Series(dtype=int)
+    primeiro = min(int(anos.min()), ano_atual) if len(anos) else ano_atual
+    ultimo = max(int(anos.max()), ano_atual + 1) if len(anos) else ano_atual + 1
+    return list(range(primeiro, ultimo + 1))
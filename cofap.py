@@ -0,0 +1,102 @@
+"""
+Livro-razão dos serviços Cofap.
+
+A coluna 'Situação' é o saldo acumulado: pedidos de compra somam ao saldo e
+serviços prestados (diárias) subtraem. O livro mantém os lançamentos em
+ordem de data (empates pela ordem de inclusão) com os saldos já acumulados,
+de modo que incluir um lançamento retroativo ou excluir um lote só recalcula
+os lançamentos posteriores ao ponto alterado.
+"""
+import numpy as np
+import pandas as pd
+
+
+def movimentos(servicos):
+    """Efeito de cada lançamento no saldo: +valor para pedidos de compra, -valor para serviços."""
+    pedido = servicos["Pedidos de compra"]
+    eh_pedido = pedido.notna() & (pedido.astype(str).str.strip() != "")
+    valor = pd.to_numeric(servicos["Valor diaria"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    return np.where(eh_pedido.to_numpy(), valor, -valor)
+
+
+def saldos_acumulados(movimentos, saldo_inicial):
+    """Saldo após cada lançamento, a partir do saldo anterior ao primeiro."""
+    return saldo_inicial + np.cumsum(movimentos)
+
+
+class LivroCofap:
+    """
+    Lançamentos Cofap ordenados por data, com o saldo acumulado de cada um.
+
+    Pode ser montado com a tabela inteira ou só com um trecho final dela,
+    desde que o trecho comece em um lançamento não afetado pela alteração:
+    o saldo anterior ao trecho é deduzido do primeiro lançamento.
+    """
+
+    def __init__(self, servicos):
+        self.ordenado = servicos.sort_values("Dia", kind="stable")
+        self.movimentos = movimentos(self.ordenado)
+        self.saldos = pd.to_numeric(self.ordenado["Situação"], errors="coerce").to_numpy(dtype=float)
+        self.dias = self.ordenado["Dia"].to_numpy(dtype="datetime64[ns]")
+
+        self.saldo_inicial = 0.0
+        if len(self.ordenado) and not np.isnan(self.saldos[0]):
+            self.saldo_inicial = float(self.saldos[0] - self.movimentos[0])
+
+    @property
+    def saldo_atual(self):
+        """Saldo após o último lançamento."""
+        return float(self.saldos[-1]) if len(self.saldos) else self.saldo_inicial
+
+    def _saldo_antes(self, posicao):
+        return float(self.saldos[posicao - 1]) if posicao > 0 else self.saldo_inicial
+
+    def _posicao(self, dia):
+        # Depois de todos os lançamentos do mesmo dia
+        return int(np.searchsorted(self.dias, np.datetime64(pd.Timestamp(dia), "ns"), side="right"))
+
+    def saldo_em(self, dia):
+        """Saldo ao fim do dia (após todos os lançamentos até ele), base de um lançamento nessa data."""
+        return self._saldo_antes(self._posicao(dia))
+
+    def lancar(self, linha):
+        """
+        Calcula a inclusão de um lançamento.
+
+        O novo lançamento entra depois de todos os do mesmo dia, e os
+        posteriores a ele têm o saldo deslocado pelo seu movimento.
+
+        Args:
+            linha: dicionário com as colunas da tabela de serviços
+
+        Returns:
+            Tupla (situacao, ajustes): saldo do novo lançamento e Series
+            {id: novo saldo} dos lançamentos posteriores
+        """
+        movimento = movimentos(pd.DataFrame([linha]))[0]
+        posicao = self._posicao(linha["Dia"])
+
+        situacao = self._saldo_antes(posicao) + movimento
+        ajustes = pd.Series(self.saldos[posicao:] + movimento, index=self.ordenado.index[posicao:])
+        return situacao, ajustes
+
+    def excluir(self, ids):
+        """
+        Calcula a exclusão de um lote de lançamentos.
+
+        Returns:
+            Series {id: novo saldo} dos lançamentos mantidos a partir do
+            primeiro excluído (vazia se nenhum id pertence ao livro)
+        """
+        excluidos = self.ordenado.index.isin(ids)
+        if not excluidos.any():
+            return pd.Series(dtype=float)
+
+        inicio = int(np.argmax(excluidos))
+        mantidos = ~excluidos[inicio:]
+        saldos = saldos_acumulados(self.movimentos[inicio:][mantidos], self._saldo_antes(inicio))
+        return pd.Series(saldos, index=self.ordenado.index[inicio:][mantidos])
+
+    def recalcular(self):
+        """Refaz todos os saldos a partir do saldo inicial (Series {id: saldo})."""
+        return pd.Series(saldos_acumulados(self.movimentos, self.saldo_inicial), index=self.ordenado.index)
@@ -0,0 +1,171 @@
+"""
+Consultas de contas por data de vencimento.
+
+As contas são separadas por status e cada parte fica ordenada pela data de
+vencimento, com a soma acumulada dos valores. "Vencem entre A e B",
+"vencidas em D" e "vencem nesta semana" viram buscas binárias (fatias) em
+vez de varrer a tabela inteira, e os totais de um período saem da soma
+acumulada. O índice é montado uma vez por versão da tabela e compartilhado
+por todas as abas.
+
+As listas da aba Contas são ordenadas e paginadas aqui (a busca fica no
+módulo busca), de modo que a tela só monta os widgets da página exibida.
+"""
+import collections
+import threading
+
+import numpy as np
+import pandas as pd
+
+import instrumentacao
+
+# Índices (um por versão da tabela de contas) mantidos em memória
+MAX_INDICES = 4
+
+# Contas exibidas por página nas listas da aba Contas
+POR_PAGINA = 20
+
+_indices = collections.OrderedDict()
+_indices_lock = threading.Lock()
+
+
+class _Particao:
+    """Contas de um status, ordenadas por vencimento (as sem data ficam no fim)."""
+
+    def __init__(self, contas):
+        datas = contas["Data de Vencimento"]
+        ordem = np.argsort(datas.to_numpy(dtype="datetime64[ns]"), kind="stable")
+        self.contas = contas.iloc[ordem]
+        self.datas = self.contas["Data de Vencimento"].dropna().to_numpy(dtype="datetime64[ns]")
+        valores = pd.to_numeric(self.contas["Valor"], errors="coerce").fillna(0).to_numpy(dtype=float)
+        self.acumulado = np.concatenate([[0.0], np.cumsum(valores)])
+
+    def limites(self, inicio=None, fim=None, fim_inclusivo=True):
+        """
+        Posições [i, j) das contas com inicio <= vencimento <= fim (ou < fim).
+        As contas sem vencimento só entram quando não há nenhum limite.
+        """
+        i = 0 if inicio is None else int(np.searchsorted(self.datas, _data(inicio), side="left"))
+        if fim is not None:
+            j = int(np.searchsorted(self.datas, _data(fim), side="right" if fim_inclusivo else "left"))
+        elif inicio is not None:
+            j = len(self.datas)
+        else:
+            j = len(self.contas)
+        return i, max(i, j)
+
+
+def _data(valor):
+    return np.datetime64(pd.Timestamp(valor).normalize(), "ns")
+
+
+class IndiceVencimentos:
+    """
+    Contas por status e data de vencimento.
+
+    Os limites das consultas são datas (o horário é ignorado). Sem status,
+    a consulta junta todos os status, em ordem de vencimento.
+    """
+
+    def __init__(self, contas):
+        self.contas = contas
+        self._particoes = {
+            status: _Particao(grupo) for status, grupo in contas.groupby("Status", sort=False, dropna=False)
+        }
+
+    def _particoes_de(self, status):
+        if status is None:
+            return list(self._particoes.values())
+        return [self._particoes[status]] if status in self._particoes else []
+
+    def _consultar(self, status, inicio=None, fim=None, fim_inclusivo=True):
+        fatias = []
+        for particao in self._particoes_de(status):
+            i, j = particao.limites(inicio, fim, fim_inclusivo)
+            fatias.append(particao.contas.iloc[i:j])
+        if not fatias:
+            return self.contas.iloc[0:0]
+        if len(fatias) == 1:
+            return fatias[0]
+        return pd.concat(fatias).sort_values("Data de Vencimento", kind="stable")
+
+    def com_status(self, status="Pendente"):
+        """Todas as contas do status, em ordem de vencimento."""
+        return self._consultar(status)
+
+    def entre(self, inicio, fim, status="Pendente"):
+        """Contas que vencem de inicio a fim (inclusive)."""
+        return self._consultar(status, inicio, fim)
+
+    def ate(self, fim, status="Pendente"):
+        """Contas que vencem até fim (inclusive), inclusive as atrasadas."""
+        return self._consultar(status, fim=fim)
+
+    def vencidas(self, data, status="Pendente"):
+        """Contas com vencimento anterior a data."""
+        return self._consultar(status, fim=data, fim_inclusivo=False)
+
+    def a_vencer(self, data, status="Pendente"):
+        """Contas que vencem em data ou depois (sem as que não têm vencimento)."""
+        return self._consultar(status, inicio=data)
+
+    def da_semana(self, hoje, status="Pendente"):
+        """Contas que vencem de hoje até daqui a 7 dias."""
+        hoje = pd.Timestamp(hoje)
+        return self.entre(hoje, hoje + pd.Timedelta(days=7), status)
+
+    def soma(self, inicio=None, fim=None, status="Pendente"):
+        """Soma dos valores das contas que vencem no período (sem limites: todas do status)."""
+        total = 0.0
+        for particao in self._particoes_de(status):
+            i, j = particao.limites(inicio, fim)
+            total += particao.acumulado[j] - particao.acumulado[i]
+        return float(total)
+
+
+def indice_vencimentos(contas, versao):
+    """
+    Índice das contas, reaproveitado enquanto a versão não muda.
+
+    Args:
+        contas: DataFrame de contas
+        versao: identificação da versão da tabela (inclua o repositório
+            se houver mais de um)
+    """
+    with _indices_lock:
+        if versao in _indices:
+            _indices.move_to_end(versao)
+            return _indices[versao]
+
+    with instrumentacao.medir("agregar", "Índice de vencimentos"):
+        indice = IndiceVencimentos(contas)
+    instrumentacao.contar("linhas indexadas", len(contas))
+
+    with _indices_lock:
+        _indices[versao] = indice
+        while len(_indices) > MAX_INDICES:
+            _indices.popitem(last=False)
+    return indice
+
+
+def ordenar(contas, coluna, decrescente=False):
+    """Contas ordenadas pela coluna (empates na ordem atual, vazios no fim)."""
+    return contas.sort_values(coluna, ascending=not decrescente, kind="stable", na_position="last")
+
+
+def paginar(contas, pagina, por_pagina=POR_PAGINA):
+    """
+    Uma página da lista.
+
+    Args:
+        contas: DataFrame já filtrado e ordenado
+        pagina: número da página, a partir de 1 (ajustado ao intervalo válido)
+        por_pagina: contas por página
+
+    Returns:
+        Tupla (contas da página, página ajustada, total de páginas)
+    """
+    paginas = max(1, -(-len(contas) // por_pagina))
+    pagina = min(max(1, int(pagina)), paginas)
+    inicio = (pagina - 1) * por_pagina
+    return contas.iloc[inicio:inicio + por_pagina], pagina, paginas
@@ -1,12 +1,25 @@
 import streamlit as st
 import pandas as pd
 import datetime
-import os
 import base64
-import io
 import calendar
-import plotly.graph_objects as go
-from fpdf import FPDF
+import functools
+
+import analise
+import armazenamento
+import busca
+import calendario
+import cofap
+import consultas
+import exportacao
+import importacao
+import inicializacao
+import instrumentacao
+import livros
+import previsao
+import recorrencia
+import relatorios
+import resumo
 
 # Inicialização do session_state para edição inline
 if 'modo_edicao' not in st.session_state:
@@ -16,53 +29,71 @@ if 'index_edicao' not in st.session_state:
 if 'df_edicao' not in st.session_state:
     st.session_state['df_edicao'] = 'pendente'  # Pode ser 'pendente' ou 'historico'
 
-# Definir os caminhos dos arquivos CSV
-CSV_FILE = "contas_a_pagar.csv"
-HISTORICO_FILE = "historico_pagamentos.csv"
-SERVICOS_FILE = "servicos_cofap.csv"  # Novo arquivo para serviços da Cofap
-# Definir o caminho do arquivo CSV para contas recorrentes
-RECORRENTES_FILE = "contas_recorrentes.csv"
+# Instrumentação opcional: tempos e contadores desta execução, exibidos no
+# painel lateral e exportáveis em JSON
+instrumentacao_ativa = st.sidebar.toggle(
+    "🛠️ Instrumentação", value=instrumentacao.ATIVA_POR_PADRAO, key="instrumentacao"
+)
+execucoes = st.session_state.setdefault("execucoes_instrumentadas", [])
+# As gravações terminam em st.rerun(), que interrompe a execução antes do
+# painel: ela é encerrada e guardada aqui, no começo da seguinte
+interrompida = st.session_state.pop("execucao_em_andamento", None)
+if interrompida is not None and interrompida.total is None:
+    interrompida.encerrar(interrompida=True)
+    execucoes.append(interrompida.como_dict())
+st.session_state["execucao_em_andamento"] = instrumentacao.iniciar(instrumentacao_ativa)
 
-# Carregar ou criar o arquivo de contas recorrentes
-if os.path.exists(RECORRENTES_FILE):
-    recorrentes_df = pd.read_csv(RECORRENTES_FILE, parse_dates=["Próximo Vencimento"])
-else:
-    recorrentes_df = pd.DataFrame(columns=[
-        "Descrição", "Valor", "Próximo Vencimento", "Frequência", 
-        "Dia Vencimento", "Última Geração", "Ativa"
-    ])
-    # Salvar o arquivo vazio
-    recorrentes_df.to_csv(RECORRENTES_FILE, index=False)
-# Carregar dados dos serviços Cofap
-if os.path.exists(SERVICOS_FILE):
-    servicos_df = pd.read_csv(SERVICOS_FILE)
-    
-    # Converter a coluna 'Dia' para datetime
-    if 'Dia' in servicos_df.columns:
-        servicos_df['Dia'] = pd.to_datetime(servicos_df['Dia'], errors='coerce')
-else:
-    # Estrutura inicial do DataFrame
-    servicos_df = pd.DataFrame(columns=[
-        "Funcionario", "Equipamento", "Dia", "Valor diaria", 
-        "Pedidos de compra", "Situação"
-    ])
-    
-    # Inserir dados do seu PDF aqui (você também pode fazer isso manualmente pelo app)
-    # Exemplo dos primeiros registros:
-    dados_iniciais = [
-        {"Funcionario": "Richard", "Equipamento": "Empilhadeira", "Dia": "04/01/2024", 
-         "Valor diaria": 4000.00, "Pedidos de compra": "", "Situação": 1500.00},
-        {"Funcionario": "Richard", "Equipamento": "Empilhadeira", "Dia": "05/01/2024", 
-         "Valor diaria": 4000.00, "Pedidos de compra": "", "Situação": -2500.00},
-        # ... você pode adicionar mais dados aqui se quiser
-    ]
-    
-    # Criar DataFrame e salvar
-    if dados_iniciais:
-        temp_df = pd.DataFrame(dados_iniciais)
-        servicos_df = pd.concat([servicos_df, temp_df], ignore_index=True)
-        servicos_df['Dia'] = pd.to_datetime(servicos_df['Dia'], errors='coerce')
-        servicos_df.to_csv(SERVICOS_FILE, index=False)
+# Livro (empresa) exibido. Edições e exclusões em andamento apontam para
+# linhas de um livro, então são descartadas quando o livro muda
+ESTADO_DO_LIVRO = [
+    'modo_edicao', 'index_edicao', 'df_edicao', 'original_edicao',
+    'excluir_conta', 'excluir_indice', 'excluir_tipo', 'excluir_descricao', 'excluir_original',
+    'editar_recorrente', 'indice_recorrente', 'original_recorrente', 'excluir_recorrente', 'descricao_recorrente',
+    'confirmar_exclusao_multipla', 'versao_servicos', 'registros_selecionados', 'anos_arquivados', 'periodo_analise',
+]
+
+def trocar_livro():
+    for chave in list(st.session_state):
+        if chave in ESTADO_DO_LIVRO or chave.startswith(("lote_", "pagina_")):
+            del st.session_state[chave]
+
+# Roda antes da execução (como callback), quando o seletor de livro ainda
+# pode receber o livro criado
+def criar_livro():
+    nome = st.session_state['nome_novo_livro'].strip()
+    try:
+        livros.criar(nome)
+    except livros.LivroInvalido as erro:
+        st.session_state['erro_livro'] = str(erro)
+    else:
+        trocar_livro()
+        st.session_state['livro'] = nome
+        st.session_state['nome_novo_livro'] = ""
+
+livros_disponiveis = livros.listar()
+nome_livro = st.sidebar.selectbox("📒 Livro", list(livros_disponiveis), key="livro", on_change=trocar_livro)
+with st.sidebar.expander("➕ Novo livro"):
+    st.text_input("Nome da empresa", key="nome_novo_livro")
+    st.button("Criar livro", key="criar_livro", on_click=criar_livro)
+    if 'erro_livro' in st.session_state:
+        st.error(f"⚠️ {st.session_state.pop('erro_livro')}")
+diretorio_livro = livros_disponiveis[nome_livro]
+chave_livro = livros.chave(diretorio_livro)
+
+# Interface do Dashboard (o título aparece antes de carregar os dados)
+st.title("💰 Dashboard de Contas a Pagar")
+if len(livros_disponiveis) > 1:
+    st.caption(f"📒 {nome_livro}")
+
+# Repositório de dados do livro (SQLite por padrão; CSV com
+# CONTAS_ARMAZENAMENTO=csv). A preparação (tabela Cofap inicial, geração das
+# recorrentes atrasadas) roda uma vez por processo e livro, e de novo só
+# quando o dia vira ou os modelos mudam.
+repo = inicializacao.iniciar(diretorio=diretorio_livro)
+
+# Carregar contas recorrentes e serviços Cofap
+recorrentes_df = repo.carregar("recorrentes")
+servicos_df = repo.carregar("servicos")
 
 # Adicione esta função auxiliar no início do arquivo, após as importações
 
@@ -129,386 +160,191 @@ def export_to_csv(df, filename):
 
 # Função para exportar dados para PDF
 def export_to_pdf(df, filename):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    
-    # Adicionar título
-    pdf.cell(200, 10, txt="Relatório de Contas a Pagar", ln=True, align='C')
-    pdf.ln(10)
-    
-    # Adicionar data de geração
-    pdf.cell(200, 10, txt=f"Gerado em: {datetime.date.today().strftime('%d/%m/%Y')}", ln=True)
-    pdf.ln(10)
-    
-    # Cabeçalhos
-    col_width = 40
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(col_width, 10, "Descrição", border=1)
-    pdf.cell(col_width, 10, "Valor (R$)", border=1)
-    pdf.cell(col_width, 10, "Vencimento", border=1)
-    pdf.cell(col_width, 10, "Status", border=1)
-    pdf.ln()
-    
-    # Dados
-    pdf.set_font("Arial", size=10)
-    for _, row in df.iterrows():
-        pdf.cell(col_width, 10, str(row['Descrição']), border=1)
-        pdf.cell(col_width, 10, f"{row['Valor']:.2f}", border=1)
-        
-        # Corrigir o tratamento da data de vencimento
-        data_vencimento = row['Data de Vencimento']
-        if isinstance(data_vencimento, pd.Timestamp):
-            # Se for um objeto Timestamp do pandas, use o método .date()
-            data_str = data_vencimento.date().strftime('%d/%m/%Y')
-        else:
-            # Se for uma string ou outro tipo, tente converter para datetime
-            try:
-                data_str = pd.to_datetime(data_vencimento).strftime('%d/%m/%Y')
-            except:
-                data_str = str(data_vencimento)
-        
-        pdf.cell(col_width, 10, data_str, border=1)
-        pdf.cell(col_width, 10, str(row['Status']), border=1)
-        pdf.ln()
-    
-    # Salvar PDF em buffer
-    pdf_buffer = io.BytesIO()
-    pdf.output(pdf_buffer)
-    pdf_buffer.seek(0)
+    pdf_data = relatorios.gerar_pdf(
+        "Relatório de Contas a Pagar",
+        ["Descrição", "Valor (R$)", "Vencimento", "Status"],
+        relatorios.linhas_contas(df, formatar_valor=lambda valor: f"{valor:.2f}"),
+        larguras=[40] * 4,
+    )
     
     # Converter para base64
-    b64 = base64.b64encode(pdf_buffer.read()).decode()
+    b64 = base64.b64encode(pdf_data).decode()
     href = f'<a href="data:application/pdf;base64,{b64}" download="{filename}">Download PDF</a>'
     return href
 
-# Função auxiliar para calcular próxima data
-def calcular_proxima_data(data_atual, frequencia, dia_vencimento):
-    data_atual = pd.to_datetime(data_atual)
-    
-    if frequencia == "Mensal":
-        proximo_mes = data_atual.month + 1
-        proximo_ano = data_atual.year
-        
-        if proximo_mes > 12:
-            proximo_mes = 1
-            proximo_ano += 1
-    elif frequencia == "Trimestral":
-        proximo_mes = data_atual.month + 3
-        proximo_ano = data_atual.year
-        
-        while proximo_mes > 12:
-            proximo_mes -= 12
-            proximo_ano += 1
-    elif frequencia == "Semestral":
-        proximo_mes = data_atual.month + 6
-        proximo_ano = data_atual.year
-        
-        while proximo_mes > 12:
-            proximo_mes -= 12
-            proximo_ano += 1
-    else:  # Anual
-        proximo_mes = data_atual.month
-        proximo_ano = data_atual.year + 1
-    
-    # Garantir que o dia seja válido
-    ultimo_dia = calendar.monthrange(proximo_ano, proximo_mes)[1]
-    dia_efetivo = min(dia_vencimento, ultimo_dia)
+# Acompanhar uma exportação em segundo plano: barra de progresso enquanto
+# gera e botão de download quando fica pronta
+def painel_exportacao(chave, nome_arquivo, rotulo="⬇️ Baixar PDF", mime="application/pdf"):
+    tarefa = exportacao.tarefa(chave)
+    if tarefa is None:
+        return
     
-    return datetime.date(proximo_ano, proximo_mes, dia_efetivo)
+    if not tarefa.pronta:
+        st.fragment(andamento_exportacao, run_every=1)(chave)
+    elif tarefa.erro is not None:
+        st.error(f"Erro ao gerar o relatório: {tarefa.erro}")
+    else:
+        st.download_button(label=rotulo, data=tarefa.dados, file_name=nome_arquivo, mime=mime)
 
-def create_calendar_view(df, year, month):
-    # Filtrar contas recorrentes do mês e ano específicos
-    hoje = datetime.date.today()
-    contas_recorrentes_pendentes = recorrentes_df[
-        (recorrentes_df["Ativa"] == True) & 
-        (pd.to_datetime(recorrentes_df["Próximo Vencimento"]).dt.month == month) &
-        (pd.to_datetime(recorrentes_df["Próximo Vencimento"]).dt.year == year)
-    ]
+def andamento_exportacao(chave):
+    tarefa = exportacao.tarefa(chave)
+    if tarefa is None or tarefa.pronta:
+        # Terminou: recarrega a página para trocar a barra pelo botão de download
+        st.rerun()
+    st.progress(tarefa.progresso, text=f"Gerando relatório... {tarefa.feitas}/{tarefa.total} linha(s)")
 
-    # Preparar lista de contas recorrentes
-    contas_recorrentes = []
-    for _, row in contas_recorrentes_pendentes.iterrows():
-        conta_recorrente = pd.DataFrame({
-            "Descrição": [f"{row['Descrição']} (Recorrente)"],
-            "Valor": [row['Valor']],
-            "Data de Vencimento": [row['Próximo Vencimento']],
-            "Status": ["Pendente"],
-            "Origem": ["Recorrente"]
-        })
-        contas_recorrentes.append(conta_recorrente)
+# Opções de ordenação das listas da aba Contas: rótulo -> (coluna, decrescente)
+ORDENACOES_CONTAS = {
+    "Vencimento (mais antigo primeiro)": ("Data de Vencimento", False),
+    "Vencimento (mais recente primeiro)": ("Data de Vencimento", True),
+    "Maior valor": ("Valor", True),
+    "Menor valor": ("Valor", False),
+    "Descrição": ("Descrição", False),
+}
+ORDENACOES_PAGAS = {
+    "Pagamento (mais recente primeiro)": ("Data de Pagamento", True),
+    "Pagamento (mais antigo primeiro)": ("Data de Pagamento", False),
+    **ORDENACOES_CONTAS,
+}
 
-    # Combinar DataFrames
-    if not contas_recorrentes_pendentes.empty:
-        df = pd.concat([df] + contas_recorrentes, ignore_index=True)
-    
-    num_days = calendar.monthrange(year, month)[1]
-    cal_df = pd.DataFrame({'day': range(1, num_days + 1)})
-    
-    # Filtrar contas do mês e ano específicos
-    month_df = df[
-        (df['Data de Vencimento'].dt.month == month) & 
-        (df['Data de Vencimento'].dt.year == year)
-    ]
-    
-    # Inicializar figura
-    fig = go.Figure()
-    
-    # Criar um calendário como uma tabela
-    # Nome dos meses em português
-    meses_pt = [
-        'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
-        'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
-    ]
-    month_name = meses_pt[month - 1]
-    
-    # Semana no formato brasileiro (começando no domingo)
-    weekdays = ['Dom', 'Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb']
-    
-    # Pré-configurar o calendário para começar no domingo (6)
-    calendar.setfirstweekday(6)  # 6 = domingo
-    cal = calendar.monthcalendar(year, month)
-    
-    
-    # Preparar dados para o calendário
-    cell_values = [weekdays]
-    for week in cal:
-        week_data = []
-        for day in week:
-            if day == 0:
-                week_data.append("")
-            else:
-                week_data.append(day)
-        cell_values.append(week_data)
-    
-    # Organizar dados por dia
-    contas_por_dia = {}
-    for _, row in month_df.iterrows():
-        day = row['Data de Vencimento'].day
-        if day not in contas_por_dia:
-            contas_por_dia[day] = []
-        contas_por_dia[day].append(row)
-    
-    # Criar cores para o calendário
-    cell_colors = []
-    cell_text = []
-    
-    # Cabeçalho
-    cell_colors.append(['#CCCCCC'] * 7)
-    cell_text.append(weekdays)
-    
-    # Calcular cores para células baseadas em contas
-    hoje = datetime.date.today()
-    
-    for week in cal:
-        week_colors = []
-        week_text = []
-        for day in week:
-            if day == 0:
-                week_colors.append('#FFFFFF')
-                week_text.append('')
-            else:
-                # Verificar se este dia tem contas
-                if day in contas_por_dia:
-                    # Verificar status das contas
-                    status_list = [conta['Status'] for conta in contas_por_dia[day]]
-                    origem_list = [conta.get('Origem', 'Manual') for conta in contas_por_dia[day]]
-                    
-                    if 'Pendente' in status_list:
-                        current_date = datetime.date(year, month, day)
-                        if current_date < hoje:
-                            # Contas vencidas
-                            if 'Recorrente' in origem_list:
-                                week_colors.append('#FF4500')  # Laranja escuro para contas vencidas recorrentes
-                            else:
-                                week_colors.append('#FF6B6B')  # Vermelho para vencidas normais
-                        else:
-                            # Contas a vencer
-                            if 'Recorrente' in origem_list:
-                                week_colors.append('#FFA500')  # Laranja para contas a vencer recorrentes
-                            else:
-                                week_colors.append('#FFEB3B')  # Amarelo para contas a vencer normais
-                    else:
-                        # Todas as contas pagas
-                        week_colors.append('#4CAF50')  # Verde para pagas
-                        
-                    # Adicionar número de contas ao texto
-                    num_contas = len(contas_por_dia[day])
-                    total_valor = sum(conta['Valor'] for conta in contas_por_dia[day])
-                    week_text.append(f"{day}<br>{num_contas} conta(s)<br>R$ {total_valor:.2f}")
-                else:
-                    week_colors.append('#FFFFFF')  # Branco para dias sem contas
-                    week_text.append(str(day))
-        cell_colors.append(week_colors)
-        cell_text.append(week_text)
+# Busca, ordenação e paginação de uma lista: só as contas da página exibida
+# viram widgets, então o custo da tela não cresce com o tamanho da lista
+def pagina_da_lista(contas, chave, ordenacoes):
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        texto_busca = st.text_input("🔎 Buscar pela descrição", key=f"busca_{chave}")
+    with col2:
+        ordem = st.selectbox("Ordenar por", list(ordenacoes), key=f"ordem_{chave}")
     
-    # Criar tabela
-    fig.add_trace(go.Table(
-        header=dict(
-            values=[f"{month_name} {year}"] * 7,
-            fill_color='#4285F4',
-            align='center',
-            font=dict(color='white', size=16),
-            height=40
-        ),
-        cells=dict(
-            values=cell_values,
-            fill_color=cell_colors,
-            align='center',
-            font=dict(color='black', size=14),
-            height=60
-        )
-    ))
+    coluna, decrescente = ordenacoes[ordem]
+    with instrumentacao.medir("agregar", f"Lista {chave}"):
+        filtradas = consultas.ordenar(indice_textos.filtrar(contas, texto_busca), coluna, decrescente)
+    instrumentacao.contar("linhas filtradas nas listas", len(contas))
     
-    # Ajustar layout
-    fig.update_layout(
-        margin=dict(l=0, r=0, t=0, b=0),
-        height=500
-    )
+    # Ajustar a página guardada antes de criar o widget (a busca pode ter
+    # reduzido o número de páginas)
+    chave_pagina = f"pagina_{chave}"
+    pagina, numero, paginas = consultas.paginar(filtradas, st.session_state.get(chave_pagina, 1))
+    st.session_state[chave_pagina] = numero
+    if paginas > 1:
+        st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, step=1, key=chave_pagina)
+        pagina, numero, paginas = consultas.paginar(filtradas, st.session_state[chave_pagina])
     
-    return fig
-
-# Carregar dados existentes
-if os.path.exists(HISTORICO_FILE):
-    historico = pd.read_csv(HISTORICO_FILE)
-
-    # Se a coluna "Data de Pagamento" não existir, adiciona automaticamente
-    if "Data de Pagamento" not in historico.columns:
-        historico["Data de Pagamento"] = pd.NaT
-else:
-    historico = pd.DataFrame(columns=["Descrição", "Valor", "Data de Vencimento", "Data de Pagamento"])
+    if filtradas.empty:
+        st.info("Nenhuma conta encontrada.")
+    else:
+        inicio = (numero - 1) * consultas.POR_PAGINA
+        st.caption(f"Mostrando {inicio + 1}–{inicio + len(pagina)} de {len(filtradas)} conta(s)")
+    return pagina, filtradas
 
-# Converter "Data de Pagamento" para formato de data
-historico["Data de Pagamento"] = pd.to_datetime(historico["Data de Pagamento"], errors="coerce")
-# Gerar contas recorrentes automaticamente antes de carregar o DataFrame
-hoje = pd.Timestamp(datetime.date.today())
+ACOES_LOTE_PENDENTES = ["✅ Pagar", "📅 Reagendar", "💰 Alterar valor", "🗑️ Excluir"]
+ACOES_LOTE_PAGAS = ["💰 Alterar valor", "🗑️ Excluir"]
 
-if not recorrentes_df.empty:
-    for i, row in recorrentes_df[recorrentes_df["Ativa"]].iterrows():
-        proxima_data = row["Próximo Vencimento"]
+# Ações em lote sobre as contas da lista (já filtradas pela busca): a operação
+# vale para todas as selecionadas e é gravada de uma vez, com um único rerun
+def acoes_em_lote(contas, tabela, chave):
+    if contas.empty:
+        return
+    
+    with st.expander(f"📦 Ações em lote ({len(contas)} conta(s) na lista)"):
+        if st.checkbox("Selecionar todas as contas da lista", key=f"lote_todas_{chave}"):
+            ids = list(contas.index)
+        else:
+            ids = st.multiselect(
+                "Contas", list(contas.index), key=f"lote_ids_{chave}",
+                format_func=lambda i: f"{contas.at[i, 'Descrição']} - R$ {contas.at[i, 'Valor']:.2f} "
+                                      f"({relatorios.formatar_data(contas.at[i, 'Data de Vencimento'])})",
+            )
         
-        if pd.notna(proxima_data) and proxima_data.date() <= hoje.date():
-            nova_conta = pd.DataFrame({
-                "Descrição": [f"{row['Descrição']} ({row['Frequência'].lower()})"],
-                "Valor": [row["Valor"]],
-                "Data de Vencimento": [proxima_data],
-                "Status": ["Pendente"],
-                "Data de Pagamento": [pd.NaT],
-                "Origem": ["Recorrente"]
-            })
+        # Guardar as contas como estavam quando foram selecionadas, para
+        # detectar alterações feitas por outra sessão antes de aplicar
+        lidas = st.session_state.setdefault(f"lote_lidas_{chave}", {})
+        for i in set(lidas) - set(ids):
+            del lidas[i]
+        for i in ids:
+            lidas.setdefault(i, contas.loc[i].to_dict())
+        
+        acao = st.radio("Ação", ACOES_LOTE_PENDENTES if tabela == "contas" else ACOES_LOTE_PAGAS,
+                        horizontal=True, key=f"lote_acao_{chave}")
+        if acao == "✅ Pagar":
+            data = st.date_input("📅 Data de Pagamento", value=datetime.date.today(), key=f"lote_pagamento_{chave}")
+        elif acao == "📅 Reagendar":
+            data = st.date_input("📅 Nova Data de Vencimento", value=datetime.date.today(), key=f"lote_vencimento_{chave}")
+        elif acao == "💰 Alterar valor":
+            valor = st.number_input("💰 Novo Valor (R$)", min_value=0.0, format="%.2f", key=f"lote_valor_{chave}")
+        else:
+            confirmado = st.checkbox("Confirmo a exclusão das contas selecionadas", key=f"lote_confirmar_{chave}")
+        
+        if st.button(f"Aplicar a {len(ids)} conta(s)", key=f"lote_aplicar_{chave}", disabled=not ids):
+            if acao == "🗑️ Excluir" and not confirmado:
+                st.warning("⚠️ Marque a confirmação para excluir.")
+                return
             
-            # Se o arquivo CSV já existir, carregue e adicione a conta
-            if os.path.exists(CSV_FILE):
-                df_temp = pd.read_csv(CSV_FILE)
-                df_temp = pd.concat([df_temp, nova_conta], ignore_index=True)
-                df_temp.to_csv(CSV_FILE, index=False)
+            # Só aplica se nenhuma das contas mudou desde que foi selecionada
+            originais = [lidas[i] for i in ids]
+            try:
+                if acao == "✅ Pagar":
+                    repo.pagar_contas(ids, pd.Timestamp(data), originais=originais)
+                elif acao == "📅 Reagendar":
+                    alteracoes = pd.DataFrame({"Data de Vencimento": pd.Timestamp(data)}, index=ids)
+                    repo.atualizar_varias(tabela, alteracoes, originais=originais)
+                elif acao == "💰 Alterar valor":
+                    repo.atualizar_varias(tabela, pd.DataFrame({"Valor": valor}, index=ids), originais=originais)
+                else:
+                    repo.excluir(tabela, ids, originais=originais)
+            except armazenamento.ConflitoDeEdicao as erro:
+                st.error(f"⚠️ {erro}")
+                # A próxima tentativa parte das contas como estão agora
+                del st.session_state[f"lote_lidas_{chave}"]
             else:
-                # Se o arquivo não existir, crie com a nova conta
-                nova_conta.to_csv(CSV_FILE, index=False)
-            
-            # Atualizar a conta recorrente
-            recorrentes_df.at[i, "Próximo Vencimento"] = pd.Timestamp(
-                calcular_proxima_data(proxima_data, row["Frequência"], row["Dia Vencimento"])
-            )
-            recorrentes_df.at[i, "Última Geração"] = pd.Timestamp(proxima_data)
-    
-    # Salvar atualizações nas contas recorrentes
-    recorrentes_df.to_csv(RECORRENTES_FILE, index=False)
+                # Limpar a seleção
+                for key in [f"lote_todas_{chave}", f"lote_ids_{chave}", f"lote_confirmar_{chave}", f"lote_lidas_{chave}"]:
+                    if key in st.session_state:
+                        del st.session_state[key]
+                st.rerun()
 
+def create_calendar_view(df, year, month):
+    # A figura de cada mês é reaproveitada enquanto contas e recorrentes não mudam
+    versao = (chave_livro, repo.versao("contas"), repo.versao("recorrentes"))
+    return calendario.figura_mes(indice_contas, recorrentes_df, year, month, versao)
 
-# Carregar ou criar o arquivo de contas a pagar
-if os.path.exists(CSV_FILE):
-    df = pd.read_csv(CSV_FILE, parse_dates=["Data de Vencimento"])
+# Carregar histórico de pagamentos
+historico = repo.carregar("historico")
 
-    # Garantir que a coluna "Status" existe
-    if "Status" not in df.columns:
-        df["Status"] = "Pendente"
-    
-    # Garantir que a coluna "Data de Pagamento" existe no df principal
-    if "Data de Pagamento" not in df.columns:
-        df["Data de Pagamento"] = pd.NaT
-else:
-    df = pd.DataFrame(columns=["Descrição", "Valor", "Data de Vencimento", "Status", "Data de Pagamento"])
-    
-# Converter datas para formato de data para evitar erro
-df["Data de Vencimento"] = pd.to_datetime(df["Data de Vencimento"], errors="coerce")
-df["Data de Pagamento"] = pd.to_datetime(df["Data de Pagamento"], errors="coerce")
+# Carregar contas a pagar
+df = repo.carregar("contas")
 
-# Interface do Dashboard
-st.title("💰 Dashboard de Contas a Pagar")
+# Contas separadas por status e ordenadas por vencimento, compartilhadas por
+# todas as abas (montado uma vez por versão da tabela)
+indice_contas = consultas.indice_vencimentos(df, (chave_livro, repo.versao("contas")))
 
-# Modificar a criação de abas para incluir a nova aba de contas recorrentes
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Dashboard", "📆 Calendário", "📋 Contas", "🔄 Contas Recorrentes", "🏭 Serviços Cofap"])
+# Índice de busca pelas descrições de todas as tabelas (a cada nova versão,
+# só as linhas inseridas, alteradas ou excluídas são reindexadas)
+indice_textos = busca.indice_busca(chave_livro, {
+    "contas": (repo.versao("contas"), df),
+    "historico": (repo.versao("historico"), historico),
+    "recorrentes": (repo.versao("recorrentes"), recorrentes_df),
+})
+
+# Modificar a criação de abas para incluir a nova aba de contas recorrentes.
+# A aba selecionada é acompanhada pelo servidor para que o calendário (e o
+# plotly) só seja montado quando a aba é aberta.
+tab1, tab2, tab3, tab4, tab5 = st.tabs(
+    ["📊 Dashboard", "📆 Calendário", "📋 Contas", "🔄 Contas Recorrentes", "🏭 Serviços Cofap"],
+    key="aba_ativa", on_change="rerun",
+)
 
 # Substitua o trecho de código no tab1 (Dashboard) pelo seguinte:
 
+instrumentacao.etapa("renderizar", "Aba Dashboard")
 with tab1:
     # Resumo Financeiro
     st.subheader("📊 Resumo Financeiro")
-    hoje = pd.Timestamp(datetime.date.today())
-    inicio_mes = hoje.replace(day=1)
-    fim_mes = inicio_mes + pd.DateOffset(months=1) - pd.DateOffset(days=1)
-    fim_semana = hoje + pd.DateOffset(days=7)
-    
-    # No bloco de cálculo de valores
-    # No bloco de cálculo de valores
-    contas_pendentes = df[df["Status"] == "Pendente"]
-    valor_total = contas_pendentes["Valor"].sum()
-    valor_mes = df[(df["Data de Vencimento"] <= fim_mes) & (df["Status"] == "Pendente")]["Valor"].sum()
-    valor_semana = df[(df["Data de Vencimento"] <= fim_semana) & (df["Status"] == "Pendente")]["Valor"].sum()
-
-    # Adicionar valores das contas recorrentes APENAS para mês e semana (não para dívida total)
-    if not recorrentes_df.empty:
-        for _, conta in recorrentes_df[recorrentes_df["Ativa"]].iterrows():
-            proxima_data = conta["Próximo Vencimento"]
-            
-            # Verificar se a próxima data já chegou ou está no período considerado
-            if pd.notna(proxima_data):
-                # Se a conta estiver para vencer
-                # Verificar se essa conta recorrente já não foi gerada
-                conta_desc = f"{conta['Descrição']} ({conta['Frequência'].lower()})"
-                ja_gerada = any(
-                    (df["Descrição"] == conta_desc) & 
-                    (df["Data de Vencimento"] == proxima_data) & 
-                    (df["Status"] == "Pendente")
-                )
-                
-                # Se não foi gerada ainda, adicionar APENAS aos valores do mês e semana
-                if not ja_gerada:
-                    if proxima_data <= fim_mes:
-                        valor_mes += conta["Valor"]
-                    
-                    if proxima_data <= fim_semana:
-                        valor_semana += conta["Valor"]
-    
-    # Adicionar valores das contas recorrentes que ainda não foram geradas
-    if not recorrentes_df.empty:
-        for _, conta in recorrentes_df[recorrentes_df["Ativa"]].iterrows():
-            proxima_data = conta["Próximo Vencimento"]
-            
-            # Verificar se a próxima data já chegou ou está no período considerado
-            if pd.notna(proxima_data):
-                # Se a conta estiver para vencer (ainda não foi gerada)
-                if proxima_data <= hoje:
-                    # Verificar se essa conta recorrente já não foi gerada
-                    # (verificamos se existe uma conta com mesma descrição e data de vencimento)
-                    conta_desc = f"{conta['Descrição']} ({conta['Frequência'].lower()})"
-                    ja_gerada = any(
-                        (df["Descrição"] == conta_desc) & 
-                        (df["Data de Vencimento"] == proxima_data) & 
-                        (df["Status"] == "Pendente")
-                    )
-                    
-                    # Se não foi gerada ainda, adicionar ao valor total
-                    if not ja_gerada:
-                        valor_total += conta["Valor"]
-                        
-                        # Verificar se também deve ser adicionada aos valores do mês e semana
-                        if proxima_data <= fim_mes:
-                            valor_mes += conta["Valor"]
-                        
-                        if proxima_data <= fim_semana:
-                            valor_semana += conta["Valor"]
+    with instrumentacao.medir("agregar", "Resumo financeiro"):
+        totais = resumo.resumo_financeiro(indice_contas, recorrentes_df, datetime.date.today())
+    valor_total = totais["total"]
+    valor_mes = totais["mes"]
+    valor_semana = totais["semana"]
 
     # Layout em colunas para o resumo financeiro
     col1, col2, col3 = st.columns(3)
@@ -541,48 +377,156 @@ with tab1:
                 "Status": ["Pendente"],
                 "Data de Pagamento": [pd.NaT]
             })
-            df = pd.concat([df, nova_conta], ignore_index=True)
-            df.to_csv(CSV_FILE, index=False)
+            repo.inserir("contas", nova_conta)
+            df = repo.carregar("contas")
+            indice_contas = consultas.indice_vencimentos(df, (chave_livro, repo.versao("contas")))
             st.success("✅ Conta adicionada com sucesso!")
 
+    # Importação de várias contas de uma vez (planilhas e extratos bancários)
+    with st.expander("📥 Importar contas de arquivo (CSV, XLSX ou OFX)"):
+        st.caption("O arquivo precisa das colunas Descrição, Valor e Vencimento (ou Data). "
+                   "Contas iguais às já cadastradas (mesma descrição, valor e vencimento) são ignoradas.")
+        arquivo_importacao = st.file_uploader("Arquivo", type=["csv", "txt", "xlsx", "ofx"], key="arquivo_importacao")
+        
+        if arquivo_importacao is not None and st.button("📥 Importar contas", key="importar_contas"):
+            try:
+                with st.spinner("Importando contas..."):
+                    resultado = importacao.importar(repo, arquivo_importacao, arquivo_importacao.name)
+            except importacao.ErroImportacao as erro:
+                st.error(f"⚠️ {erro}")
+            else:
+                st.success(
+                    f"✅ {resultado['importadas']} conta(s) importada(s) de {resultado['lidas']} linha(s) lida(s). "
+                    f"Ignoradas: {resultado['duplicadas']} repetida(s) e {resultado['invalidas']} inválida(s)."
+                )
+                df = repo.carregar("contas")
+                indice_contas = consultas.indice_vencimentos(df, (chave_livro, repo.versao("contas")))
+
+instrumentacao.etapa("renderizar", "Aba Calendário")
 with tab2:
-    # Calendário Visual de Vencimentos
-    st.subheader("📆 Calendário de Vencimentos")
-    
-    # Seleção de mês e ano para o calendário
-    col1, col2 = st.columns(2)
-    with col1:
-        meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 
-                    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-        mes_index = datetime.date.today().month - 1
-        mes_nome = st.selectbox("Mês", meses_nomes, index=mes_index)
-        mes_calendario = meses_nomes.index(mes_nome) + 1
-    with col2:
-        ano_calendario = st.selectbox("Ano", range(2023, 2031), index=2)
-    
-    # Criar e exibir o calendário
-    if not df.empty:
-        calendario = create_calendar_view(df, ano_calendario, mes_calendario)
-        st.plotly_chart(calendario, use_container_width=True)
+    # Só monta o calendário com a aba aberta
+    if tab2.open:
+        # Calendário Visual de Vencimentos
+        st.subheader("📆 Calendário de Vencimentos")
         
-        # Legenda do calendário
-        st.markdown("""
-        **Legenda:**
-        - 🟨 Amarelo: Contas a vencer
-        - 🟥 Vermelho: Contas vencidas
-        - 🟩 Verde: Contas pagas
-        - ⬜ Branco: Sem contas
-        """)
-    else:
-        st.info("Não há contas cadastradas para exibir no calendário.")
+        visao_calendario = st.radio("Visualização", ["📅 Mês", "🗓️ Ano", "📈 Próximos 12 meses", "💸 Previsão de caixa"], horizontal=True, key="visao_calendario")
+        versao_calendario = (chave_livro, repo.versao("contas"), repo.versao("recorrentes"))
+        anos_calendario = calendario.anos_disponiveis(df["Data de Vencimento"], historico["Data de Vencimento"])
+        
+        if visao_calendario == "📅 Mês":
+            # Seleção de mês e ano para o calendário
+            col1, col2 = st.columns(2)
+            with col1:
+                meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 
+                            'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+                mes_index = datetime.date.today().month - 1
+                mes_nome = st.selectbox("Mês", meses_nomes, index=mes_index)
+                mes_calendario = meses_nomes.index(mes_nome) + 1
+            with col2:
+                ano_calendario = st.selectbox("Ano", anos_calendario, index=anos_calendario.index(datetime.date.today().year))
+            
+            # Criar e exibir o calendário
+            if not df.empty:
+                calendario_mes = create_calendar_view(df, ano_calendario, mes_calendario)
+                st.plotly_chart(calendario_mes, use_container_width=True)
+                
+                # Legenda do calendário
+                st.markdown("""
+                **Legenda:**
+                - 🟨 Amarelo: Contas a vencer
+                - 🟥 Vermelho: Contas vencidas
+                - 🟩 Verde: Contas pagas
+                - ⬜ Branco: Sem contas
+                """)
+            else:
+                st.info("Não há contas cadastradas para exibir no calendário.")
+        
+        elif visao_calendario == "💸 Previsão de caixa":
+            # Saídas previstas: contas pendentes mais todas as ocorrências das
+            # recorrentes ativas no horizonte, calculadas uma vez por versão
+            col1, col2 = st.columns(2)
+            with col1:
+                meses_previsao = st.slider("Horizonte (meses)", min_value=1, max_value=60, value=previsao.HORIZONTE_MESES, key="meses_previsao")
+            with col2:
+                agrupamento = st.radio("Agrupar por", previsao.AGRUPAMENTOS, index=2, horizontal=True, key="agrupamento_previsao")
+            
+            projecao = previsao.previsao(
+                indice_contas, recorrentes_df, versao_calendario, meses=meses_previsao, agrupamento=agrupamento
+            )
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("💸 Saídas no horizonte", formatar_real(projecao["Total"].sum()))
+            with col2:
+                st.metric("🔄 Das recorrentes", formatar_real(projecao["Recorrentes"].sum()))
+            with col3:
+                st.metric("📈 Maior período", formatar_real(projecao["Total"].max()))
+            
+            st.bar_chart(projecao[["Contas", "Recorrentes"]])
+            st.caption("Contas e recorrentes atrasadas entram no primeiro período.")
+            
+            formato_periodo = '%m/%Y' if agrupamento == "Mensal" else '%d/%m/%Y'
+            st.dataframe(pd.DataFrame({
+                "Período": projecao.index.strftime(formato_periodo),
+                "Contas": projecao["Quantidade"].to_numpy(),
+                "Pendentes": projecao["Contas"].apply(formatar_real).to_numpy(),
+                "Recorrentes": projecao["Recorrentes"].apply(formatar_real).to_numpy(),
+                "Total": projecao["Total"].apply(formatar_real).to_numpy(),
+                "Acumulado": projecao["Acumulado"].apply(formatar_real).to_numpy(),
+            }), use_container_width=True, hide_index=True)
+        
+        else:
+            # Mapa de calor dos totais diários a pagar, calculado uma vez para o período todo
+            if visao_calendario == "🗓️ Ano":
+                ano_mapa = st.selectbox("Ano", anos_calendario, index=anos_calendario.index(datetime.date.today().year), key="ano_mapa")
+                inicio_mapa, fim_mapa = calendario.periodo_anual(ano_mapa)
+                titulo_mapa = f"Contas a pagar em {ano_mapa}"
+            else:
+                inicio_mapa, fim_mapa = calendario.periodo_12_meses()
+                titulo_mapa = f"Contas a pagar de {inicio_mapa.strftime('%m/%Y')} a {fim_mapa.strftime('%m/%Y')}"
+            
+            mapa, diaria = calendario.mapa_calor(indice_contas, recorrentes_df, inicio_mapa, fim_mapa, versao_calendario, titulo_mapa)
+            st.plotly_chart(mapa, use_container_width=True)
+            st.caption("Inclui as próximas ocorrências das contas recorrentes ativas que ainda não foram geradas.")
+            
+            # Totais por mês do período
+            mensal = calendario.totais_mensais(diaria)
+            st.dataframe(pd.DataFrame({
+                "Mês": mensal.index.strftime('%m/%Y'),
+                "Contas": mensal["quantidade"].astype(int).to_numpy(),
+                "Total": mensal["total"].apply(formatar_real).to_numpy(),
+            }), use_container_width=True, hide_index=True)
 
+instrumentacao.etapa("renderizar", "Aba Contas")
 with tab3:
     # Histórico de Contas a Pagar
     st.subheader("📌 Histórico de Contas")
     
+    # Busca em todas as tabelas de uma vez, pelo índice de descrições
+    busca_geral = st.text_input(
+        "🔎 Buscar em contas pendentes, pagas e recorrentes", key="busca_geral",
+        placeholder="Ex.: renegociação, aluguel (aceita palavras incompletas e erros de digitação)",
+    )
+    if busca_geral.strip():
+        encontradas = indice_textos.descricoes(busca_geral) or {}
+        if encontradas:
+            resultados = pd.DataFrame([
+                {
+                    "Descrição": descricao,
+                    "Pendentes": contagem.get("contas", 0),
+                    "Pagas": contagem.get("historico", 0),
+                    "Recorrentes": contagem.get("recorrentes", 0),
+                }
+                for descricao, contagem in encontradas.items()
+            ]).sort_values(["Pendentes", "Pagas", "Descrição"], ascending=[False, False, True])
+            st.caption(f"{len(resultados)} descrição(ões) encontrada(s); use a busca de cada lista abaixo para ver as contas.")
+            st.dataframe(resultados.head(100), use_container_width=True, hide_index=True)
+        else:
+            st.info("Nenhuma conta encontrada.")
+    
     hoje = pd.Timestamp(datetime.date.today())
-    contas_vencer = df[(df["Data de Vencimento"] >= hoje) & (df["Status"] == "Pendente")]
-    contas_vencidas = df[(df["Data de Vencimento"] < hoje) & (df["Status"] == "Pendente")]
+    contas_vencer = indice_contas.a_vencer(hoje)
+    contas_vencidas = indice_contas.vencidas(hoje)
     contas_pagas = historico  # Exibe o histórico de contas pagas
     
     # Confirmação de exclusão
@@ -596,28 +540,35 @@ with tab3:
         col1, col2 = st.columns(2)
         with col1:
             if st.button("✅ Sim, excluir", key="confirmar_exclusao"):
-                if tipo == 'pendente':
-                    # Remover a conta do dataframe principal
-                    df = df.drop(i)
-                    df.to_csv(CSV_FILE, index=False)
-                    st.success(f"Conta '{descricao}' excluída com sucesso!")
-                else:  # historico
-                    # Remover a conta do histórico
-                    historico = historico.drop(i)
-                    historico.to_csv(HISTORICO_FILE, index=False)
-                    st.success(f"Conta '{descricao}' excluída do histórico com sucesso!")
+                # Só exclui se a conta ainda está como foi exibida
+                originais = [st.session_state['excluir_original']] if 'excluir_original' in st.session_state else None
+                conflito = None
+                try:
+                    if tipo == 'pendente':
+                        # Remover a conta do dataframe principal
+                        repo.excluir("contas", [i], originais=originais)
+                        st.success(f"Conta '{descricao}' excluída com sucesso!")
+                    else:  # historico
+                        # Remover a conta do histórico
+                        repo.excluir("historico", [i], originais=originais)
+                        st.success(f"Conta '{descricao}' excluída do histórico com sucesso!")
+                except armazenamento.ConflitoDeEdicao as erro:
+                    conflito = erro
                 
                 # Limpar dados de exclusão
-                for key in ['excluir_conta', 'excluir_indice', 'excluir_tipo', 'excluir_descricao']:
+                for key in ['excluir_conta', 'excluir_indice', 'excluir_tipo', 'excluir_descricao', 'excluir_original']:
                     if key in st.session_state:
                         del st.session_state[key]
-                        
-                st.rerun()
+                
+                if conflito:
+                    st.error(f"⚠️ {conflito}")
+                else:
+                    st.rerun()
         
         with col2:
             if st.button("❌ Não, cancelar", key="cancelar_exclusao"):
                 # Limpar dados de exclusão
-                for key in ['excluir_conta', 'excluir_indice', 'excluir_tipo', 'excluir_descricao']:
+                for key in ['excluir_conta', 'excluir_indice', 'excluir_tipo', 'excluir_descricao', 'excluir_original']:
                     if key in st.session_state:
                         del st.session_state[key]
                 st.rerun()
@@ -661,21 +612,24 @@ with tab3:
                 
                 if submitted:
                     # Atualizar os valores diretamente pelo índice
-                    df.at[idx, "Descrição"] = nova_descricao
-                    df.at[idx, "Valor"] = novo_valor
-                    df.at[idx, "Data de Vencimento"] = pd.Timestamp(nova_data)
-                    
-                    # Salvar as alterações
-                    df.to_csv(CSV_FILE, index=False)
-                    st.success(f"✅ Conta atualizada com sucesso!")
-                    
-                    # Sair do modo de edição
-                    st.session_state['modo_edicao'] = False
-                    st.session_state['index_edicao'] = None
-                    st.session_state['df_edicao'] = 'pendente'
-                    
-                    # Recarregar a página
-                    st.rerun()
+                    try:
+                        repo.atualizar("contas", idx, {
+                            "Descrição": nova_descricao,
+                            "Valor": novo_valor,
+                            "Data de Vencimento": pd.Timestamp(nova_data)
+                        }, original=st.session_state.get('original_edicao'))
+                    except armazenamento.ConflitoDeEdicao as erro:
+                        st.error(f"⚠️ {erro}")
+                    else:
+                        st.success(f"✅ Conta atualizada com sucesso!")
+                        
+                        # Sair do modo de edição
+                        st.session_state['modo_edicao'] = False
+                        st.session_state['index_edicao'] = None
+                        st.session_state['df_edicao'] = 'pendente'
+                        
+                        # Recarregar a página
+                        st.rerun()
                 
                 if cancelar:
                     # Sair do modo de edição sem salvar
@@ -723,22 +677,25 @@ with tab3:
                 
                 if submitted:
                     # Atualizar os valores diretamente pelo índice
-                    historico.at[idx, "Descrição"] = nova_descricao
-                    historico.at[idx, "Valor"] = novo_valor
-                    historico.at[idx, "Data de Vencimento"] = pd.Timestamp(nova_data_venc)
-                    historico.at[idx, "Data de Pagamento"] = pd.Timestamp(nova_data_pag)
-                    
-                    # Salvar as alterações
-                    historico.to_csv(HISTORICO_FILE, index=False)
-                    st.success(f"✅ Conta do histórico atualizada com sucesso!")
-                    
-                    # Sair do modo de edição
-                    st.session_state['modo_edicao'] = False
-                    st.session_state['index_edicao'] = None
-                    st.session_state['df_edicao'] = 'pendente'
-                    
-                    # Recarregar a página
-                    st.rerun()
+                    try:
+                        repo.atualizar("historico", idx, {
+                            "Descrição": nova_descricao,
+                            "Valor": novo_valor,
+                            "Data de Vencimento": pd.Timestamp(nova_data_venc),
+                            "Data de Pagamento": pd.Timestamp(nova_data_pag)
+                        }, original=st.session_state.get('original_edicao'))
+                    except armazenamento.ConflitoDeEdicao as erro:
+                        st.error(f"⚠️ {erro}")
+                    else:
+                        st.success(f"✅ Conta do histórico atualizada com sucesso!")
+                        
+                        # Sair do modo de edição
+                        st.session_state['modo_edicao'] = False
+                        st.session_state['index_edicao'] = None
+                        st.session_state['df_edicao'] = 'pendente'
+                        
+                        # Recarregar a página
+                        st.rerun()
                     
                 if cancelar:
                     # Sair do modo de edição sem salvar
@@ -751,36 +708,32 @@ with tab3:
         if aba_opcao == "📅 Contas a Vencer":
             st.markdown("### 🟡 Contas a Vencer")
             
-            # Adicionar contas recorrentes pendentes
-            hoje = pd.Timestamp(datetime.date.today())
+            # Adicionar a próxima ocorrência das contas recorrentes ativas
             contas_recorrentes_pendentes = recorrentes_df[
                 (recorrentes_df["Ativa"] == True)
             ]
-            
-            # Preparar lista de contas recorrentes
-            contas_recorrentes_vencer = []
-            for _, row in contas_recorrentes_pendentes.iterrows():
-                conta_recorrente = pd.DataFrame({
-                    "Descrição": [f"{row['Descrição']} 🔄 (Recorrente)"],
-                    "Valor": [row['Valor']],
-                    "Data de Vencimento": [row['Próximo Vencimento']],
-                    "Status": ["Pendente"],
-                    "Origem": ["Recorrente"]
-                })
-                contas_recorrentes_vencer.append(conta_recorrente)
+            contas_recorrentes_vencer = pd.DataFrame({
+                "Descrição": contas_recorrentes_pendentes["Descrição"].astype(str) + " 🔄 (Recorrente)",
+                "Valor": contas_recorrentes_pendentes["Valor"],
+                "Data de Vencimento": contas_recorrentes_pendentes["Próximo Vencimento"],
+                "Status": "Pendente",
+                "Origem": "Recorrente",
+            })
+            # Índices negativos: as ocorrências projetadas não são linhas da tabela
+            contas_recorrentes_vencer.index = -1 - pd.RangeIndex(len(contas_recorrentes_vencer))
 
             # Combinar contas normais com contas recorrentes
-            if contas_recorrentes_vencer:
-                contas_vencer_combinado = pd.concat([contas_vencer] + contas_recorrentes_vencer, ignore_index=True)
-                # Ordenar por data de vencimento
-                contas_vencer_combinado = contas_vencer_combinado.sort_values('Data de Vencimento')
-                contas_vencer = contas_vencer_combinado
+            if not contas_recorrentes_vencer.empty:
+                # Mantém o índice das contas: é ele que os botões usam para achar a linha
+                contas_vencer = pd.concat([contas_vencer, contas_recorrentes_vencer])
 
             # Verificar se há contas
             if contas_vencer.empty:
                 st.info("Nenhuma conta a vencer no momento.")
             else:
-                for i, row in contas_vencer.iterrows():
+                pagina, filtradas = pagina_da_lista(contas_vencer, "vencer", ORDENACOES_CONTAS)
+                acoes_em_lote(filtradas.drop(contas_recorrentes_vencer.index, errors="ignore"), "contas", "vencer")
+                for i, row in pagina.iterrows():
                     origem = row.get('Origem', 'Normal')
                     
                     # Código para mostrar as contas
@@ -800,27 +753,14 @@ with tab3:
                                 if st.button("✅ Pagar", key=f"pagar_{i}", use_container_width=True):
                                     hoje = pd.Timestamp(datetime.date.today())
                                     
-                                    # Atualizar o status da conta
-                                    df.loc[i, "Status"] = "Paga"
-                                    df.loc[i, "Data de Pagamento"] = hoje
-                                    
-                                    # Criar um DataFrame com a conta paga
-                                    conta_paga = df.loc[[i]].copy()
-                                    
-                                    # Remover a conta paga do arquivo principal
-                                    df = df.drop(i)
-                                    df.to_csv(CSV_FILE, index=False)
-                                    
-                                    # Garantir que a coluna existe no histórico
-                                    if "Data de Pagamento" not in historico.columns:
-                                        historico["Data de Pagamento"] = pd.NaT
-                                    
-                                    # Salvar no histórico
-                                    historico = pd.concat([historico, conta_paga], ignore_index=True)
-                                    historico.to_csv(HISTORICO_FILE, index=False)
-                                    
-                                    st.success(f"Conta '{row['Descrição']}' foi marcada como paga!")
-                                    st.rerun()
+                                    # Mover a conta para o histórico como paga
+                                    try:
+                                        repo.pagar_contas([i], hoje, originais=[row])
+                                    except armazenamento.ConflitoDeEdicao as erro:
+                                        st.error(f"⚠️ {erro}")
+                                    else:
+                                        st.success(f"Conta '{row['Descrição']}' foi marcada como paga!")
+                                        st.rerun()
                             
                             with col2:
                                 if st.button("✏️ Editar", key=f"editar_{i}", use_container_width=True):
@@ -828,6 +768,7 @@ with tab3:
                                     st.session_state['modo_edicao'] = True
                                     st.session_state['index_edicao'] = i
                                     st.session_state['df_edicao'] = 'pendente'
+                                    st.session_state['original_edicao'] = row.to_dict()
                                     st.rerun()
                             
                             with col3:
@@ -837,6 +778,7 @@ with tab3:
                                     st.session_state['excluir_indice'] = i
                                     st.session_state['excluir_tipo'] = 'pendente'
                                     st.session_state['excluir_descricao'] = row['Descrição']
+                                    st.session_state['excluir_original'] = row.to_dict()
                                     st.rerun()
                         else:
                             # Para contas recorrentes, mostrar uma mensagem informativa
@@ -847,7 +789,9 @@ with tab3:
             if contas_vencidas.empty:
                 st.info("Nenhuma conta vencida no momento.")
             else:
-                for i, row in contas_vencidas.iterrows():
+                pagina, filtradas = pagina_da_lista(contas_vencidas, "vencidas", ORDENACOES_CONTAS)
+                acoes_em_lote(filtradas, "contas", "vencidas")
+                for i, row in pagina.iterrows():
                     with st.expander(f"{row['Descrição']} - R$ {row['Valor']:.2f} 🔴 (Venceu em {row['Data de Vencimento'].strftime('%d/%m/%Y')})"):
                         st.write(f"**Valor:** R$ {row['Valor']:.2f}")
                         st.write(f"**Data de Vencimento:** {row['Data de Vencimento'].strftime('%d/%m/%Y')}")
@@ -859,27 +803,14 @@ with tab3:
                             if st.button("✅ Pagar", key=f"pagar_vencida_{i}", use_container_width=True):
                                 hoje = pd.Timestamp(datetime.date.today())
                                 
-                                # Atualizar o status da conta
-                                df.loc[i, "Status"] = "Paga"
-                                df.loc[i, "Data de Pagamento"] = hoje
-                                
-                                # Criar um DataFrame com a conta paga
-                                conta_paga = df.loc[[i]].copy()
-                                
-                                # Remover a conta paga do arquivo principal
-                                df = df.drop(i)
-                                df.to_csv(CSV_FILE, index=False)
-                                
-                                # Garantir que a coluna existe no histórico
-                                if "Data de Pagamento" not in historico.columns:
-                                    historico["Data de Pagamento"] = pd.NaT
-                                
-                                # Salvar no histórico
-                                historico = pd.concat([historico, conta_paga], ignore_index=True)
-                                historico.to_csv(HISTORICO_FILE, index=False)
-                                
-                                st.success(f"Conta vencida '{row['Descrição']}' foi marcada como paga!")
-                                st.rerun()
+                                # Mover a conta para o histórico como paga
+                                try:
+                                    repo.pagar_contas([i], hoje, originais=[row])
+                                except armazenamento.ConflitoDeEdicao as erro:
+                                    st.error(f"⚠️ {erro}")
+                                else:
+                                    st.success(f"Conta vencida '{row['Descrição']}' foi marcada como paga!")
+                                    st.rerun()
                         
                         with col2:
                             if st.button("✏️ Editar", key=f"editar_vencida_{i}", use_container_width=True):
@@ -887,6 +818,7 @@ with tab3:
                                 st.session_state['modo_edicao'] = True
                                 st.session_state['index_edicao'] = i
                                 st.session_state['df_edicao'] = 'pendente'
+                                st.session_state['original_edicao'] = row.to_dict()
                                 st.rerun()
                         
                         with col3:
@@ -896,15 +828,87 @@ with tab3:
                                 st.session_state['excluir_indice'] = i
                                 st.session_state['excluir_tipo'] = 'pendente'
                                 st.session_state['excluir_descricao'] = row['Descrição']
+                                st.session_state['excluir_original'] = row.to_dict()
                                 st.rerun()
 
         elif aba_opcao == "✅ Contas Pagas":
             st.markdown("### ✅ Contas Pagas")
             
-            if contas_pagas.empty:
+            # Os anos arquivados só são lidos quando escolhidos aqui
+            anos_arquivados = repo.arquivo.anos("historico")
+            anos_escolhidos = []
+            if anos_arquivados:
+                # Com outros anos, o período da análise volta a abranger os últimos 12 meses
+                anos_escolhidos = st.multiselect(
+                    "📦 Incluir anos arquivados", anos_arquivados, key="anos_arquivados",
+                    on_change=lambda: st.session_state.pop("periodo_analise", None),
+                )
+            
+            if contas_pagas.empty and not anos_escolhidos:
                 st.info("Nenhuma conta foi paga ainda.")
             else:
-                for i, row in contas_pagas.iterrows():
+                # Totais e atrasos por mês e categoria, lidos do cubo do histórico
+                # (atualizado só com os pagamentos novos ou alterados)
+                with st.expander("📊 Análise dos pagamentos"):
+                    cubo = analise.cubo_pagamentos(chave_livro, repo.versao("historico"), contas_pagas)
+                    if anos_escolhidos:
+                        cubo_arquivo = analise.cubo_pagamentos(
+                            (chave_livro, "arquivo"), repo.arquivo.versao("historico", anos_escolhidos),
+                            functools.partial(repo.arquivo.carregar, "historico", anos_escolhidos),
+                        )
+                        cubo = analise.combinar([cubo, cubo_arquivo])
+                    meses_cubo = cubo.meses()
+                    if meses_cubo:
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            inicio_analise, fim_analise = st.select_slider(
+                                "Período", options=meses_cubo, value=(meses_cubo[max(0, len(meses_cubo) - 12)], meses_cubo[-1]),
+                                format_func=lambda mes: mes.strftime('%m/%Y'), key="periodo_analise",
+                            )
+                        with col2:
+                            origem_analise = st.radio("Origem", ["Todas", "Manual", "Recorrente"], horizontal=True, key="origem_analise")
+                        origem_analise = None if origem_analise == "Todas" else origem_analise
+                        
+                        totais_analise = cubo.consultar("Origem", inicio_analise, fim_analise, origem_analise)
+                        pagas_analise = int(totais_analise["Quantidade"].sum())
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("💸 Total pago", formatar_real(totais_analise["Total"].sum()))
+                        with col2:
+                            atraso_medio = totais_analise["Dias de atraso"].sum() / max(1, totais_analise["Com datas"].sum())
+                            st.metric("⏱️ Atraso médio", f"{atraso_medio:.1f} dia(s)")
+                        with col3:
+                            st.metric("⚠️ Pagas em atraso", f"{totais_analise['Atrasadas'].sum() / max(1, pagas_analise):.0%}")
+                        
+                        por_mes = cubo.consultar(["Mês", "Origem"], inicio_analise, fim_analise, origem_analise)
+                        st.bar_chart(por_mes["Total"].unstack("Origem", fill_value=0))
+                        
+                        por_categoria = cubo.consultar("Categoria", inicio_analise, fim_analise, origem_analise)
+                        por_categoria = por_categoria.sort_values("Total", ascending=False).head(20)
+                        st.dataframe(pd.DataFrame({
+                            "Categoria": por_categoria.index,
+                            "Pagas": por_categoria["Quantidade"].astype(int).to_numpy(),
+                            "Total": por_categoria["Total"].apply(formatar_real).to_numpy(),
+                            "Atraso médio (dias)": por_categoria["Atraso médio"].round(1).to_numpy(),
+                        }), use_container_width=True, hide_index=True)
+                    else:
+                        st.info("As contas pagas não têm data de pagamento.")
+                
+                # Anos arquivados: só consulta (editar e excluir valem para o histórico atual)
+                if anos_escolhidos:
+                    with st.expander(f"📦 Pagamentos arquivados ({', '.join(map(str, anos_escolhidos))})"):
+                        arquivadas = repo.arquivo.carregar("historico", anos_escolhidos)
+                        pagina_arquivadas, _ = pagina_da_lista(arquivadas, "arquivadas", ORDENACOES_PAGAS)
+                        st.dataframe(pd.DataFrame({
+                            "Descrição": pagina_arquivadas["Descrição"].to_numpy(),
+                            "Valor": pagina_arquivadas["Valor"].apply(formatar_real).to_numpy(),
+                            "Vencimento": pagina_arquivadas["Data de Vencimento"].dt.strftime('%d/%m/%Y').to_numpy(),
+                            "Pagamento": pagina_arquivadas["Data de Pagamento"].dt.strftime('%d/%m/%Y').to_numpy(),
+                        }), use_container_width=True, hide_index=True)
+                
+                pagina, filtradas = pagina_da_lista(contas_pagas, "pagas", ORDENACOES_PAGAS)
+                acoes_em_lote(filtradas, "historico", "pagas")
+                for i, row in pagina.iterrows():
                     # Tratamento da data de pagamento
                     data_pagamento = row["Data de Pagamento"] if pd.notna(row["Data de Pagamento"]) else "Não informado"
                     data_pagamento_str = data_pagamento.strftime('%d/%m/%Y') if isinstance(data_pagamento, pd.Timestamp) else data_pagamento
@@ -926,6 +930,7 @@ with tab3:
                                 st.session_state['modo_edicao'] = True
                                 st.session_state['index_edicao'] = i
                                 st.session_state['df_edicao'] = 'historico'
+                                st.session_state['original_edicao'] = row.to_dict()
                                 st.rerun()
                         
                         with col2:
@@ -935,6 +940,7 @@ with tab3:
                                 st.session_state['excluir_indice'] = i
                                 st.session_state['excluir_tipo'] = 'historico'
                                 st.session_state['excluir_descricao'] = row['Descrição']
+                                st.session_state['excluir_original'] = row.to_dict()
                                 st.rerun()
 
     # Adicione este código no final da aba Contas (tab3)
@@ -942,204 +948,52 @@ with tab3:
     st.subheader("📊 Exportar Contas para PDF")
 
     col1, col2, col3 = st.columns(3)
+    # Os relatórios são gerados em segundo plano; a chave inclui a versão dos
+    # dados, então um relatório já gerado é reaproveitado até os dados mudarem
+    hoje = pd.Timestamp(datetime.date.today())
+    hoje_str = datetime.date.today().strftime('%Y-%m-%d')
+    
     with col1:
+        chave = ("contas_a_vencer", chave_livro, repo.versao("contas"), hoje)
         if st.button("📄 Exportar Contas a Vencer", use_container_width=True):
-            # Criar PDF
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
-            
-            # Adicionar título
-            pdf.cell(200, 10, txt="Relatório de Contas a Vencer", ln=True, align='C')
-            pdf.ln(10)
-            
-            # Adicionar data de geração
-            pdf.cell(200, 10, txt=f"Gerado em: {datetime.date.today().strftime('%d/%m/%Y')}", ln=True)
-            pdf.ln(10)
-            
-            # Cabeçalhos
-            col_width = 190 / 4  # 4 colunas
-            pdf.set_font("Arial", 'B', 12)
-            headers = ["Descrição", "Valor (R$)", "Vencimento", "Status"]
-            for header in headers:
-                pdf.cell(col_width, 10, header, border=1)
-            pdf.ln()
-            
             # Dados - contas a vencer (pendentes e não vencidas)
-            pdf.set_font("Arial", size=10)
-            hoje = pd.Timestamp(datetime.date.today())
-            contas_a_vencer = df[(df["Status"] == "Pendente") & (df["Data de Vencimento"] >= hoje)]
-            
-            for _, row in contas_a_vencer.iterrows():
-                # Descrição
-                pdf.cell(col_width, 10, str(row['Descrição']), border=1)
-                # Valor
-                pdf.cell(col_width, 10, f"R$ {row['Valor']:,.2f}", border=1)
-                # Data de vencimento
-                if pd.notna(row['Data de Vencimento']):
-                    data_str = pd.to_datetime(row['Data de Vencimento']).strftime('%d/%m/%Y')
-                else:
-                    data_str = ""
-                pdf.cell(col_width, 10, data_str, border=1)
-                # Status
-                pdf.cell(col_width, 10, str(row['Status']), border=1)
-                pdf.ln()
-            
-            # Método 1: Salvar em arquivo temporário e depois ler
-            temp_file = "temp_contas_a_vencer.pdf"
-            pdf.output(temp_file)
-            
-            # Ler o arquivo temporário
-            with open(temp_file, "rb") as file:
-                pdf_data = file.read()
-            
-            # Remover o arquivo temporário
-            try:
-                os.remove(temp_file)
-            except:
-                pass
-            
-            # Oferecer para download
-            st.download_button(
-                label="⬇️ Baixar PDF",
-                data=pdf_data,
-                file_name=f"contas_a_vencer_{datetime.date.today().strftime('%Y-%m-%d')}.pdf",
-                mime="application/pdf"
-            )
+            contas_a_vencer = indice_contas.a_vencer(hoje).copy()
+            exportacao.exportar(chave, len(contas_a_vencer), functools.partial(
+                relatorios.pdf_contas, "Relatório de Contas a Vencer", contas_a_vencer
+            ))
+            st.session_state['exportacao_contas_a_vencer'] = chave
+        
+        # Oferecer para download
+        if st.session_state.get('exportacao_contas_a_vencer') == chave:
+            painel_exportacao(chave, f"contas_a_vencer_{hoje_str}.pdf")
 
     with col2:
+        chave = ("contas_vencidas", chave_livro, repo.versao("contas"), hoje)
         if st.button("📄 Exportar Contas Vencidas", use_container_width=True):
-            # Criar PDF
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
-            
-            # Adicionar título
-            pdf.cell(200, 10, txt="Relatório de Contas Vencidas", ln=True, align='C')
-            pdf.ln(10)
-            
-            # Adicionar data de geração
-            pdf.cell(200, 10, txt=f"Gerado em: {datetime.date.today().strftime('%d/%m/%Y')}", ln=True)
-            pdf.ln(10)
-            
-            # Cabeçalhos
-            col_width = 190 / 4  # 4 colunas
-            pdf.set_font("Arial", 'B', 12)
-            headers = ["Descrição", "Valor (R$)", "Vencimento", "Status"]
-            for header in headers:
-                pdf.cell(col_width, 10, header, border=1)
-            pdf.ln()
-            
             # Dados - contas vencidas
-            pdf.set_font("Arial", size=10)
-            hoje = pd.Timestamp(datetime.date.today())
-            contas_vencidas = df[(df["Status"] == "Pendente") & (df["Data de Vencimento"] < hoje)]
-            
-            for _, row in contas_vencidas.iterrows():
-                # Descrição
-                pdf.cell(col_width, 10, str(row['Descrição']), border=1)
-                # Valor
-                pdf.cell(col_width, 10, f"R$ {row['Valor']:,.2f}", border=1)
-                # Data de vencimento
-                if pd.notna(row['Data de Vencimento']):
-                    data_str = pd.to_datetime(row['Data de Vencimento']).strftime('%d/%m/%Y')
-                else:
-                    data_str = ""
-                pdf.cell(col_width, 10, data_str, border=1)
-                # Status
-                pdf.cell(col_width, 10, "Vencida", border=1)
-                pdf.ln()
-            
-            # Método 1: Salvar em arquivo temporário e depois ler
-            temp_file = "temp_contas_vencidas.pdf"
-            pdf.output(temp_file)
-            
-            # Ler o arquivo temporário
-            with open(temp_file, "rb") as file:
-                pdf_data = file.read()
-            
-            # Remover o arquivo temporário
-            try:
-                os.remove(temp_file)
-            except:
-                pass
-            
-            # Oferecer para download
-            st.download_button(
-                label="⬇️ Baixar PDF",
-                data=pdf_data,
-                file_name=f"contas_vencidas_{datetime.date.today().strftime('%Y-%m-%d')}.pdf",
-                mime="application/pdf"
-            )
+            contas_vencidas = indice_contas.vencidas(hoje).copy()
+            exportacao.exportar(chave, len(contas_vencidas), functools.partial(
+                relatorios.pdf_contas, "Relatório de Contas Vencidas", contas_vencidas, status="Vencida"
+            ))
+            st.session_state['exportacao_contas_vencidas'] = chave
+        
+        # Oferecer para download
+        if st.session_state.get('exportacao_contas_vencidas') == chave:
+            painel_exportacao(chave, f"contas_vencidas_{hoje_str}.pdf")
 
     with col3:
+        chave = ("contas_pagas", chave_livro, repo.versao("historico"))
         if st.button("📄 Exportar Contas Pagas", use_container_width=True):
-            # Criar PDF
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
-            
-            # Adicionar título
-            pdf.cell(200, 10, txt="Relatório de Contas Pagas", ln=True, align='C')
-            pdf.ln(10)
-            
-            # Adicionar data de geração
-            pdf.cell(200, 10, txt=f"Gerado em: {datetime.date.today().strftime('%d/%m/%Y')}", ln=True)
-            pdf.ln(10)
-            
-            # Cabeçalhos
-            col_width = 190 / 5  # 5 colunas
-            pdf.set_font("Arial", 'B', 12)
-            headers = ["Descrição", "Valor (R$)", "Vencimento", "Pagamento", "Status"]
-            for header in headers:
-                pdf.cell(col_width, 10, header, border=1)
-            pdf.ln()
-            
             # Dados - contas pagas do histórico
-            pdf.set_font("Arial", size=9)  # Reduzido o tamanho para caber melhor
-            
-            for _, row in historico.iterrows():
-                # Descrição
-                pdf.cell(col_width, 10, str(row['Descrição']), border=1)
-                # Valor
-                pdf.cell(col_width, 10, f"R$ {row['Valor']:,.2f}", border=1)
-                # Data de vencimento
-                if pd.notna(row['Data de Vencimento']):
-                    data_venc_str = pd.to_datetime(row['Data de Vencimento']).strftime('%d/%m/%Y')
-                else:
-                    data_venc_str = ""
-                pdf.cell(col_width, 10, data_venc_str, border=1)
-                # Data de pagamento
-                if pd.notna(row['Data de Pagamento']):
-                    data_pag_str = pd.to_datetime(row['Data de Pagamento']).strftime('%d/%m/%Y')
-                else:
-                    data_pag_str = ""
-                pdf.cell(col_width, 10, data_pag_str, border=1)
-                # Status
-                pdf.cell(col_width, 10, "Paga", border=1)
-                pdf.ln()
-            
-            # Método 1: Salvar em arquivo temporário e depois ler
-            temp_file = "temp_contas_pagas.pdf"
-            pdf.output(temp_file)
-            
-            # Ler o arquivo temporário
-            with open(temp_file, "rb") as file:
-                pdf_data = file.read()
-            
-            # Remover o arquivo temporário
-            try:
-                os.remove(temp_file)
-            except:
-                pass
-            
-            # Oferecer para download
-            st.download_button(
-                label="⬇️ Baixar PDF",
-                data=pdf_data,
-                file_name=f"contas_pagas_{datetime.date.today().strftime('%Y-%m-%d')}.pdf",
-                mime="application/pdf"
-            )
+            exportacao.exportar(chave, len(historico), functools.partial(
+                relatorios.pdf_historico, historico.copy()
+            ))
+            st.session_state['exportacao_contas_pagas'] = chave
+        
+        # Oferecer para download
+        if st.session_state.get('exportacao_contas_pagas') == chave:
+            painel_exportacao(chave, f"contas_pagas_{hoje_str}.pdf")
+instrumentacao.etapa("renderizar", "Aba Contas Recorrentes")
 with tab4:
     st.subheader("🔄 Contas Recorrentes")
     
@@ -1199,9 +1053,8 @@ with tab4:
                     "Ativa": [True]
                 })
                 
-                # Concatenar com o dataframe existente
-                recorrentes_df = pd.concat([recorrentes_df, nova_recorrente], ignore_index=True)
-                recorrentes_df.to_csv(RECORRENTES_FILE, index=False)
+                # Salvar a nova conta recorrente
+                repo.inserir("recorrentes", nova_recorrente)
                 
                 st.success("✅ Conta recorrente adicionada com sucesso!")
                 st.rerun()
@@ -1211,96 +1064,10 @@ with tab4:
         hoje = datetime.date.today()
         
         if st.button("🔄 Gerar Contas Recorrentes Pendentes", type="primary", use_container_width=True):
+            novas_contas, proximos = recorrencia.ocorrencias_pendentes(recorrentes_df, hoje)
             contas_geradas = 0
-            st.write("Número de contas recorrentes ativas:", len(recorrentes_df[recorrentes_df["Ativa"]]))
-            # Para cada conta recorrente ativa
-            for i, row in recorrentes_df[recorrentes_df["Ativa"]].iterrows():
-                proxima_data = row["Próximo Vencimento"]
-                st.write(f"Verificando conta: {row['Descrição']}")
-                st.write(f"Próxima data: {proxima_data}")
-                st.write(f"Hoje: {hoje}")
-                # Verificar se a próxima data já chegou
-                if pd.notna(proxima_data) and proxima_data.date() <= hoje:
-                    st.write(f"Gerando conta para: {row['Descrição']}")
-                    # Na função de gerar contas recorrentes, modifique a criação do DataFrame
-                    nova_conta = pd.DataFrame({
-                        "Descrição": [f"{row['Descrição']} ({row['Frequência'].lower()})"],
-                        "Valor": [row["Valor"]],
-                        "Data de Vencimento": [proxima_data],
-                        "Status": ["Pendente"],
-                        "Data de Pagamento": [pd.NaT],
-                        "Origem": ["Recorrente"]  # Novo campo para identificar origem
-                    })
-                    # Adicionar ao DataFrame de contas
-                    df = pd.concat([df, nova_conta], ignore_index=True)
-                    
-                    contas_geradas += 1
-                    st.write(f"Total de contas geradas: {contas_geradas}")
-                    # Calcular a próxima data de vencimento com base na frequência
-
-                    ultima_geracao = proxima_data
-                    dia_venc = int(row["Dia Vencimento"])
-                    
-                    if row["Frequência"] == "Mensal":
-                        # Avançar um mês
-                        proximo_mes = proxima_data.month + 1
-                        proximo_ano = proxima_data.year
-                        
-                        if proximo_mes > 12:
-                            proximo_mes = 1
-                            proximo_ano += 1
-                        
-                        # Ajustar para um dia válido no próximo mês
-                        ultimo_dia_prox_mes = calendar.monthrange(proximo_ano, proximo_mes)[1]
-                        dia_efetivo = min(dia_venc, ultimo_dia_prox_mes)
-                        
-                        prox_data = datetime.date(proximo_ano, proximo_mes, dia_efetivo)
-                        
-                    elif row["Frequência"] == "Trimestral":
-                        # Avançar três meses
-                        proximo_mes = proxima_data.month + 3
-                        proximo_ano = proxima_data.year
-                        
-                        while proximo_mes > 12:
-                            proximo_mes -= 12
-                            proximo_ano += 1
-                        
-                        ultimo_dia_prox_mes = calendar.monthrange(proximo_ano, proximo_mes)[1]
-                        dia_efetivo = min(dia_venc, ultimo_dia_prox_mes)
-                        
-                        prox_data = datetime.date(proximo_ano, proximo_mes, dia_efetivo)
-                        
-                    elif row["Frequência"] == "Semestral":
-                        # Avançar seis meses
-                        proximo_mes = proxima_data.month + 6
-                        proximo_ano = proxima_data.year
-                        
-                        while proximo_mes > 12:
-                            proximo_mes -= 12
-                            proximo_ano += 1
-                        
-                        ultimo_dia_prox_mes = calendar.monthrange(proximo_ano, proximo_mes)[1]
-                        dia_efetivo = min(dia_venc, ultimo_dia_prox_mes)
-                        
-                        prox_data = datetime.date(proximo_ano, proximo_mes, dia_efetivo)
-                        
-                    else:  # Anual
-                        # Avançar um ano
-                        proximo_ano = proxima_data.year + 1
-                        proximo_mes = proxima_data.month
-                        
-                        ultimo_dia_prox_mes = calendar.monthrange(proximo_ano, proximo_mes)[1]
-                        dia_efetivo = min(dia_venc, ultimo_dia_prox_mes)
-                        
-                        prox_data = datetime.date(proximo_ano, proximo_mes, dia_efetivo)
-                    
-                    # Atualizar a conta recorrente
-                    recorrentes_df.at[i, "Próximo Vencimento"] = pd.Timestamp(prox_data)
-                    recorrentes_df.at[i, "Última Geração"] = pd.Timestamp(ultima_geracao)
-            
-            # Salvar as alterações
-            df.to_csv(CSV_FILE, index=False)
-            recorrentes_df.to_csv(RECORRENTES_FILE, index=False)
+            if not proximos.empty:
+                contas_geradas = repo.registrar_geracao(novas_contas, proximos)
             
             if contas_geradas > 0:
                 st.success(f"✅ {contas_geradas} conta(s) recorrente(s) gerada(s) com sucesso!")
@@ -1362,27 +1129,35 @@ with tab4:
                     if st.button("✏️ Editar", key=f"editar_recorrente_{i}", use_container_width=True):
                         st.session_state['editar_recorrente'] = True
                         st.session_state['indice_recorrente'] = i
+                        st.session_state['original_recorrente'] = row.to_dict()
                         st.rerun()
                 
                 with col2:
                     if row["Ativa"]:
                         if st.button("❌ Desativar", key=f"desativar_recorrente_{i}", use_container_width=True):
-                            recorrentes_df.at[i, "Ativa"] = False
-                            recorrentes_df.to_csv(RECORRENTES_FILE, index=False)
-                            st.success(f"Conta '{row['Descrição']}' desativada!")
-                            st.rerun()
+                            try:
+                                repo.atualizar("recorrentes", i, {"Ativa": False}, original=row)
+                            except armazenamento.ConflitoDeEdicao as erro:
+                                st.error(f"⚠️ {erro}")
+                            else:
+                                st.success(f"Conta '{row['Descrição']}' desativada!")
+                                st.rerun()
                     else:
                         if st.button("✅ Ativar", key=f"ativar_recorrente_{i}", use_container_width=True):
-                            recorrentes_df.at[i, "Ativa"] = True
-                            recorrentes_df.to_csv(RECORRENTES_FILE, index=False)
-                            st.success(f"Conta '{row['Descrição']}' ativada!")
-                            st.rerun()
+                            try:
+                                repo.atualizar("recorrentes", i, {"Ativa": True}, original=row)
+                            except armazenamento.ConflitoDeEdicao as erro:
+                                st.error(f"⚠️ {erro}")
+                            else:
+                                st.success(f"Conta '{row['Descrição']}' ativada!")
+                                st.rerun()
                 
                 with col3:
                     if st.button("🗑️ Excluir", key=f"excluir_recorrente_{i}", use_container_width=True):
                         st.session_state['excluir_recorrente'] = True
                         st.session_state['indice_recorrente'] = i
                         st.session_state['descricao_recorrente'] = row['Descrição']
+                        st.session_state['original_recorrente'] = row.to_dict()
                         st.rerun()
         
         # Confirmação de exclusão
@@ -1395,22 +1170,29 @@ with tab4:
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("✅ Sim, excluir", key="confirmar_exclusao_recorrente"):
-                    # Remover a conta recorrente
-                    recorrentes_df = recorrentes_df.drop(i).reset_index(drop=True)
-                    recorrentes_df.to_csv(RECORRENTES_FILE, index=False)
-                    st.success(f"Conta recorrente '{descricao}' excluída com sucesso!")
+                    # Remover a conta recorrente, se ainda está como foi exibida
+                    originais = [st.session_state['original_recorrente']] if 'original_recorrente' in st.session_state else None
+                    conflito = None
+                    try:
+                        repo.excluir("recorrentes", [i], originais=originais)
+                        st.success(f"Conta recorrente '{descricao}' excluída com sucesso!")
+                    except armazenamento.ConflitoDeEdicao as erro:
+                        conflito = erro
                     
                     # Limpar dados de exclusão
-                    for key in ['excluir_recorrente', 'indice_recorrente', 'descricao_recorrente']:
+                    for key in ['excluir_recorrente', 'indice_recorrente', 'descricao_recorrente', 'original_recorrente']:
                         if key in st.session_state:
                             del st.session_state[key]
                     
-                    st.rerun()
+                    if conflito:
+                        st.error(f"⚠️ {conflito}")
+                    else:
+                        st.rerun()
             
             with col2:
                 if st.button("❌ Não, cancelar", key="cancelar_exclusao_recorrente"):
                     # Limpar dados de exclusão
-                    for key in ['excluir_recorrente', 'indice_recorrente', 'descricao_recorrente']:
+                    for key in ['excluir_recorrente', 'indice_recorrente', 'descricao_recorrente', 'original_recorrente']:
                         if key in st.session_state:
                             del st.session_state[key]
                     st.rerun()
@@ -1458,23 +1240,25 @@ with tab4:
                 
                 if submitted:
                     # Atualizar os valores
-                    recorrentes_df.at[i, "Descrição"] = nova_descricao
-                    recorrentes_df.at[i, "Valor"] = novo_valor
-                    recorrentes_df.at[i, "Frequência"] = nova_frequencia
-                    recorrentes_df.at[i, "Dia Vencimento"] = novo_dia_vencimento
-                    recorrentes_df.at[i, "Próximo Vencimento"] = pd.Timestamp(nova_prox_data)
-                    
-                    # Salvar as alterações
-                    recorrentes_df.to_csv(RECORRENTES_FILE, index=False)
-                    st.success(f"✅ Conta recorrente atualizada com sucesso!")
-                    
-                    # Sair do modo de edição
-                    if 'editar_recorrente' in st.session_state:
-                        del st.session_state['editar_recorrente']
-                    if 'indice_recorrente' in st.session_state:
-                        del st.session_state['indice_recorrente']
-                    
-                    st.rerun()
+                    try:
+                        repo.atualizar("recorrentes", i, {
+                            "Descrição": nova_descricao,
+                            "Valor": novo_valor,
+                            "Frequência": nova_frequencia,
+                            "Dia Vencimento": novo_dia_vencimento,
+                            "Próximo Vencimento": pd.Timestamp(nova_prox_data)
+                        }, original=st.session_state.get('original_recorrente'))
+                    except armazenamento.ConflitoDeEdicao as erro:
+                        st.error(f"⚠️ {erro}")
+                    else:
+                        st.success(f"✅ Conta recorrente atualizada com sucesso!")
+                        
+                        # Sair do modo de edição
+                        for key in ['editar_recorrente', 'indice_recorrente', 'original_recorrente']:
+                            if key in st.session_state:
+                                del st.session_state[key]
+                        
+                        st.rerun()
                 
                 if cancelar:
                     # Sair do modo de edição sem salvar
@@ -1486,9 +1270,13 @@ with tab4:
     else:
         st.info("Não há contas recorrentes cadastradas. Use o formulário acima para adicionar.")
 
+instrumentacao.etapa("renderizar", "Aba Serviços Cofap")
 with tab5:
     st.subheader("🏭 Serviços Cofap/Marelli")
     
+    # Lançamentos ordenados por data, com o saldo acumulado
+    livro_cofap = cofap.LivroCofap(servicos_df)
+    
     # Botões para adicionar serviço, pedido de compra ou exportar
     col1, col2, col3 = st.columns([1, 1, 1])
     with col1:
@@ -1503,75 +1291,17 @@ with tab5:
             st.rerun()
     with col3:
         # Substitua este código na parte de exportação para PDF na aba Serviços Cofap
+        chave = ("servicos", chave_livro, repo.versao("servicos"))
         if st.button("📄 Exportar para PDF", key="btn_export", use_container_width=True):
-            # Criar PDF
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", size=12)
-            
-            # Adicionar título
-            pdf.cell(200, 10, txt="Relatório de Serviços Cofap/Marelli", ln=True, align='C')
-            pdf.ln(10)
-            
-            # Adicionar data de geração
-            pdf.cell(200, 10, txt=f"Gerado em: {datetime.date.today().strftime('%d/%m/%Y')}", ln=True)
-            pdf.ln(10)
-            
-            # Definir larguras das colunas
-            col_width = 190 / 6  # 6 colunas no total
-            
-            # Cabeçalhos
-            pdf.set_font("Arial", 'B', 10)
-            headers = ["Funcionário", "Equipamento", "Data", "Valor diária", "Pedido", "Situação"]
-            for header in headers:
-                pdf.cell(col_width, 10, header, border=1)
-            pdf.ln()
-            
-            # Dados
-            pdf.set_font("Arial", size=8)
-            for _, row in servicos_df.sort_values('Dia').iterrows():
-                # Funcionário
-                pdf.cell(col_width, 10, str(row['Funcionario']) if pd.notna(row['Funcionario']) else "", border=1)
-                # Equipamento
-                pdf.cell(col_width, 10, str(row['Equipamento']) if pd.notna(row['Equipamento']) else "", border=1)
-                # Data
-                if pd.notna(row['Dia']):
-                    data_str = pd.to_datetime(row['Dia']).strftime('%d/%m/%Y')
-                else:
-                    data_str = ""
-                pdf.cell(col_width, 10, data_str, border=1)
-                # Valor diária
-                if pd.notna(row['Valor diaria']):
-                    pdf.cell(col_width, 10, f"R$ {row['Valor diaria']:,.2f}", border=1)
-                else:
-                    pdf.cell(col_width, 10, "", border=1)
-                # Pedido de compra
-                pdf.cell(col_width, 10, str(row['Pedidos de compra']) if pd.notna(row['Pedidos de compra']) else "", border=1)
-                # Situação
-                pdf.cell(col_width, 10, f"R$ {row['Situação']:,.2f}", border=1)
-                pdf.ln()
-            
-            # Método 1: Salvar em arquivo temporário e depois ler
-            temp_file = "temp_servicos.pdf"
-            pdf.output(temp_file)
-            
-            # Ler o arquivo temporário
-            with open(temp_file, "rb") as file:
-                pdf_data = file.read()
-            
-            # Remover o arquivo temporário
-            try:
-                os.remove(temp_file)
-            except:
-                pass
-            
-            # Oferecer para download
-            st.download_button(
-                label="⬇️ Baixar PDF",
-                data=pdf_data,
-                file_name=f"servicos_cofap_{datetime.date.today().strftime('%Y-%m-%d')}.pdf",
-                mime="application/pdf"
-            )
+            # Lançamentos em ordem de data, com a situação acumulada
+            exportacao.exportar(chave, len(livro_cofap.ordenado), functools.partial(
+                relatorios.pdf_servicos, livro_cofap.ordenado.copy()
+            ))
+            st.session_state['exportacao_servicos'] = chave
+        
+        # Oferecer para download
+        if st.session_state.get('exportacao_servicos') == chave:
+            painel_exportacao(chave, f"servicos_cofap_{datetime.date.today().strftime('%Y-%m-%d')}.pdf")
     
     # Formulário para adicionar novo serviço ou pedido
     if 'adicionar_servico' in st.session_state and st.session_state['adicionar_servico']:
@@ -1592,16 +1322,15 @@ with tab5:
                 
                 dia = st.date_input("📅 Data do Serviço")
                 
-                # Calcular nova situação (último valor - valor da diária)
-                ultima_situacao = 0
-                if not servicos_df.empty:
-                    ultima_situacao = servicos_df.sort_values('Dia').iloc[-1]['Situação']
+                # Nova situação: saldo na data do serviço menos a diária (é o
+                # que será gravado, inclusive para lançamentos retroativos)
+                ultima_situacao = livro_cofap.saldo_em(dia)
                 
                 nova_situacao = ultima_situacao - valor_diaria
                 
                 # Mostrar campos informativos
                 st.info(f"Valor da diária: R$ {valor_diaria:,.2f}")
-                st.info(f"Saldo atual: R$ {ultima_situacao:,.2f}")
+                st.info(f"Saldo em {dia.strftime('%d/%m/%Y')}: R$ {ultima_situacao:,.2f}")
                 st.info(f"Novo saldo após este serviço: R$ {nova_situacao:,.2f}")
                 
                 pedido = None
@@ -1618,15 +1347,13 @@ with tab5:
                 
                 valor_pedido = st.number_input("💰 Valor do Pedido (R$) (obrigatório)", min_value=0.0, format="%.2f")
                 
-                # Calcular nova situação (último valor + valor do pedido)
-                ultima_situacao = 0
-                if not servicos_df.empty:
-                    ultima_situacao = servicos_df.sort_values('Dia').iloc[-1]['Situação']
+                # Nova situação: saldo na data do pedido mais o valor do pedido
+                ultima_situacao = livro_cofap.saldo_em(dia)
                 
                 nova_situacao = ultima_situacao + valor_pedido
                 
                 # Mostrar campos informativos
-                st.info(f"Saldo atual: R$ {ultima_situacao:,.2f}")
+                st.info(f"Saldo em {dia.strftime('%d/%m/%Y')}: R$ {ultima_situacao:,.2f}")
                 st.info(f"Novo saldo após este pedido: R$ {nova_situacao:,.2f}")
             
             col1, col2 = st.columns([1, 1])
@@ -1640,42 +1367,28 @@ with tab5:
                 if tipo_entrada == 'pedido' and not pedido:
                     st.error("O número do pedido de compra é obrigatório")
                 else:
-                    # Calcular nova situação baseada no tipo de entrada
-                    ultima_situacao = 0
-                    if not servicos_df.empty:
-                        ultima_situacao = servicos_df.sort_values('Dia').iloc[-1]['Situação']
-                    
                     if tipo_entrada == 'servico':
                         # Serviço prestado diminui o saldo
-                        nova_situacao = ultima_situacao - valor_diaria
-                        
-                        novo_registro = pd.DataFrame({
-                            "Funcionario": [funcionario],
-                            "Equipamento": [equipamento],
-                            "Dia": [pd.Timestamp(dia)],
-                            "Valor diaria": [valor_diaria],
-                            "Pedidos de compra": [None],
-                            "Situação": [nova_situacao]
-                        })
+                        novo_registro = {
+                            "Funcionario": funcionario,
+                            "Equipamento": equipamento,
+                            "Dia": pd.Timestamp(dia),
+                            "Valor diaria": valor_diaria,
+                            "Pedidos de compra": None,
+                        }
                     else:  # pedido de compra
                         # Pedido de compra aumenta o saldo
-                        nova_situacao = ultima_situacao + valor_pedido
-                        
-                        novo_registro = pd.DataFrame({
-                            "Funcionario": [None],
-                            "Equipamento": [None],
-                            "Dia": [pd.Timestamp(dia)],
-                            "Valor diaria": [valor_pedido],  # Armazenar o valor do pedido aqui
-                            "Pedidos de compra": [pedido],
-                            "Situação": [nova_situacao]
-                        })
+                        novo_registro = {
+                            "Funcionario": None,
+                            "Equipamento": None,
+                            "Dia": pd.Timestamp(dia),
+                            "Valor diaria": valor_pedido,  # Armazenar o valor do pedido aqui
+                            "Pedidos de compra": pedido,
+                        }
                     
-                    # Concatenar com o DataFrame existente
-                    servicos_df = pd.concat([servicos_df, novo_registro], ignore_index=True)
-                    # Ordenar por data
-                    servicos_df = servicos_df.sort_values('Dia')
-                    # Salvar no arquivo
-                    servicos_df.to_csv(SERVICOS_FILE, index=False)
+                    # Salvar o novo registro; a situação é calculada na data do
+                    # lançamento e os lançamentos posteriores têm o saldo ajustado
+                    repo.lancar_servico(novo_registro)
                     
                     st.success("✅ Registro adicionado com sucesso!")
                     st.session_state['adicionar_servico'] = False
@@ -1693,7 +1406,7 @@ with tab5:
     # Exibir a tabela de serviços com caixas de seleção
     if not servicos_df.empty:
         # Ordenar por data
-        servicos_df_ordenado = servicos_df.sort_values('Dia').reset_index().copy()
+        servicos_df_ordenado = livro_cofap.ordenado.reset_index()
         
         # Criar uma tabela editável
         selecionados = []
@@ -1755,6 +1468,8 @@ with tab5:
         if len(selecionados) > 0:
             if st.button(f"🗑️ Excluir {len(selecionados)} registro(s) selecionado(s)", key="btn_excluir_selecionados"):
                 st.session_state['confirmar_exclusao_multipla'] = True
+                # Versão da tabela vista pela sessão: a exclusão reescreve a tabela inteira
+                st.session_state['versao_servicos'] = repo.versao("servicos")
                 st.rerun()
         
         # Confirmação de exclusão múltipla
@@ -1766,36 +1481,23 @@ with tab5:
             col1, col2 = st.columns([1, 1])
             with col1:
                 if st.button("✅ Confirmar Exclusão", key="btn_confirm_delete_multi"):
-                    # Excluir os registros selecionados
-                    servicos_df = servicos_df.drop(indices).reset_index(drop=True)
-                    
-                    # Recalcular a situação para todos os registros
-                    if not servicos_df.empty:
-                        saldo = 0
-                        servicos_df = servicos_df.sort_values('Dia')
-                        
-                        for idx, row in servicos_df.iterrows():
-                            if pd.notna(row['Pedidos de compra']):
-                                # É um pedido de compra, então adiciona ao saldo
-                                saldo += row['Valor diaria']
-                            else:
-                                # É um serviço, então subtrai do saldo
-                                saldo -= row['Valor diaria']
-                            
-                            # Atualiza a situação
-                            servicos_df.at[idx, 'Situação'] = saldo
-                    
-                    # Salvar no arquivo
-                    servicos_df.to_csv(SERVICOS_FILE, index=False)
-                    
-                    st.success(f"✅ {len(indices)} registro(s) excluído(s) com sucesso!")
-                    st.session_state.pop('confirmar_exclusao_multipla', None)
-                    st.session_state['registros_selecionados'] = []
-                    st.rerun()
+                    # Excluir os registros selecionados; a situação é refeita
+                    # só a partir do primeiro lançamento excluído
+                    try:
+                        repo.excluir_servicos(indices, versao_esperada=st.session_state.get('versao_servicos'))
+                    except armazenamento.ConflitoDeEdicao as erro:
+                        st.error(f"⚠️ {erro}")
+                    else:
+                        st.success(f"✅ {len(indices)} registro(s) excluído(s) com sucesso!")
+                        st.session_state.pop('confirmar_exclusao_multipla', None)
+                        st.session_state.pop('versao_servicos', None)
+                        st.session_state['registros_selecionados'] = []
+                        st.rerun()
             
             with col2:
                 if st.button("❌ Cancelar Exclusão", key="btn_cancel_delete_multi"):
                     st.session_state.pop('confirmar_exclusao_multipla', None)
+                    st.session_state.pop('versao_servicos', None)
                     st.rerun()
     else:
         st.info("Não há serviços registrados. Adicione serviços ou pedidos de compra para começar.")
@@ -1805,6 +1507,7 @@ with tab5:
         
        
 # Adicionando instruções de instalação de dependências
+instrumentacao.etapa("renderizar", "Painel lateral")
 st.sidebar.title("Sobre o Sistema")
 st.sidebar.markdown("""
 
@@ -1812,3 +1515,53 @@ st.sidebar.markdown("""
 Nathan Vieira
 """)
 
+
+# Tempo de cada etapa da última inicialização do processo
+with st.sidebar.expander("⏱️ Inicialização"):
+    for etapa, segundos in inicializacao.relatorio():
+        st.write(f"**{etapa}:** {segundos * 1000:.1f} ms")
+
+# Painel de instrumentação: a execução atual e as últimas da sessão (para
+# comparar antes e depois de uma mudança)
+execucao = instrumentacao.finalizar()
+if execucao is not None:
+    execucoes.append(execucao.como_dict())
+    del execucoes[:-instrumentacao.MAX_EXECUCOES]
+
+    with st.sidebar.expander("🛠️ Última execução", expanded=True):
+        st.metric("Tempo total", f"{execucao.total * 1000:.0f} ms")
+        st.dataframe(
+            pd.DataFrame([
+                {"Fase": fase, "ms": round(total["duracao_ms"], 1), "Medições": total["medicoes"]}
+                for fase, total in execucao.por_fase().items()
+            ]),
+            hide_index=True,
+        )
+        if execucao.medicoes:
+            st.dataframe(
+                pd.DataFrame(execucao.medicoes).round({"inicio_ms": 1, "duracao_ms": 1}),
+                hide_index=True,
+            )
+        for nome, quantidade in execucao.contadores.items():
+            st.write(f"**{nome}:** {quantidade:,}".replace(",", "."))
+        
+        st.caption("Execuções da sessão (as interrompidas terminaram em uma gravação)")
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    "Início": item["inicio"][11:],
+                    "Total (ms)": round(item["total_ms"], 1),
+                    **{fase: round(total["duracao_ms"], 1) for fase, total in item["por_fase"].items()},
+                    "Interrompida": item["interrompida"],
+                }
+                for item in reversed(execucoes)
+            ]),
+            hide_index=True,
+        )
+        st.download_button(
+            f"⬇️ Exportar JSON ({len(execucoes)} execução(ões))",
+            data=instrumentacao.para_json(execucoes),
+            file_name="instrumentacao.json",
+            mime="application/json",
+            key="exportar_instrumentacao",
+        )
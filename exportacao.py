@@ -0,0 +1,89 @@
+"""
+Exportações em segundo plano.
+
+Os relatórios são gerados em um pool de threads compartilhado pelo processo,
+então o script do Streamlit não fica bloqueado enquanto um relatório grande
+é montado. Cada exportação é identificada por uma chave que inclui a versão
+dos dados exportados: pedir de novo a mesma exportação reaproveita a tarefa
+em andamento ou o arquivo já pronto, e qualquer alteração nos dados gera uma
+chave nova.
+"""
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Exportações gerando ao mesmo tempo
+MAX_TRABALHADORES = 2
+
+# Quantidade de tarefas (em andamento ou prontas) mantidas em memória
+MAX_TAREFAS = 16
+
+_pool = ThreadPoolExecutor(max_workers=MAX_TRABALHADORES, thread_name_prefix="exportacao")
+_tarefas = collections.OrderedDict()
+_tarefas_lock = threading.Lock()
+
+
+class Tarefa:
+    """Uma exportação enviada ao pool, com o andamento em linhas escritas."""
+
+    def __init__(self, chave, total):
+        self.chave = chave
+        self.total = total
+        self.feitas = 0
+        self.futuro = None
+
+    def avancar(self, feitas):
+        self.feitas = feitas
+
+    @property
+    def progresso(self):
+        """Fração concluída, de 0 a 1."""
+        if self.pronta:
+            return 1.0
+        return min(self.feitas / self.total, 1.0) if self.total else 0.0
+
+    @property
+    def pronta(self):
+        return self.futuro.done()
+
+    @property
+    def erro(self):
+        """Exceção que interrompeu a geração (None se ainda roda ou deu certo)."""
+        return self.futuro.exception() if self.pronta else None
+
+    @property
+    def dados(self):
+        """Conteúdo gerado (só depois de pronta)."""
+        return self.futuro.result()
+
+
+def exportar(chave, total, gerar):
+    """
+    Inicia uma exportação, ou reaproveita a de mesma chave.
+
+    Args:
+        chave: identificação da exportação, incluindo a versão dos dados
+        total: número de linhas a escrever (para o progresso)
+        gerar: função que recebe progresso=callable e devolve o conteúdo.
+            Roda em outra thread, então deve receber cópias dos dados.
+
+    Returns:
+        Tarefa
+    """
+    with _tarefas_lock:
+        tarefa = _tarefas.get(chave)
+        if tarefa is None or tarefa.erro is not None:
+            tarefa = Tarefa(chave, total)
+            tarefa.futuro = _pool.submit(gerar, progresso=tarefa.avancar)
+            _tarefas[chave] = tarefa
+
+        _tarefas.move_to_end(chave)
+        while len(_tarefas) > MAX_TAREFAS:
+            _tarefas.popitem(last=False)
+        return tarefa
+
+
+def tarefa(chave):
+    """Tarefa de uma exportação já iniciada (None se não existe ou foi descartada)."""
+    with _tarefas_lock:
+        return _tarefas.get(chave)
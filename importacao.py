@@ -0,0 +1,287 @@
+"""
+Importação de contas em lote a partir de planilhas e extratos bancários.
+
+Formatos aceitos: CSV (separador e codificação detectados), XLSX (requer
+openpyxl) e OFX. O arquivo é lido em blocos de TAMANHO_BLOCO linhas; cada
+bloco tem números e datas no formato brasileiro normalizados e é comparado
+com as contas já existentes (pendentes e pagas) pela chave (descrição,
+valor, vencimento). As contas novas de todos os blocos são gravadas de uma
+só vez no final.
+"""
+import csv
+import io
+import numbers
+import os
+import re
+import unicodedata
+
+import pandas as pd
+
+# Linhas processadas por bloco
+TAMANHO_BLOCO = 5000
+
+# Origem gravada nas contas importadas
+ORIGEM = "Importada"
+
+# Nomes aceitos para cada coluna (comparados sem acentos, maiúsculas,
+# pontuação ou o que estiver entre parênteses); no OFX, MEMO, TRNAMT e DTPOSTED
+SINONIMOS = {
+    "Descrição": ["descricao", "descricaodaconta", "historico", "fornecedor", "conta", "memo", "name"],
+    "Valor": ["valor", "valordaconta", "montante", "trnamt"],
+    "Data de Vencimento": ["datadevencimento", "vencimento", "datavencimento", "data", "dtposted"],
+}
+
+
+class ErroImportacao(Exception):
+    """O arquivo não pôde ser lido ou não tem as colunas necessárias."""
+
+
+def _chave_nome(nome):
+    # 'Valor (R$)' -> 'valor', 'Descrição' -> 'descricao'
+    sem_acentos = unicodedata.normalize("NFKD", str(nome)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]", "", re.sub(r"\(.*?\)", "", sem_acentos.lower()))
+
+
+def mapear_colunas(nomes):
+    """
+    Associa as colunas do arquivo às colunas de contas.
+
+    Returns:
+        Dicionário {coluna do arquivo: coluna de contas}
+
+    Raises:
+        ErroImportacao: se faltar descrição, valor ou vencimento
+    """
+    chaves = {_chave_nome(nome): nome for nome in nomes}
+    mapa = {}
+    for destino, sinonimos in SINONIMOS.items():
+        encontrado = next((chaves[s] for s in sinonimos if s in chaves), None)
+        if encontrado is None:
+            raise ErroImportacao(
+                f"Coluna '{destino}' não encontrada. Colunas do arquivo: {', '.join(map(str, nomes))}"
+            )
+        mapa[encontrado] = destino
+    return mapa
+
+
+def converter_valores(serie):
+    """
+    Valores em número, aceitando 'R$ 1.234,56', '1.500', '1234,56' e '1234.56'.
+    Células já numéricas (planilhas) são usadas como estão. Valores
+    negativos (débitos de extrato) viram positivos.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float).abs()
+
+    # Colunas mistas (as do XLSX são object): o formato brasileiro só vale
+    # para o texto, um número como 12.345 continua sendo 12.345
+    numeros = serie.map(lambda valor: isinstance(valor, numbers.Number) and not isinstance(valor, bool))
+    valores = pd.to_numeric(serie.where(numeros), errors="coerce")
+
+    texto = serie[~numeros].astype(str).str.strip().str.replace(r"[R$\s]", "", regex=True)
+    # Com vírgula, ou só com grupos de três dígitos ('1.500'), o ponto é
+    # separador de milhar; nos demais casos ('1234.56') é o decimal
+    milhar = texto.str.contains(",", regex=False) | texto.str.fullmatch(r"-?\d{1,3}(?:\.\d{3})+")
+    texto = texto.where(~milhar, texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    valores[~numeros] = pd.to_numeric(texto, errors="coerce")
+    return valores.astype(float).abs()
+
+
+def converter_datas(serie):
+    """Datas em dd/mm/aaaa (ou dd/mm/aa, dd-mm-aaaa), ISO (aaaa-mm-dd) ou OFX (aaaammdd...)."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.normalize()
+
+    texto = serie.astype(str).str.strip()
+    datas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+
+    iso = texto.str.match(r"^\d{4}-\d{2}-\d{2}")
+    ofx = texto.str.match(r"^\d{8}")
+    datas[iso] = pd.to_datetime(texto[iso].str[:10], format="%Y-%m-%d", errors="coerce")
+    datas[ofx] = pd.to_datetime(texto[ofx].str[:8], format="%Y%m%d", errors="coerce")
+
+    # Formato brasileiro: primeiro o caso comum, depois as variações
+    resto = ~iso & ~ofx
+    datas[resto] = pd.to_datetime(texto[resto], format="%d/%m/%Y", errors="coerce")
+    faltando = resto & datas.isna()
+    if faltando.any():
+        datas[faltando] = pd.to_datetime(texto[faltando], dayfirst=True, format="mixed", errors="coerce")
+    return datas.dt.normalize()
+
+
+def normalizar(bloco, mapa):
+    """
+    Converte um bloco lido do arquivo em linhas da tabela de contas.
+
+    Returns:
+        Tupla (contas válidas, quantidade de linhas inválidas)
+    """
+    bloco = bloco[list(mapa)].rename(columns=mapa)
+    contas = pd.DataFrame({
+        "Descrição": bloco["Descrição"].astype("string").str.strip(),
+        "Valor": converter_valores(bloco["Valor"]),
+        "Data de Vencimento": converter_datas(bloco["Data de Vencimento"]),
+        "Status": "Pendente",
+        "Data de Pagamento": pd.NaT,
+        "Origem": ORIGEM,
+    })
+    validas = (
+        contas["Descrição"].fillna("").ne("")
+        & contas["Valor"].gt(0)
+        & contas["Data de Vencimento"].notna()
+    )
+    return contas[validas.to_numpy(dtype=bool)].astype({"Descrição": object}), int((~validas).sum())
+
+
+def chaves(contas):
+    """Chave de comparação (descrição, valor, vencimento) de cada conta."""
+    return pd.MultiIndex.from_arrays([
+        contas["Descrição"].astype(str).str.strip().str.casefold(),
+        pd.to_numeric(contas["Valor"], errors="coerce").round(2),
+        pd.to_datetime(contas["Data de Vencimento"], errors="coerce").dt.normalize(),
+    ])
+
+
+def _texto(arquivo):
+    conteudo = arquivo.read()
+    if isinstance(conteudo, str):
+        return conteudo
+    try:
+        return conteudo.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # Extratos e planilhas exportados no Windows
+        return conteudo.decode("latin-1")
+
+
+def blocos_csv(arquivo):
+    """Lê um CSV em blocos (todas as colunas como texto)."""
+    texto = _texto(arquivo)
+    try:
+        separador = csv.Sniffer().sniff(texto[:4096], delimiters=";,\t|").delimiter
+    except csv.Error:
+        separador = ","
+    try:
+        yield from pd.read_csv(io.StringIO(texto), sep=separador, dtype=str, chunksize=TAMANHO_BLOCO)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError) as erro:
+        raise ErroImportacao(f"Não foi possível ler o CSV: {erro}")
+
+
+def blocos_xlsx(arquivo):
+    """Lê a primeira planilha de um XLSX em blocos, sem carregar a pasta inteira."""
+    try:
+        import openpyxl
+    except ImportError:
+        raise ErroImportacao("Instale o pacote openpyxl para importar planilhas .xlsx.")
+
+    pasta = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        linhas = pasta.worksheets[0].iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        cabecalho = [str(nome) if nome is not None else "" for nome in cabecalho]
+
+        bloco = []
+        for linha in linhas:
+            bloco.append(linha)
+            if len(bloco) == TAMANHO_BLOCO:
+                yield pd.DataFrame(bloco, columns=cabecalho, dtype=object)
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=cabecalho, dtype=object)
+    finally:
+        pasta.close()
+
+
+def blocos_ofx(arquivo):
+    """
+    Lê as transações (STMTTRN) de um extrato OFX em blocos. Só os débitos
+    viram contas; créditos são descartados.
+    """
+    texto = _texto(arquivo)
+    transacoes = re.finditer(r"<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|(?=</BANKTRANLIST>))", texto, re.S | re.I)
+
+    bloco = []
+    for transacao in transacoes:
+        # SGML (sem tags de fechamento) ou XML
+        campos = {
+            nome.upper(): valor.strip()
+            for nome, valor in re.findall(r"<(\w+)>([^<\r\n]*)", transacao.group(1))
+        }
+        if campos.get("TRNAMT", "").startswith("-"):
+            bloco.append({
+                "MEMO": campos.get("MEMO") or campos.get("NAME", ""),
+                "TRNAMT": campos["TRNAMT"],
+                "DTPOSTED": campos.get("DTPOSTED", ""),
+            })
+        if len(bloco) == TAMANHO_BLOCO:
+            yield _transacoes_ofx(bloco)
+            bloco = []
+    if bloco:
+        yield _transacoes_ofx(bloco)
+
+
+def _transacoes_ofx(bloco):
+    # No OFX o valor não tem separador de milhar: o ponto (ou a vírgula de
+    # alguns bancos) é sempre o decimal, então '-150.000' é 150
+    transacoes = pd.DataFrame(bloco)
+    transacoes["TRNAMT"] = pd.to_numeric(transacoes["TRNAMT"].str.replace(",", ".", regex=False), errors="coerce")
+    return transacoes
+
+
+LEITORES = {
+    ".csv": blocos_csv,
+    ".txt": blocos_csv,
+    ".xlsx": blocos_xlsx,
+    ".ofx": blocos_ofx,
+}
+
+
+def importar(repositorio, arquivo, nome):
+    """
+    Importa as contas de um arquivo como contas pendentes.
+
+    Args:
+        repositorio: repositório de dados
+        arquivo: arquivo aberto em modo binário (ou objeto do st.file_uploader)
+        nome: nome do arquivo (a extensão define o formato)
+
+    Returns:
+        Dicionário com 'lidas', 'invalidas', 'duplicadas' e 'importadas'
+
+    Raises:
+        ErroImportacao: formato não suportado ou colunas ausentes
+    """
+    extensao = os.path.splitext(nome)[1].lower()
+    if extensao not in LEITORES:
+        raise ErroImportacao(f"Formato não suportado: {extensao or nome}. Use CSV, XLSX ou OFX.")
+
+    # Os anos arquivados do histórico também contam como contas já existentes
+    existentes = pd.concat([
+        repositorio.carregar("contas"),
+        repositorio.carregar("historico"),
+        repositorio.arquivo.carregar("historico"),
+    ], ignore_index=True)
+    conhecidas = chaves(existentes)
+
+    resultado = {"lidas": 0, "invalidas": 0, "duplicadas": 0, "importadas": 0}
+    novas = []
+    mapa = None
+    for bloco in LEITORES[extensao](arquivo):
+        mapa = mapa or mapear_colunas(list(bloco.columns))
+        contas, invalidas = normalizar(bloco, mapa)
+        resultado["lidas"] += len(bloco)
+        resultado["invalidas"] += invalidas
+
+        # Repetidas: já existentes, de blocos anteriores ou do próprio bloco
+        chaves_bloco = chaves(contas)
+        repetidas = chaves_bloco.isin(conhecidas) | chaves_bloco.duplicated()
+        resultado["duplicadas"] += int(repetidas.sum())
+        novas.append(contas[~repetidas])
+        conhecidas = conhecidas.append(chaves_bloco[~repetidas])
+
+    novas = pd.concat(novas, ignore_index=True) if novas else pd.DataFrame()
+    if not novas.empty:
+        repositorio.inserir("contas", novas)
+    resultado["importadas"] = len(novas)
+    return resultado
@@ -0,0 +1,98 @@
+"""
+Inicialização do app.
+
+Abrir o repositório do livro, criar a tabela de serviços Cofap na primeira execução e
+gerar as contas recorrentes atrasadas não precisam rodar a cada execução do
+script: são feitos uma vez por processo e livro e refeitos só quando o dia vira ou
+quando os modelos recorrentes mudam. Cada etapa é cronometrada e o relatório
+da última inicialização fica disponível em relatorio().
+"""
+import contextlib
+import datetime
+import logging
+import threading
+import time
+
+import pandas as pd
+
+import instrumentacao
+import livros
+import recorrencia
+
+logger = logging.getLogger(__name__)
+
+# Lançamentos gravados quando a tabela de serviços Cofap ainda não existe
+# (você também pode incluí-los manualmente pelo app)
+SERVICOS_INICIAIS = [
+    {"Funcionario": "Richard", "Equipamento": "Empilhadeira", "Dia": "04/01/2024",
+     "Valor diaria": 4000.00, "Pedidos de compra": "", "Situação": 1500.00},
+    {"Funcionario": "Richard", "Equipamento": "Empilhadeira", "Dia": "05/01/2024",
+     "Valor diaria": 4000.00, "Pedidos de compra": "", "Situação": -2500.00},
+]
+
+# Situações já inicializadas: (livro, dia, versão dos recorrentes)
+_feitas = set()
+_relatorio = []
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _etapa(tempos, nome):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempos.append((nome, time.perf_counter() - inicio))
+
+
+def iniciar(hoje=None, diretorio="."):
+    """
+    Prepara o repositório de um livro para a execução do script.
+
+    Só trabalha de fato na primeira chamada do processo, no primeiro acesso
+    de cada dia e depois de uma alteração nos modelos recorrentes; nas
+    demais chamadas custa uma consulta de versão.
+
+    Args:
+        hoje: data de referência para a geração das recorrentes (padrão: hoje)
+        diretorio: pasta do livro (padrão: a do livro principal)
+
+    Returns:
+        Repositório de dados
+    """
+    tempos = []
+    with _etapa(tempos, "Abrir repositório"):
+        repo = livros.abrir(diretorio)
+    hoje = pd.Timestamp(hoje or datetime.date.today()).normalize()
+
+    with _lock:
+        chave = (livros.chave(diretorio), hoje, repo.versao("recorrentes"))
+        if chave in _feitas:
+            return repo
+
+        # Os lançamentos iniciais são do cliente Cofap do livro principal
+        with _etapa(tempos, "Serviços Cofap"):
+            if not repo.existe("servicos") and livros.chave(diretorio) == livros.chave("."):
+                servicos = pd.DataFrame(SERVICOS_INICIAIS)
+                servicos["Dia"] = pd.to_datetime(servicos["Dia"], errors="coerce")
+                repo.inserir("servicos", servicos)
+
+        # Todas as ocorrências atrasadas de uma vez, em uma única gravação
+        with _etapa(tempos, "Gerar contas recorrentes"), instrumentacao.medir("gerar", "Contas recorrentes"):
+            novas_contas, proximos = recorrencia.ocorrencias_pendentes(repo.carregar("recorrentes"), hoje)
+            if not proximos.empty:
+                repo.registrar_geracao(novas_contas, proximos)
+            instrumentacao.contar("contas recorrentes geradas", len(novas_contas))
+
+        _feitas.add(chave)
+        _feitas.add((livros.chave(diretorio), hoje, repo.versao("recorrentes")))
+        _relatorio[:] = tempos
+
+    logger.info("Inicialização: %s", ", ".join(f"{nome} {segundos * 1000:.1f} ms" for nome, segundos in tempos))
+    return repo
+
+
+def relatorio():
+    """Etapas da última inicialização: lista de (nome, segundos)."""
+    with _lock:
+        return list(_relatorio)
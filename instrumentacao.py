@@ -0,0 +1,162 @@
+"""
+Instrumentação opcional das execuções do script.
+
+Ligada (CONTAS_INSTRUMENTACAO=1 ou a chave no painel lateral), cada execução
+registra o tempo dos pontos medidos, agrupados nas fases carregar, gerar,
+agregar, renderizar e persistir, e contadores como linhas lidas, linhas
+gravadas e bytes escritos nos CSVs. O registro fica na thread da execução
+(o Streamlit roda cada execução na sua), então sessões simultâneas não se
+misturam e o trabalho feito em outras threads (exportações) não entra.
+Desligada, cada ponto de medição custa só a consulta a uma variável da thread.
+
+Os tempos das medições aninhadas (ex.: uma leitura feita durante a
+renderização de uma aba) são contados nas duas fases.
+"""
+import collections
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+
+FASES = ("carregar", "gerar", "agregar", "renderizar", "persistir")
+
+# Execuções mantidas por sessão para o painel e a exportação
+MAX_EXECUCOES = 20
+
+# Instrumentação ligada por padrão nas sessões novas
+ATIVA_POR_PADRAO = os.environ.get("CONTAS_INSTRUMENTACAO", "") not in ("", "0")
+
+_local = threading.local()
+
+
+class Execucao:
+    """Medições e contadores de uma execução do script."""
+
+    def __init__(self):
+        self.inicio = datetime.datetime.now()
+        self._relogio = time.perf_counter()
+        self.total = None
+        self.interrompida = False
+        self._fim = 0.0
+        self.medicoes = []
+        self.contadores = collections.Counter()
+        self._etapa = None
+
+    def _agora(self):
+        return time.perf_counter() - self._relogio
+
+    def encerrar(self, interrompida=False):
+        """
+        Fecha a etapa em aberto e fixa o tempo total. Uma execução
+        interrompida (por st.rerun(), por exemplo) é encerrada depois, na
+        execução seguinte: o fim dela é o da última medição registrada.
+        """
+        if self.total is None:
+            if not interrompida:
+                fim = self._agora()
+            elif self._etapa is not None:
+                fim = max(self._fim, self._etapa[2])
+            else:
+                fim = self._fim
+            _encerrar_etapa(self, fim)
+            self.total = fim
+            self.interrompida = interrompida
+
+    def registrar(self, fase, nome, inicio, duracao):
+        self._fim = max(self._fim, inicio + duracao)
+        self.medicoes.append({"fase": fase, "nome": nome, "inicio_ms": inicio * 1000, "duracao_ms": duracao * 1000})
+
+    def por_fase(self):
+        """Tempo total (ms) e número de medições de cada fase."""
+        totais = {fase: {"duracao_ms": 0.0, "medicoes": 0} for fase in FASES}
+        for medicao in self.medicoes:
+            total = totais.setdefault(medicao["fase"], {"duracao_ms": 0.0, "medicoes": 0})
+            total["duracao_ms"] += medicao["duracao_ms"]
+            total["medicoes"] += 1
+        return totais
+
+    def como_dict(self):
+        return {
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "total_ms": None if self.total is None else self.total * 1000,
+            "interrompida": self.interrompida,
+            "por_fase": self.por_fase(),
+            "medicoes": list(self.medicoes),
+            "contadores": dict(self.contadores),
+        }
+
+
+def iniciar(ativa):
+    """Começa o registro da execução atual (ou desliga a instrumentação nela)."""
+    _local.execucao = Execucao() if ativa else None
+    return _local.execucao
+
+
+def atual():
+    """Execução sendo registrada nesta thread (None se desligada)."""
+    return getattr(_local, "execucao", None)
+
+
+@contextlib.contextmanager
+def medir(fase, nome):
+    """Mede o tempo do bloco."""
+    execucao = atual()
+    if execucao is None:
+        yield
+        return
+    inicio = execucao._agora()
+    try:
+        yield
+    finally:
+        execucao.registrar(fase, nome, inicio, execucao._agora() - inicio)
+
+
+def registrar(fase, nome, segundos):
+    """Registra uma medição feita fora de um bloco medir() (terminando agora)."""
+    execucao = atual()
+    if execucao is not None:
+        agora = execucao._agora()
+        execucao.registrar(fase, nome, agora - segundos, segundos)
+
+
+def contar(nome, quantidade=1):
+    """Soma ao contador da execução."""
+    execucao = atual()
+    if execucao is not None:
+        execucao.contadores[nome] += quantidade
+
+
+def etapa(fase, nome):
+    """
+    Encerra a etapa sequencial anterior (se houver) e começa outra. Serve
+    para medir trechos longos do script, como cada aba, sem reindentá-los.
+    """
+    execucao = atual()
+    if execucao is None:
+        return
+    _encerrar_etapa(execucao)
+    execucao._etapa = (fase, nome, execucao._agora())
+
+
+def _encerrar_etapa(execucao, fim=None):
+    if execucao._etapa is not None:
+        fase, nome, inicio = execucao._etapa
+        fim = execucao._agora() if fim is None else fim
+        execucao.registrar(fase, nome, inicio, fim - inicio)
+        execucao._etapa = None
+
+
+def finalizar():
+    """Encerra o registro da execução atual e a devolve (None se desligada)."""
+    execucao = atual()
+    if execucao is not None:
+        execucao.encerrar()
+        _local.execucao = None
+    return execucao
+
+
+def para_json(execucoes):
+    """Execuções (dicionários de Execucao.como_dict) em JSON, para exportar."""
+    return json.dumps({"execucoes": execucoes}, ensure_ascii=False, indent=2)
@@ -0,0 +1,112 @@
+"""
+Livros (um por empresa) atendidos pelo app.
+
+Cada livro tem a sua pasta com os seus próprios dados (banco SQLite ou CSVs,
+e os anos arquivados do histórico): o livro principal usa a pasta do app,
+como antes, e os demais ficam em livros/<nome>. As tabelas, o índice de
+busca e o cubo de pagamentos ficam em memória separados por livro, então
+trocar de livro não relê os outros.
+
+Só os MAX_LIVROS_ABERTOS livros usados mais recentemente ficam em memória:
+ao abrir mais um, o livro ocioso há mais tempo é esquecido e, se voltar a
+ser usado, é relido do disco.
+"""
+import collections
+import json
+import os
+import re
+import threading
+
+import analise
+import armazenamento
+import busca
+
+# Pasta dos livros além do principal e o arquivo com o nome de cada um
+LIVROS_DIR = "livros"
+CONFIG_FILE = "livro.json"
+
+# Nome do livro guardado na pasta do app
+PRINCIPAL = "Principal"
+
+# Livros mantidos em memória ao mesmo tempo
+MAX_LIVROS_ABERTOS = int(os.environ.get("CONTAS_MAX_LIVROS", "4"))
+
+_abertos = collections.OrderedDict()
+_abertos_lock = threading.Lock()
+
+
+class LivroInvalido(Exception):
+    """Nome de livro vazio ou já usado."""
+
+
+def listar(base="."):
+    """
+    Livros disponíveis.
+
+    Returns:
+        Dicionário {nome: pasta}, com o livro principal primeiro
+    """
+    livros = {PRINCIPAL: base}
+    pasta = os.path.join(base, LIVROS_DIR)
+    if os.path.isdir(pasta):
+        for entrada in sorted(os.listdir(pasta)):
+            config = os.path.join(pasta, entrada, CONFIG_FILE)
+            if os.path.isfile(config):
+                with open(config, encoding="utf-8") as arquivo:
+                    livros[json.load(arquivo).get("nome", entrada)] = os.path.join(pasta, entrada)
+    return livros
+
+
+def _nome_da_pasta(nome):
+    return re.sub(r"[^a-z0-9]+", "-", busca.normalizar(nome)).strip("-")
+
+
+def criar(nome, base="."):
+    """
+    Cria um livro vazio.
+
+    Returns:
+        Pasta do novo livro
+
+    Raises:
+        LivroInvalido: nome vazio ou já usado por outro livro
+    """
+    nome = nome.strip()
+    pasta = _nome_da_pasta(nome)
+    if not pasta:
+        raise LivroInvalido("Informe um nome com letras ou números.")
+    diretorio = os.path.join(base, LIVROS_DIR, pasta)
+    if nome in listar(base) or os.path.exists(diretorio):
+        raise LivroInvalido(f"Já existe um livro chamado '{nome}'.")
+
+    # O livro só aparece na lista quando o arquivo de configuração está completo
+    os.makedirs(diretorio)
+    temporario = os.path.join(diretorio, CONFIG_FILE + ".tmp")
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump({"nome": nome}, arquivo, ensure_ascii=False)
+    os.replace(temporario, os.path.join(diretorio, CONFIG_FILE))
+    return diretorio
+
+
+def chave(diretorio):
+    """Identificação do livro nos caches em memória (a mesma para a mesma pasta)."""
+    return os.path.abspath(diretorio)
+
+
+def abrir(diretorio=".", backend=None):
+    """Repositório do livro; esquece os livros ociosos além de MAX_LIVROS_ABERTOS."""
+    with _abertos_lock:
+        _abertos[chave(diretorio)] = True
+        _abertos.move_to_end(chave(diretorio))
+        while len(_abertos) > MAX_LIVROS_ABERTOS:
+            ocioso, _ = _abertos.popitem(last=False)
+            fechar(ocioso)
+        return armazenamento.abrir_repositorio(backend, diretorio)
+
+
+def fechar(diretorio):
+    """Descarta da memória o repositório, as tabelas, o índice de busca e os cubos do livro."""
+    armazenamento.fechar_repositorio(diretorio)
+    busca.descartar(chave(diretorio))
+    analise.descartar(chave(diretorio))
+
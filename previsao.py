@@ -0,0 +1,143 @@
+"""
+Previsão de caixa: saídas projetadas por dia, semana ou mês.
+
+Cada modelo recorrente ativo é expandido em todas as ocorrências até o fim do
+horizonte de uma só vez (a mesma aritmética vetorizada de meses da geração
+das recorrentes, com o dia limitado ao fim do mês). As ocorrências que já
+viraram conta pendente são descartadas, e o restante é somado às contas
+pendentes em uma série por período. Contas e ocorrências atrasadas entram no
+primeiro período, como saídas imediatas.
+
+A série de cada combinação de horizonte e agrupamento fica em memória por
+versão dos dados.
+"""
+import collections
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+import instrumentacao
+from armazenamento import sem_duplicatas
+from recorrencia import ocorrencias_pendentes
+
+# Horizonte padrão, em meses
+HORIZONTE_MESES = 24
+
+# Agrupamentos disponíveis (as semanas começam no domingo)
+AGRUPAMENTOS = ["Diário", "Semanal", "Mensal"]
+
+# Séries já calculadas mantidas em memória
+MAX_PREVISOES = 16
+
+_previsoes = collections.OrderedDict()
+_previsoes_lock = threading.Lock()
+
+
+def periodo(hoje=None, meses=HORIZONTE_MESES):
+    """De hoje até a véspera do mesmo dia daqui a 'meses' meses."""
+    inicio = pd.Timestamp(hoje or datetime.date.today()).normalize()
+    return inicio, inicio + pd.DateOffset(months=meses) - pd.Timedelta(days=1)
+
+
+def saidas_previstas(indice, recorrentes, inicio, fim):
+    """
+    Uma linha por saída prevista até fim.
+
+    Args:
+        indice: consultas.IndiceVencimentos das contas
+        recorrentes: DataFrame de contas recorrentes
+        inicio: primeiro dia da previsão (as saídas atrasadas caem nele)
+        fim: último dia da previsão
+
+    Returns:
+        DataFrame com 'Data', 'Valor' e 'Origem' ('Conta' ou 'Recorrente')
+    """
+    inicio, fim = pd.Timestamp(inicio).normalize(), pd.Timestamp(fim).normalize()
+    pendentes = indice.ate(fim)
+    projetadas, _ = ocorrencias_pendentes(recorrentes, fim)
+    if not projetadas.empty:
+        projetadas = sem_duplicatas(projetadas, indice.contas)
+
+    partes = [pd.DataFrame({
+        "Data": pd.DatetimeIndex(pendentes["Data de Vencimento"]).normalize(),
+        "Valor": pd.to_numeric(pendentes["Valor"], errors="coerce").fillna(0).to_numpy(dtype=float),
+        "Origem": "Conta",
+    })]
+    if not projetadas.empty:
+        partes.append(pd.DataFrame({
+            "Data": pd.DatetimeIndex(projetadas["Data de Vencimento"]).normalize(),
+            "Valor": pd.to_numeric(projetadas["Valor"], errors="coerce").fillna(0).to_numpy(dtype=float),
+            "Origem": "Recorrente",
+        }))
+
+    saidas = pd.concat(partes, ignore_index=True)
+    saidas["Data"] = saidas["Data"].clip(lower=inicio)
+    return saidas
+
+
+def inicio_do_periodo(datas, agrupamento):
+    """Primeiro dia do dia, da semana (domingo) ou do mês de cada data."""
+    datas = pd.DatetimeIndex(datas).normalize()
+    if agrupamento == "Semanal":
+        return datas - pd.to_timedelta((datas.dayofweek + 1) % 7, unit="D")
+    if agrupamento == "Mensal":
+        return pd.DatetimeIndex(datas.to_numpy().astype("datetime64[M]").astype("datetime64[ns]"))
+    return datas
+
+
+def projetar(indice, recorrentes, hoje=None, meses=HORIZONTE_MESES, agrupamento="Mensal"):
+    """
+    Saídas projetadas por período.
+
+    Returns:
+        DataFrame indexado pelo início de cada período do horizonte (inclusive
+        os sem saídas), com 'Contas', 'Recorrentes', 'Total', 'Quantidade' e
+        'Acumulado'
+    """
+    inicio, fim = periodo(hoje, meses)
+    saidas = saidas_previstas(indice, recorrentes, inicio, fim)
+
+    saidas["Período"] = inicio_do_periodo(saidas["Data"], agrupamento)
+    valores = saidas.pivot_table(index="Período", columns="Origem", values="Valor", aggfunc="sum", fill_value=0.0)
+    periodos = pd.DatetimeIndex(np.unique(inicio_do_periodo(pd.date_range(inicio, fim, freq="D"), agrupamento)))
+
+    projecao = pd.DataFrame({
+        "Contas": valores.get("Conta", pd.Series(dtype=float)).reindex(periodos, fill_value=0.0),
+        "Recorrentes": valores.get("Recorrente", pd.Series(dtype=float)).reindex(periodos, fill_value=0.0),
+    }, index=periodos)
+    projecao["Total"] = projecao["Contas"] + projecao["Recorrentes"]
+    projecao["Quantidade"] = saidas.groupby("Período").size().reindex(periodos, fill_value=0)
+    projecao["Acumulado"] = projecao["Total"].cumsum()
+    projecao.index.name = "Período"
+    return projecao
+
+
+def previsao(indice, recorrentes, versao, hoje=None, meses=HORIZONTE_MESES, agrupamento="Mensal"):
+    """
+    Série projetada, reaproveitada enquanto os dados não mudam.
+
+    Args:
+        indice: consultas.IndiceVencimentos das contas
+        recorrentes: DataFrame de contas recorrentes
+        versao: versão dos dados de contas e recorrentes (faz parte da chave)
+        hoje: início da previsão (padrão: hoje)
+        meses: horizonte em meses
+        agrupamento: 'Diário', 'Semanal' ou 'Mensal'
+    """
+    hoje = pd.Timestamp(hoje or datetime.date.today()).normalize()
+    chave = (versao, hoje, meses, agrupamento)
+    with _previsoes_lock:
+        if chave in _previsoes:
+            _previsoes.move_to_end(chave)
+            return _previsoes[chave]
+
+    with instrumentacao.medir("agregar", "Previsão de caixa"):
+        projecao = projetar(indice, recorrentes, hoje, meses, agrupamento)
+
+    with _previsoes_lock:
+        _previsoes[chave] = projecao
+        while len(_previsoes) > MAX_PREVISOES:
+            _previsoes.popitem(last=False)
+    return projecao
@@ -0,0 +1,136 @@
+"""
+Geração das contas a partir dos modelos de contas recorrentes.
+
+Todas as ocorrências atrasadas de todos os modelos ativos são calculadas de
+uma vez, com aritmética de datas vetorizada, e gravadas em uma única escrita
+pelo repositório (que descarta as que já existem).
+"""
+import calendar
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# Quantidade de meses entre duas ocorrências de cada frequência
+MESES_POR_FREQUENCIA = {
+    "Mensal": 1,
+    "Trimestral": 3,
+    "Semestral": 6,
+    "Anual": 12,
+}
+
+
+# Função auxiliar para calcular próxima data
+def calcular_proxima_data(data_atual, frequencia, dia_vencimento):
+    data_atual = pd.to_datetime(data_atual)
+
+    if frequencia == "Mensal":
+        proximo_mes = data_atual.month + 1
+        proximo_ano = data_atual.year
+
+        if proximo_mes > 12:
+            proximo_mes = 1
+            proximo_ano += 1
+    elif frequencia == "Trimestral":
+        proximo_mes = data_atual.month + 3
+        proximo_ano = data_atual.year
+
+        while proximo_mes > 12:
+            proximo_mes -= 12
+            proximo_ano += 1
+    elif frequencia == "Semestral":
+        proximo_mes = data_atual.month + 6
+        proximo_ano = data_atual.year
+
+        while proximo_mes > 12:
+            proximo_mes -= 12
+            proximo_ano += 1
+    else:  # Anual
+        proximo_mes = data_atual.month
+        proximo_ano = data_atual.year + 1
+
+    # Garantir que o dia seja válido
+    ultimo_dia = calendar.monthrange(proximo_ano, proximo_mes)[1]
+    dia_efetivo = min(dia_vencimento, ultimo_dia)
+
+    return datetime.date(proximo_ano, proximo_mes, dia_efetivo)
+
+
+def datas_por_mes(meses, dias):
+    """
+    Monta datas a partir de um índice absoluto de mês (ano * 12 + mês - 1) e do
+    dia desejado, limitando o dia ao último dia do mês (31 vira 28/29/30).
+    """
+    meses = np.asarray(meses, dtype="int64")
+    inicio = (meses - (1970 * 12)).astype("datetime64[M]")
+    ultimo_dia = ((inicio + 1).astype("datetime64[D]") - inicio.astype("datetime64[D]")).astype("int64")
+    dias = np.minimum(np.asarray(dias, dtype="int64"), ultimo_dia)
+    return pd.DatetimeIndex(inicio.astype("datetime64[D]") + (dias - 1))
+
+
+def descricao_gerada(descricoes, frequencias):
+    """Descrição das contas geradas: 'Aluguel (mensal)'."""
+    return descricoes.astype(str) + " (" + frequencias.astype(str).str.lower() + ")"
+
+
+def ocorrencias_pendentes(recorrentes, hoje):
+    """
+    Calcula todas as ocorrências já vencidas (até hoje) dos modelos ativos.
+
+    Um modelo atrasado vários períodos gera todas as contas que faltam de uma
+    vez, e não apenas uma por execução.
+
+    Args:
+        recorrentes: DataFrame de contas recorrentes (índice = id do modelo)
+        hoje: data de referência
+
+    Returns:
+        Tupla (novas_contas, proximos). novas_contas segue o esquema da tabela
+        de contas, com o id do modelo na coluna 'Recorrente'. proximos é
+        indexado pelo id do modelo, com 'Próximo Vencimento' e 'Última Geração'.
+    """
+    hoje = pd.Timestamp(hoje).normalize()
+    vencimentos = pd.to_datetime(recorrentes["Próximo Vencimento"], errors="coerce")
+    modelos = recorrentes[recorrentes["Ativa"] & vencimentos.notna() & (vencimentos <= hoje)]
+    vencimentos = vencimentos[modelos.index].dt.normalize()
+
+    if modelos.empty:
+        return pd.DataFrame(), pd.DataFrame(columns=["Próximo Vencimento", "Última Geração"])
+
+    passo = modelos["Frequência"].map(MESES_POR_FREQUENCIA).fillna(12).astype("int64")
+    dia = pd.to_numeric(modelos["Dia Vencimento"], errors="coerce").fillna(vencimentos.dt.day).astype("int64")
+    mes_inicial = vencimentos.dt.year * 12 + vencimentos.dt.month - 1
+    mes_hoje = hoje.year * 12 + hoje.month - 1
+
+    # Candidatas: uma linha por (modelo, k) até o mês atual
+    quantidade = (mes_hoje - mes_inicial) // passo + 1
+    posicoes = np.repeat(np.arange(len(modelos)), quantidade.to_numpy())
+    k = pd.Series(posicoes).groupby(posicoes).cumcount().to_numpy()
+    datas = datas_por_mes(
+        mes_inicial.to_numpy()[posicoes] + k * passo.to_numpy()[posicoes],
+        dia.to_numpy()[posicoes],
+    )
+    # A primeira ocorrência é o próprio 'Próximo Vencimento' (pode ter sido ajustado à mão)
+    datas = datas.where(k != 0, vencimentos.to_numpy()[posicoes])
+
+    validas = np.asarray(datas <= hoje)
+    posicoes, k, datas = posicoes[validas], k[validas], datas[validas]
+
+    novas_contas = pd.DataFrame({
+        "Descrição": descricao_gerada(modelos["Descrição"], modelos["Frequência"]).to_numpy()[posicoes],
+        "Valor": modelos["Valor"].to_numpy()[posicoes],
+        "Data de Vencimento": datas,
+        "Status": "Pendente",
+        "Data de Pagamento": pd.NaT,
+        "Origem": "Recorrente",
+        "Recorrente": modelos.index.to_numpy()[posicoes],
+    })
+
+    # Próximo vencimento de cada modelo: a ocorrência seguinte à última gerada
+    geradas = np.bincount(posicoes, minlength=len(modelos))
+    proximos = pd.DataFrame({
+        "Próximo Vencimento": datas_por_mes(mes_inicial.to_numpy() + geradas * passo.to_numpy(), dia.to_numpy()),
+        "Última Geração": novas_contas.groupby("Recorrente")["Data de Vencimento"].max().reindex(modelos.index).to_numpy(),
+    }, index=modelos.index)
+
+    return novas_contas, proximos
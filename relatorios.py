@@ -0,0 +1,158 @@
+"""
+Relatórios em PDF.
+
+Todas as exportações usam o mesmo motor: as linhas chegam de um gerador e
+são escritas uma a uma em uma tabela paginada (o cabeçalho se repete no
+topo de cada página). O documento é gerado em memória e devolvido como
+bytes, sem arquivos temporários no diretório de trabalho.
+"""
+import datetime
+
+import pandas as pd
+
+# Largura útil da página A4 com as margens padrão
+LARGURA_UTIL = 190
+ALTURA_LINHA = 10
+
+
+def formatar_data(valor):
+    """Data no formato dd/mm/aaaa ('' quando vazia)."""
+    if valor is None or pd.isna(valor):
+        return ""
+    return pd.Timestamp(valor).strftime('%d/%m/%Y')
+
+
+def formatar_moeda(valor):
+    """Valor no formato 'R$ 1,234.56' ('' quando vazio)."""
+    if valor is None or pd.isna(valor):
+        return ""
+    return f"R$ {valor:,.2f}"
+
+
+def formatar_texto(valor):
+    """Texto da célula ('' quando vazio)."""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return ""
+    return str(valor)
+
+
+def _latin1(texto):
+    # As fontes padrão do FPDF só cobrem latin-1; outros caracteres viram '?'
+    return texto.encode("latin-1", "replace").decode("latin-1")
+
+
+def gerar_pdf(titulo, cabecalhos, linhas, larguras=None, fonte_cabecalho=12, fonte_linhas=10, progresso=None):
+    """
+    Gera um relatório em PDF com título, data de geração e uma tabela.
+
+    Args:
+        titulo: título do relatório
+        cabecalhos: nomes das colunas da tabela
+        linhas: iterável (de preferência um gerador) de tuplas de textos
+        larguras: largura de cada coluna (padrão: divide a largura útil)
+        fonte_cabecalho: tamanho da fonte do cabeçalho da tabela
+        fonte_linhas: tamanho da fonte das linhas
+        progresso: função chamada com o número de linhas já escritas
+
+    Returns:
+        Conteúdo do PDF em bytes
+    """
+    from fpdf import FPDF  # só quando um relatório é gerado
+
+    larguras = larguras or [LARGURA_UTIL / len(cabecalhos)] * len(cabecalhos)
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+
+    # Adicionar título
+    pdf.cell(200, 10, txt=_latin1(titulo), ln=True, align='C')
+    pdf.ln(10)
+
+    # Adicionar data de geração
+    pdf.cell(200, 10, txt=f"Gerado em: {datetime.date.today().strftime('%d/%m/%Y')}", ln=True)
+    pdf.ln(10)
+
+    def cabecalho():
+        pdf.set_font("Arial", 'B', fonte_cabecalho)
+        for largura, texto in zip(larguras, cabecalhos):
+            pdf.cell(largura, ALTURA_LINHA, _latin1(texto), border=1)
+        pdf.ln()
+        pdf.set_font("Arial", size=fonte_linhas)
+
+    cabecalho()
+    for escritas, linha in enumerate(linhas, start=1):
+        # Nova página com o cabeçalho repetido antes de a linha não caber mais
+        if pdf.get_y() + ALTURA_LINHA > pdf.page_break_trigger:
+            pdf.add_page()
+            cabecalho()
+        for largura, texto in zip(larguras, linha):
+            pdf.cell(largura, ALTURA_LINHA, _latin1(texto), border=1)
+        pdf.ln()
+        if progresso is not None:
+            progresso(escritas)
+
+    # FPDF 1.7 devolve str (latin-1); fpdf2 devolve bytearray
+    conteudo = pdf.output(dest='S')
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode("latin-1")
+    return bytes(conteudo)
+
+
+def linhas_contas(contas, status=None, formatar_valor=formatar_moeda):
+    """Gera (descrição, valor, vencimento, status) de cada conta; status fixo se informado."""
+    situacoes = contas["Status"] if status is None else [status] * len(contas)
+    for descricao, valor, vencimento, situacao in zip(
+        contas["Descrição"], contas["Valor"], contas["Data de Vencimento"], situacoes
+    ):
+        yield formatar_texto(descricao), formatar_valor(valor), formatar_data(vencimento), formatar_texto(situacao)
+
+
+def linhas_historico(historico):
+    """Gera (descrição, valor, vencimento, pagamento, 'Paga') de cada conta paga."""
+    for descricao, valor, vencimento, pagamento in zip(
+        historico["Descrição"], historico["Valor"], historico["Data de Vencimento"], historico["Data de Pagamento"]
+    ):
+        yield formatar_texto(descricao), formatar_moeda(valor), formatar_data(vencimento), formatar_data(pagamento), "Paga"
+
+
+def linhas_servicos(servicos):
+    """Gera as colunas do relatório Cofap de cada lançamento, na ordem recebida."""
+    for funcionario, equipamento, dia, valor, pedido, situacao in zip(
+        servicos["Funcionario"], servicos["Equipamento"], servicos["Dia"],
+        servicos["Valor diaria"], servicos["Pedidos de compra"], servicos["Situação"],
+    ):
+        yield (
+            formatar_texto(funcionario), formatar_texto(equipamento), formatar_data(dia),
+            formatar_moeda(valor), formatar_texto(pedido), formatar_moeda(situacao),
+        )
+
+
+def pdf_contas(titulo, contas, status=None, progresso=None):
+    """Relatório de contas pendentes (a vencer ou vencidas)."""
+    return gerar_pdf(
+        titulo, ["Descrição", "Valor (R$)", "Vencimento", "Status"], linhas_contas(contas, status), progresso=progresso
+    )
+
+
+def pdf_historico(historico, progresso=None):
+    """Relatório de contas pagas."""
+    return gerar_pdf(
+        "Relatório de Contas Pagas",
+        ["Descrição", "Valor (R$)", "Vencimento", "Pagamento", "Status"],
+        linhas_historico(historico),
+        fonte_linhas=9,
+        progresso=progresso,
+    )
+
+
+def pdf_servicos(servicos, progresso=None):
+    """Relatório de serviços Cofap/Marelli, com a situação acumulada."""
+    return gerar_pdf(
+        "Relatório de Serviços Cofap/Marelli",
+        ["Funcionário", "Equipamento", "Data", "Valor diária", "Pedido", "Situação"],
+        linhas_servicos(servicos),
+        fonte_cabecalho=10,
+        fonte_linhas=8,
+        progresso=progresso,
+    )
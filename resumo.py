@@ -0,0 +1,68 @@
+"""
+Totais do "Resumo Financeiro" do dashboard.
+
+Os totais das contas pendentes saem das somas acumuladas do índice de
+vencimentos (buscas binárias). Os modelos recorrentes ativos são cruzados
+com as contas pendentes em uma única junção por chave, sem laços por modelo.
+"""
+import pandas as pd
+
+from armazenamento import sem_duplicatas
+from recorrencia import descricao_gerada
+
+
+def periodos(hoje):
+    """Retorna (fim do mês, fim da semana) usados pelo resumo."""
+    hoje = pd.Timestamp(hoje).normalize()
+    inicio_mes = hoje.replace(day=1)
+    fim_mes = inicio_mes + pd.DateOffset(months=1) - pd.DateOffset(days=1)
+    fim_semana = hoje + pd.DateOffset(days=7)
+    return fim_mes, fim_semana
+
+
+def recorrentes_nao_geradas(contas, recorrentes):
+    """
+    Próxima ocorrência de cada modelo ativo que ainda não virou conta pendente.
+
+    Returns:
+        DataFrame com 'Descrição', 'Valor', 'Data de Vencimento' e 'Recorrente'
+    """
+    modelos = recorrentes[recorrentes["Ativa"] & recorrentes["Próximo Vencimento"].notna()]
+    ocorrencias = pd.DataFrame({
+        "Descrição": descricao_gerada(modelos["Descrição"], modelos["Frequência"]),
+        "Valor": modelos["Valor"],
+        "Data de Vencimento": pd.to_datetime(modelos["Próximo Vencimento"]),
+        "Recorrente": modelos.index,
+    })
+    pendentes = contas[contas["Status"] == "Pendente"]
+    return sem_duplicatas(ocorrencias, pendentes)
+
+
+def resumo_financeiro(indice, recorrentes, hoje):
+    """
+    Calcula os totais do dashboard.
+
+    - total: contas pendentes mais recorrentes já vencidas e ainda não geradas
+    - mes / semana: contas pendentes e recorrentes não geradas que vencem até
+      o fim do mês / nos próximos 7 dias (inclui as atrasadas)
+
+    Args:
+        indice: consultas.IndiceVencimentos das contas
+        recorrentes: DataFrame de contas recorrentes
+        hoje: data de referência
+
+    Returns:
+        Dicionário com as chaves 'total', 'mes' e 'semana'
+    """
+    hoje = pd.Timestamp(hoje).normalize()
+    fim_mes, fim_semana = periodos(hoje)
+
+    nao_geradas = recorrentes_nao_geradas(indice.com_status("Pendente"), recorrentes)
+    valor = nao_geradas["Valor"].fillna(0).to_numpy()
+    vencimento = nao_geradas["Data de Vencimento"]
+
+    return {
+        "total": indice.soma() + float(valor[(vencimento <= hoje).to_numpy()].sum()),
+        "mes": indice.soma(fim=fim_mes) + float(valor[(vencimento <= fim_mes).to_numpy()].sum()),
+        "semana": indice.soma(fim=fim_semana) + float(valor[(vencimento <= fim_semana).to_numpy()].sum()),
+    }
@@ -0,0 +1,46 @@
+import io
+
+import pandas as pd
+import pytest
+
+import importacao
+
+
+def test_texto_brasileiro_com_separador_de_milhar():
+    valores = importacao.converter_valores(pd.Series(["1.500", "R$ 1.234,56", "1234.56", "12.5"]))
+    assert valores.tolist() == [1500.0, 1234.56, 1234.56, 12.5]
+
+
+def test_celula_numerica_do_xlsx_com_tres_decimais():
+    # blocos_xlsx monta os blocos com dtype=object: números e textos misturados
+    serie = pd.Series([12.345, 1500.0, "1.500", 7], dtype=object)
+    assert importacao.converter_valores(serie).tolist() == [12.345, 1500.0, 1500.0, 7.0]
+
+
+def test_planilha_xlsx_com_valor_de_tres_decimais():
+    openpyxl = pytest.importorskip("openpyxl")
+    pasta = openpyxl.Workbook()
+    planilha = pasta.active
+    planilha.append(["Descrição", "Valor", "Vencimento"])
+    planilha.append(["Água", 12.345, "10/01/2026"])
+    arquivo = io.BytesIO()
+    pasta.save(arquivo)
+    arquivo.seek(0)
+
+    bloco = next(importacao.blocos_xlsx(arquivo))
+    contas, invalidas = importacao.normalizar(bloco, importacao.mapear_colunas(list(bloco.columns)))
+    assert invalidas == 0
+    assert contas["Valor"].tolist() == [12.345]
+
+
+def test_valor_ofx_com_tres_decimais():
+    extrato = (
+        "<OFX><BANKTRANLIST>"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20260110<TRNAMT>-150.000<MEMO>Energia</STMTTRN>"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20260111<TRNAMT>-12,50<MEMO>Tarifa</STMTTRN>"
+        "</BANKTRANLIST></OFX>"
+    )
+    bloco = next(importacao.blocos_ofx(io.StringIO(extrato)))
+    contas, invalidas = importacao.normalizar(bloco, importacao.mapear_colunas(list(bloco.columns)))
+    assert invalidas == 0
+    assert contas["Valor"].tolist() == [150.0, 12.5]